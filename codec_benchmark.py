@@ -0,0 +1,52 @@
+"""
+This file is not official part of the Digital Editor project, but a side script for measurements.
+
+Compares the text ( base64 ) and the binary Files Protocol codecs.
+For each common message it prints the encoded size and the time to encode and decode it.
+"""
+
+from protocols.files_manager import *
+
+import timeit
+import json
+
+REPEAT: int = 20000
+
+def messages( ) -> list:
+
+    delta = json.dumps( [ [ index, [ f"    value_{ index } = compute( { index } )" ] ] for index in range( 40 ) ] )
+
+    return [
+        ( "PrepareUpdate",  FILES_COMMAND_PREPARE_UPDATE,   [ "project\\main.py", "120", "username" ] ),
+        ( "UpdateLine",     FILES_COMMAND_UPDATE_LINE,      [ "project\\main.py", "120", "3" ] ),
+        ( "SetFile",        FILES_COMMAND_SET_FILE,         [ "project\\main.py", "48213", "0" * 32, "1a2b3c4d:512" ] ),
+        ( "FileDelta",      FILES_COMMAND_FILE_DELTA,       [ "project\\main.py", "0" * 32, "1a2b3c4d:552", delta ] ),
+    ]
+
+
+def main( ):
+
+    protocol = c_files_manager_protocol( )
+
+    print( f"{ 'message':<16}{ 'codec':<8}{ 'size':>8}{ 'encode us':>12}{ 'decode us':>12}" )
+
+    for name, command, arguments in messages( ):
+        for codec_name, codec in ( ( "text", FILES_CODEC_TEXT ), ( "binary", FILES_CODEC_BINARY ) ):
+
+            # New message object each time, otherwise the cached encoding is measured
+            encode = lambda: c_files_message( command, arguments ).encode( codec )
+            data: bytes = encode( )
+
+            received = codec == FILES_CODEC_TEXT and data.decode( ) or data
+            decode = lambda: protocol.parse_message( received )
+
+            assert decode( ) == ( command, arguments )
+
+            encode_time: float = timeit.timeit( encode, number=REPEAT ) / REPEAT * 1e6
+            decode_time: float = timeit.timeit( decode, number=REPEAT ) / REPEAT * 1e6
+
+            print( f"{ name:<16}{ codec_name:<8}{ len( data ):>8}{ encode_time:>12.2f}{ decode_time:>12.2f}" )
+
+
+if __name__ == "__main__":
+    main( )
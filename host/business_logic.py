@@ -14,19 +14,62 @@ from protocols.security         import *
 from utilities.event            import c_event
 from utilities.wrappers         import safe_call, standalone_execute, static_arguments
 from utilities.math             import math
+from utilities.watcher          import c_path_watcher
+from utilities.metrics          import c_metrics, c_metrics_server
 
+from concurrent.futures         import ThreadPoolExecutor, as_completed
+
+from collections                import deque
+
+import threading
+import hashlib
 import base64
 import queue
+import json
 import time
 import os
 
 DEFAULT_FOLDER_NAME:    str     = ".digital_files"
 DEFAULT_TRUST_FACTOR:   int     = 50
+THROTTLE_MAX_DELAY:     float   = 4.0   # Seconds between handled messages of a client without trust left
+MAX_DEFERRED_MESSAGES:  int     = 64    # Throttled messages kept before the client stops being read
 
 TIMEOUT_CONNECTION:     float   = 0.5
 TIMEOUT_MSG:            float   = 0.5
-TIMEOUT_COMMAND:        float   = 0.1
-SLEEP_ON_IDLE:          float   = 2.0
+TIMEOUT_SECURE_STAGE:   float   = 5.0   # Seconds for the whole keys exchange and challenges
+TIMEOUT_REGISTER_STAGE: float   = 5.0   # Seconds to receive the registration information
+COMMANDS_BATCH_SIZE:    int     = 32    # Commands taken from the pool at once
+COMMAND_LANES:          int     = 4     # Worker threads for commands. Each file is always handled by the same one
+TIMEOUT_WAITING_UPDATE: float   = 2.0   # Seconds between position updates for waiting connections
+
+CHECKPOINT_INTERVAL:    float   = 30.0  # Seconds between saving clients fields
+MAX_FLUSH_WORKERS:      int     = 4     # Parallel writers for clients fields on shutdown
+HISTORY_INTERVAL:       float   = 30.0  # Seconds between files snapshots and change logs compaction
+
+HANDSHAKE_WORKERS:      int     = 4     # Connections that are secured and registered at once
+MAX_PENDING_HANDSHAKES: int     = 16    # More admitted connections wait for a worker in the waiting queue
+MAX_WAITING_CLIENTS:    int     = 8     # Connections that wait for a free slot. More are told to retry later
+RETRY_AFTER:            int     = 10    # Seconds rejected connections are told to wait before trying again
+
+BROADCAST_WORKERS:      int     = 4     # Parallel per client encryption and sending of one broadcast
+BROADCAST_POOL_MIN:     int     = 4     # Fewer recipients are handled on the calling thread
+
+MAX_IMPORT_WORKERS:     int     = 8     # Parallel copies and hashes while importing the project
+EXTERNAL_RETRY_TIME:    float   = 2.0   # Seconds before an outside change of a file that is being edited is checked again
+COMMAND_EXTERNAL:       str     = "_ExternalChanges_"  # Internal command for files changed outside the program. Never sent
+MANIFEST_FILE_NAME:     str     = "manifest.json"   # Imported files information, used to skip unchanged files
+
+METRICS_PORT:           int     = 28625 # Local only metrics endpoint. 0 picks a free port, -1 disables it
+METRICS_SNAPSHOT_FILE:  str     = ""    # Periodic metrics file, outside of the project folders. Empty disables it
+METRICS_INTERVAL:       float   = 10.0  # Seconds between metrics snapshot files
+
+METRIC_PROTECT_TIME     = c_metrics.histogram( "crypto.protect_seconds" )
+METRIC_UNPROTECT_TIME   = c_metrics.histogram( "crypto.unprotect_seconds" )
+METRIC_HANDSHAKE_TIME   = c_metrics.histogram( "host.handshake_seconds" )
+METRIC_BROADCAST_TIME   = c_metrics.histogram( "host.broadcast_seconds" )
+METRIC_HANDSHAKE_FAILS  = c_metrics.counter( "host.handshakes_failed" )
+METRIC_ADMITTED         = c_metrics.counter( "host.connections_admitted" )
+METRIC_REJECTED         = c_metrics.counter( "host.connections_rejected" )
 
 ENUM_PROTOCOL_FILES:    int     = 1
 ENUM_PROTOCOL_NETWORK:  int     = 2
@@ -79,12 +122,16 @@ class c_command:
     _command:   str
     _arguments: list
 
+    _created:   float   # perf_counter( ) of the creation. Commands are placed in the pool right away
+
     def __init__( self, client: any,protocol: int, command: str, arguments: list ):
         self._client    = client
         self._protocol  = protocol
         self._command   = command
         self._arguments = arguments
 
+        self._created   = time.perf_counter( )
+
     
     def client( self ) -> any:
         return self._client
@@ -109,6 +156,120 @@ class c_command:
     def add_arguments( self, value: any ) -> None:
         self._arguments.append( value )
 
+    
+    def age( self ) -> float:
+        return time.perf_counter( ) - self._created
+
+
+class c_offset_ledger:
+
+    # Pending offsets are kept as a count for each value, since the client acknowledges them by value.
+    # Acknowledging a value removes one pending offset with that value, and the sum is kept
+    # on every add / acknowledge, so both are O(1).
+
+    _by_value:  dict        # Offset -> Amount of pending offsets with this value
+    _count:     int         # Amount of pending offsets
+    _total:     int         # Running sum of pending offsets
+    _lock:      threading.Lock
+
+    def __init__( self ):
+        """
+        Default constructor for offset ledger object.
+
+        Receive: None
+
+        Returns:
+        - c_offset_ledger: Offset ledger object
+        """
+
+        self._by_value  = { }
+        self._count     = 0
+        self._total     = 0
+        self._lock      = threading.Lock( )
+
+
+    def add( self, offset: int ):
+        """
+        Register new pending offset.
+
+        Receive:
+        - offset (int): Offset value
+
+        Returns: None
+        """
+
+        with self._lock:
+            self._by_value[ offset ] = self._by_value.get( offset, 0 ) + 1
+            self._count += 1
+            self._total += offset
+    
+
+    def has( self, offset: int ) -> bool:
+        """
+        Check if an offset value is still pending.
+
+        Receive:
+        - offset (int): Offset value
+
+        Returns:
+        - bool: Result
+        """
+
+        return offset in self._by_value
+    
+
+    def acknowledge( self, offset: int ) -> bool:
+        """
+        Acknowledge a single pending offset with a specific value.
+
+        Receive:
+        - offset (int): Offset value
+
+        Returns:
+        - bool: True if a pending offset was removed
+        """
+
+        with self._lock:
+            pending: int = self._by_value.get( offset, 0 )
+            if pending == 0:
+                return False
+            
+            if pending == 1:
+                del self._by_value[ offset ]
+            else:
+                self._by_value[ offset ] = pending - 1
+
+            self._count -= 1
+            self._total -= offset
+
+        return True
+    
+
+    def total( self ) -> int:
+        """
+        Get the sum of the pending offsets.
+
+        Receive: None
+
+        Returns:
+        - int: Running sum
+        """
+
+        return self._total
+    
+
+    def __len__( self ) -> int:
+        """
+        Get the amount of pending offsets.
+
+        Receive: None
+
+        Returns:
+        - int: Pending offsets count
+        """
+
+        return self._count
+
 
 class c_client_handle:
     
@@ -126,9 +287,9 @@ class c_client_handle:
     _selected_line:     int                         # Selected line
 
     # We dont want modded client to spoof index change response.
-    # As a result each change will be added to a list, and in general used as sum( ) for offset
-    # And checks if one offset is responded, just remove from the list.
-    _offsets:           list                        # Offsets for missed lines
+    # As a result each change will be added to a ledger, that keeps the running sum for offset
+    # And checks if one offset is responded, just acknowledge it in the ledger.
+    _offsets:           c_offset_ledger             # Offsets for missed lines
     
     # This part will be used to keep track of the issues that the client created.
     # If the client created an issue, the trust factor will be lowered.
@@ -141,6 +302,18 @@ class c_client_handle:
 
     _start_rotation:    bool                        # Is security key rotation has started
 
+    _send_lock:         threading.RLock             # Commands of different files can send to the client at once
+
+    # Clients with lower trust factor have their messages handled slower.
+    # Received messages wait in a queue instead of blocking the receive process.
+    _deferred:          deque                       # Received messages that wait for the throttling
+    _throttle_tokens:   float                       # Messages that can be handled right now ( token bucket )
+    _throttle_time:     float                       # Last time the tokens were refilled
+    _wake:              threading.Event             # Set on disconnect, to stop waiting for the throttling
+
+    _send_backlog:      int                         # Bytes that wait for the send lock or are being sent
+    _backlog_lock:      threading.Lock
+
     # endregion
 
     # region : Initialization client handle
@@ -175,6 +348,7 @@ class c_client_handle:
             "on_client_connected":      c_event( ),
             "on_client_disconnected":   c_event( ),
             "on_client_command":        c_event( ),
+            "on_client_file_selected":  c_event( ),
 
             "on_client_log":            c_event( )
         }
@@ -202,15 +376,25 @@ class c_client_handle:
         self._selected_file     = None
         self._selected_line     = 0
         self._trust_factor      = DEFAULT_TRUST_FACTOR
-        self._offsets           = [ ]
+        self._offsets           = c_offset_ledger( )
         self._issues            = [ ]
 
         self._start_rotation    = False
+        self._send_lock         = threading.RLock( )
+
+        self._deferred          = deque( )
+        self._throttle_tokens   = 1.0
+        self._throttle_time     = time.monotonic( )
+        self._wake              = threading.Event( )
+
+        self._send_backlog      = 0
+        self._backlog_lock      = threading.Lock( )
 
         self._files_commands = {
             FILES_COMMAND_REQ_FILES:        self.__share_files,
 
             FILES_COMMAND_GET_FILE:         self.__get_file,
+            FILES_COMMAND_GET_FILE_SINCE:   self.__get_file_since,
 
             FILES_COMMAND_PREPARE_UPDATE:   self.__request_line,
             # FILES_COMMAND_PREPARE_RESPONSE: None, # No need since this is only for client
@@ -290,14 +474,20 @@ class c_client_handle:
         Returns: None
         """
 
+        # A slow or silent client cannot hold the handshake worker for long
+        deadline: float = time.monotonic( ) + TIMEOUT_SECURE_STAGE
+
         # Send public key and signature
         public_key, signature = self._security.share( ENUM_COMPLEX_KEY )
         self._network.send_bytes( signature )
         self._network.send_bytes( public_key )
 
         # Receive client's public key and signature
-        client_signature    = self._network.receive_chunk( )
-        client_public_key   = self._network.receive_chunk( )
+        client_signature    = self.__receive_before( deadline )
+        client_public_key   = self.__receive_before( deadline )
+
+        if client_signature is None or client_public_key is None:
+            return False
         
         # Register this information
         if not self._security.share( ENUM_COMPLEX_KEY, ( client_public_key, client_signature ) ):
@@ -312,14 +502,17 @@ class c_client_handle:
         self._network.send_bytes( ephemeral_pub_key )
 
         # Receive client's nonce response
-        nonce_signature = self._network.receive_chunk( )
-        if not self._security.verify_challenge( nonce, nonce_signature ):
+        nonce_signature = self.__receive_before( deadline )
+        if nonce_signature is None or not self._security.verify_challenge( nonce, nonce_signature ):
             return False
         
         
         # Handle client's challenge (mutual authentication)
-        client_encryped_nonce = self._network.receive_chunk( )
-        client_ephemeral_pub_key = self._network.receive_chunk( )
+        client_encryped_nonce = self.__receive_before( deadline )
+        client_ephemeral_pub_key = self.__receive_before( deadline )
+
+        if client_encryped_nonce is None or client_ephemeral_pub_key is None:
+            return False
 
         server_nonce_signature = self._security.respond_to_challenge( client_encryped_nonce, client_ephemeral_pub_key )
         if not server_nonce_signature:
@@ -339,6 +532,24 @@ class c_client_handle:
         self.__event_client_log( f"Secured connection with the client { self._network.get_address( )[ 0 ] }:{ self._network.get_address( )[ 1 ] }" )
 
         return True
+
+
+    def __receive_before( self, deadline: float ) -> bytes:
+        """
+        Receive single chunk of the handshake.
+
+        Receive:
+        - deadline (float): time.monotonic( ) value the chunk must arrive before
+
+        Returns:
+        - bytes: Received chunk or None if the time is over
+        """
+
+        remaining: float = deadline - time.monotonic( )
+        if remaining <= 0:
+            return None
+
+        return self._network.receive_chunk( remaining )
     
 
     def __register_connection( self ) -> bool:
@@ -351,7 +562,7 @@ class c_client_handle:
         - bool: Result
         """
 
-        raw_msg: str = self._security.complex_remove_protection( self.__receive( ) ).decode( )
+        raw_msg: str = self._security.complex_remove_protection( self.__receive( TIMEOUT_REGISTER_STAGE ) ).decode( )
         
         if not raw_msg.startswith( self._registration.header( ) ):
             self._information[ "last_error" ] = "Cannot receive normalized registration information about client"
@@ -405,12 +616,7 @@ class c_client_handle:
             stored_access_levels = self._registration.get_field( "files" )
 
             for file_name, access_level in stored_access_levels.items( ):
-                file: c_virtual_file = self._files.search_file( file_name )
-
-                if file is None:
-                    continue
-
-                file.access_level( access_level )
+                self._files.access_level( file_name, access_level )
 
             return True
         
@@ -453,22 +659,16 @@ class c_client_handle:
         # End the connection
         self._network.end_connection( )
 
+        # Messages that wait for the throttling are dropped
+        self._wake.set( )
+        self._deferred.clear( )
+
         # Clear if anything selected on the host side
         self.clear( )
 
         # Update the fields
         if update_fields:
-            self._registration.set_field( "trust_factor", self._trust_factor )
-            self._registration.set_field( "issues", self._issues )
-
-            files_field = { }
-            for file_name, file in self._files.get_files( ).items( ):
-                file: c_virtual_file = file
-                files_field[ file.name( ) ] = file.access_level( )
-            
-            self._registration.set_field( "files", files_field )
-
-            self._registration.update_fields( )
+            self.save_fields( )
 
         # Call the event
         self.__event_client_disconnected( notify_the_client, remove_client_handle )
@@ -493,6 +693,49 @@ class c_client_handle:
 
         self.__event_client_log( f"Cleared client ( { self( 'username' ) } ) actions" )
 
+
+    def stage_fields( self ) -> bool:
+        """
+        Stage the client fields in the registration protocol without writing them.
+
+        Receive: None
+
+        Returns:
+        - bool: False if the client didn't complete registration
+        """
+
+        if not self._registration.has_fields( ):
+            return False
+
+        self._registration.set_field( "trust_factor", self._trust_factor )
+        self._registration.set_field( "issues", self._issues )
+
+        files_field = { }
+        for file_name in list( self._files.get_files( ) ):
+            files_field[ file_name ] = self._files.access_level( file_name )
+        
+        self._registration.set_field( "files", files_field )
+
+        return True
+    
+
+    @safe_call( c_debug.log_error )
+    def save_fields( self ) -> bool:
+        """
+        Write the client fields into the database.
+        Only the fields that changed since the last write are stored.
+
+        Receive: None
+
+        Returns:
+        - bool: True if anything was written
+        """
+
+        if not self.stage_fields( ):
+            return False
+        
+        return self._registration.update_fields( )
+
     # endregion
 
     # region : Communication
@@ -513,26 +756,66 @@ class c_client_handle:
             if not self.check_trust_factor( ):
                 return self.disconnect( False )
             
-            self.trust_factor_latency( )
-            
             if not self._start_rotation and self._security.should_rotate( ):
                 self.__start_security_rotation( )
                 continue
+
+            # Handle the messages that the throttling allows by now
+            self.__process_deferred( )
+
+            if len( self._deferred ) >= MAX_DEFERRED_MESSAGES:
+                # Stop reading. The client is slowed down by the socket buffer
+                self._wake.wait( TIMEOUT_MSG )
+                continue
             
             message: bytes = self.__receive( )
 
             if not message:
                 continue
+
+            # Binary frames are passed as they are
+            if not c_command_codec.is_binary( message ):
+                message = message.decode( )
         
-            self.__handle_message( message.decode( ) )
+            self.__handle_message( message )
 
 
-    def __receive( self ) -> bytes:
+    def __process_deferred( self ):
         """
-        Wrap the receive and the security part.
+        Handle the received messages that were held back by the throttling.
+
+        Receive: None
+
+        Returns: None
+        """
+
+        while len( self._deferred ) > 0 and self.__take_throttle_token( ):
+            self.__handle_command_message( self._deferred.popleft( ) )
+
+
+    def __next_message( self ) -> any:
+        """
+        Get the next message of the client, for commands that are followed by more messages.
 
         Receive: None
 
+        Returns:
+        - any: Message that was already received, otherwise the next one from the network
+        """
+
+        if len( self._deferred ) > 0:
+            return self._deferred.popleft( )
+
+        return self.__receive( )
+
+
+    def __receive( self, timeout: float = TIMEOUT_MSG ) -> bytes:
+        """
+        Wrap the receive and the security part.
+
+        Receive:
+        - timeout (float, optional): Timeout for each chunk
+
         Returns:   
         - bytes: Received information from client
         """
@@ -541,13 +824,14 @@ class c_client_handle:
         has_next:   bool    = True
 
         while has_next:
-            chunk: bytes = self._network.receive_chunk( TIMEOUT_MSG )
+            chunk: bytes = self._network.receive_chunk( timeout )
             if not chunk:
                 return None
             
             self._security.increase_input_sequence_number( )
 
-            chunk = self._security.dual_unprotect( chunk )
+            with METRIC_UNPROTECT_TIME.time( ):
+                chunk = self._security.dual_unprotect( chunk )
             if not chunk:
                 return self.lower_trust_factor( 10, "Failed to decrypt received message." )
             
@@ -559,12 +843,12 @@ class c_client_handle:
         return result
 
 
-    def __handle_message( self, message: str ):
+    def __handle_message( self, message: any ):
         """
         Handle message from client.
 
         Receive:
-        - message (str): Client's message
+        - message (any): Client's message. String or binary frame
 
         Returns: None
         """
@@ -581,6 +865,24 @@ class c_client_handle:
         if message == COMMAND_ROTATE_KEY:
             return self.__complete_security_rotation( )
 
+        # Keep the order, after the messages that are already waiting
+        if len( self._deferred ) > 0 or not self.__take_throttle_token( ):
+            self._deferred.append( message )
+            return
+
+        self.__handle_command_message( message )
+
+
+    def __handle_command_message( self, message: any ):
+        """
+        Handle command message from client.
+
+        Receive:
+        - message (any): Client's message. String or binary frame
+
+        Returns: None
+        """
+
         # Try to parse the message and create new command object
         new_command = self.__parse_message( message )
 
@@ -603,18 +905,18 @@ class c_client_handle:
         self.__event_client_command( new_command )
 
     
-    def __parse_message( self, message: str ) -> c_command:
+    def __parse_message( self, message: any ) -> c_command:
         """
         Parse message from the client.
 
         Receive:
-        - message (str): Client's message
+        - message (any): Client's message. String or binary frame
 
         Returns: 
         -tuple: ( Protocol, Command, Arguments )
         """
 
-        if message.startswith( self._files.get_header( ) ):
+        if self._files.is_message( message ):
             # Files protocol message
             command, arguments = self._files.parse_message( message )
 
@@ -649,19 +951,38 @@ class c_client_handle:
         return True
 
 
-    def send_quick_message( self, message: str ):
+    def send_quick_message( self, message: any ):
         """
-        Send a quick message to the host.
+        Send a quick message to the client.
 
         Receive:
-        - message (str): Message to send
+        - message (any): String or Files Protocol message to send
 
         Returns: None
         """
 
-        self.send_quick_bytes( message.encode( ) )
+        self.send_quick_bytes( self._files.encode_message( message ) )
     
 
+    def send_quick_frames( self, frames: list ):
+        """
+        Send few messages to the client, without other messages between them.
+
+        Receive:
+        - frames (list): Files Protocol messages, strings or already encoded bytes
+
+        Returns: None
+        """
+
+        with self._send_lock:
+            for frame in frames:
+
+                if not isinstance( frame, bytes ):
+                    frame = self._files.encode_message( frame )
+
+                self.send_quick_bytes( frame )
+
+
     def send_quick_bytes( self, data: bytes ):
         """
         Send a quick bytes to the client.
@@ -674,19 +995,69 @@ class c_client_handle:
 
         config = self._network.get_raw_details( len( data ) )
 
-        for info in config:
-            start       = info[ 0 ]
-            end         = info[ 1 ]
-            has_next    = info[ 2 ] and b'1' or b'0'
+        self.__add_send_backlog( len( data ) )
+
+        try:
+            # Chunks of one message and their sequence numbers must not mix with other messages
+            with self._send_lock:
+                for info in config:
+                    start       = info[ 0 ]
+                    end         = info[ 1 ]
+                    has_next    = info[ 2 ] and b'1' or b'0'
+
+                    chunk: bytes = has_next + data[ start:end ]
+                    
+                    self._security.increase_output_sequence_number( )
+
+                    with METRIC_PROTECT_TIME.time( ):
+                        chunk = self._security.dual_protect( chunk )
+
+                    result = self._network.send_bytes( chunk )
+                    if not result:
+                        return # self.disconnect( False, True, False )
+
+        finally:
+            self.__add_send_backlog( -len( data ) )
+
+
+    def __add_send_backlog( self, size: int ):
+        """
+        Change the amount of bytes that wait to be sent.
+
+        Receive:
+        - size (int): Bytes to add, negative to remove
+
+        Returns: None
+        """
+
+        with self._backlog_lock:
+            self._send_backlog += size
 
-            chunk: bytes = has_next + data[ start:end ]
-            
-            self._security.increase_output_sequence_number( )
-            chunk = self._security.dual_protect( chunk )
 
-            result = self._network.send_bytes( chunk )
-            if not result:
-                return # self.disconnect( False, True, False )
+    def send_backlog( self ) -> int:
+        """
+        Get the amount of bytes that wait to be sent to the client.
+
+        Receive: None
+
+        Returns:
+        - int: Bytes
+        """
+
+        return self._send_backlog
+
+
+    def deferred_messages( self ) -> int:
+        """
+        Get the amount of received messages that wait for the throttling.
+
+        Receive: None
+
+        Returns:
+        - int: Messages
+        """
+
+        return len( self._deferred )
 
 
     def __start_security_rotation( self ):
@@ -700,15 +1071,16 @@ class c_client_handle:
         
         self.__event_client_log( f"Started key rotation for client ( { self( 'username' ) } )" )
 
-        self.send_quick_message( COMMAND_ROTATE_KEY )
-        
-        self._security.generate_key( ENUM_OUTER_LAYER_KEY )
+        with self._send_lock:
+            self.send_quick_message( COMMAND_ROTATE_KEY )
+            
+            self._security.generate_key( ENUM_OUTER_LAYER_KEY )
 
-        self._network.send_bytes( self._security.share( ENUM_OUTER_LAYER_KEY ) )
+            self._network.send_bytes( self._security.share( ENUM_OUTER_LAYER_KEY ) )
 
-        self._security.reset_output_sequence_number( )
+            self._security.reset_output_sequence_number( )
 
-        self._start_rotation = True
+            self._start_rotation = True
 
     
     def __complete_security_rotation( self ):
@@ -782,6 +1154,25 @@ class c_client_handle:
         event.attach( "command", command )
 
         event.invoke( )
+
+
+    def __event_client_file_selected( self, old_file: c_virtual_file, new_file: c_virtual_file ):
+        """
+        Event when the client opened another file.
+
+        Receive:    
+        - old_file (c_virtual_file): Previous selected file or None
+        - new_file (c_virtual_file): New selected file or None
+
+        Returns: None
+        """
+
+        event: c_event = self._events[ "on_client_file_selected" ]
+        event.attach( "client",     self )
+        event.attach( "old_file",   old_file )
+        event.attach( "new_file",   new_file )
+
+        event.invoke( )
     
 
     def __event_client_log( self, message: str, save_in_app: bool = True, log_type: int = ENUM_LOG_INFO, user: str = "system" ):
@@ -834,17 +1225,13 @@ class c_client_handle:
         Initialize files for client.
 
         Receive:   
-        - files (c_files_manager_protocol): Files access
+        - files (c_files_manager_protocol): Shared host files
 
         Returns: None
         """
 
-        files: dict = files_protocol.get_files( )
-
-        for index in files:
-            file: c_virtual_file = files[ index ]
-
-            self._files.copy( file )
+        # Files are shared. Only the access levels are kept per client
+        self._files = c_files_overlay( files_protocol )
 
     
     def load_database( self, database: c_database ):
@@ -874,21 +1261,29 @@ class c_client_handle:
 
         self.__event_client_log( "requested files list", user=f"client ( { self( 'username' ) } )" )
 
-        files: dict = self._files.get_files( )
+        files: list = list( self._files.get_files( ) )
+
+        # Older clients do not offer a codec, and keep using text messages
+        arguments:  list    = command.arguments( )
+        offered:    int     = len( arguments ) > 1 and arguments[ 1 ].isdigit( ) and int( arguments[ 1 ] ) or FILES_CODEC_TEXT
+        codec:      int     = ENABLE_BINARY_CODEC and min( offered, FILES_CODEC_BINARY ) or FILES_CODEC_TEXT
 
-        self.send_quick_message( self._files.format_message( FILES_COMMAND_RES_FILES, [ str( len( files ) ) ] ) )
+        # The response is still sent in the old codec. Only then switch
+        self.send_quick_message( self._files.format_message( FILES_COMMAND_RES_FILES, [ str( len( files ) ), str( codec ) ] ) )
+        self._files.codec( codec )
 
         for file in files:
             file: c_virtual_file = self._files.search_file( file )
 
+            # The catalog is shared, and the file might be removed meanwhile
             if not file:
-                return
+                continue
             
-            access_level: int = file.access_level( )
+            access_level: int = self._files.access_level( file.name( ) )
             if access_level == FILE_ACCESS_LEVEL_HIDDEN:
                 continue
 
-            message: str = self._files.format_message( FILES_COMMAND_UPDATE_FILE, [ file.name( ), str( access_level ) ] )
+            message: c_files_message = self._files.format_message( FILES_COMMAND_UPDATE_FILE, [ file.name( ), str( access_level ) ] )
             self.send_quick_message( message )
 
     
@@ -902,53 +1297,149 @@ class c_client_handle:
         Returns: None
         """
 
-        file_name: str = command.arguments( )[ 0 ]
+        arguments:      list    = command.arguments( )
+        file_name:      str     = arguments[ 0 ]
+        known_digest:   str     = len( arguments ) > 1 and arguments[ 1 ] or None
 
-        self.__event_client_log( f"requested file { file_name }", user=f"client ( { self( 'username' ) } )" )
+        self.__send_file( file_name, known_digest, None )
 
-        file: c_virtual_file = self._files.search_file( file_name )
-        if file is None:
-            return self.lower_trust_factor( 5, "Invalid file name" ) 
-        
-        if file.access_level( ) == FILE_ACCESS_LEVEL_HIDDEN:
-            return self.lower_trust_factor( 10, "Unauthorized request" )
-        
-        c_debug.log_information( f"Client ( { self( 'username' ) } ) - requested file { file.name( ) }" )
 
-        self._selected_file = file
+    def __get_file_since( self, command: c_command ):
+        """
+        Share only the changes of the file since a version the client has.
 
-        file_size:  int     = file.size()
-        if file_size == -1:
-            return
-        
-        config:     list    = self._network.get_raw_details( file_size )
+        Receive:   
+        - command (c_command): Original command
 
-        self.send_quick_message( self._files.format_message( FILES_COMMAND_SET_FILE, [ file.name( ), str( file_size ) ] ) )
+        Returns: None
+        """
 
-        #key: bytes = self._security.generate_key( ENUM_OUTER_LAYER_KEY )
-        #self._security.increase_output_sequence_number( )
+        arguments: list = command.arguments( )
+        if len( arguments ) != 3:
+            return self.lower_trust_factor( 5, "Invalid arguments" )
 
-        for info in config:
-            start       = info[ 0 ]
-            end         = info[ 1 ]
-            has_next    = info[ 2 ] and b'1' or b'0'
+        file_name:      str     = arguments[ 0 ]
+        known_version:  str     = arguments[ 1 ]
+        known_digest:   str     = arguments[ 2 ]
 
-            chunk: bytes = has_next + file.read( start, end )
-            
-            self._security.increase_output_sequence_number( )
-            chunk = self._security.dual_protect( chunk )
+        self.__send_file( file_name, known_digest, known_version )
 
-            result = self._network.send_bytes( chunk )
-            if not result:
-                return # self.disconnect( False, True, False )
-            
-        self.__event_client_log( f"sent file { file_name } to client ( { self( 'username' ) } )" )
 
-        # After we done with the file. need to notify the client with locked lines
-        lines: list = file.locked_lines( )
-        for line in lines:
-            message: str = self._files.format_message( FILES_COMMAND_PREPARE_UPDATE, [ file.name( ), str( line ) ] )
-            self.send_quick_message( message )
+    def refresh_file( self, file_name: str ):
+        """
+        Send the whole content of a file again, without a request.
+
+        Receive:
+        - file_name (str): File name
+
+        Returns: None
+        """
+
+        self.__send_file( file_name )
+
+
+    def __send_file( self, file_name: str, known_digest: str = None, known_version: str = None ):
+        """
+        Send the file's content, or as little of it as the client needs.
+
+        Receive:   
+        - file_name (str): Requested file name
+        - known_digest (str, optional): Digest of the content the client has
+        - known_version (str, optional): Version of the content the client has
+
+        Returns: None
+        """
+
+        self.__event_client_log( f"requested file { file_name }", user=f"client ( { self( 'username' ) } )" )
+
+        file: c_virtual_file = self._files.search_file( file_name )
+        if file is None:
+            return self.lower_trust_factor( 5, "Invalid file name" ) 
+        
+        if self._files.access_level( file.name( ) ) == FILE_ACCESS_LEVEL_HIDDEN:
+            return self.lower_trust_factor( 10, "Unauthorized request" )
+        
+        c_debug.log_information( f"Client ( { self( 'username' ) } ) - requested file { file.name( ) }" )
+
+        self.selected_file( file )
+
+        if file.size( ) == -1:
+            return
+        
+        # Single reader for the whole transfer. Edits that happen meanwhile will not tear the content
+        with file.open_reader( ) as reader:
+            reader: c_file_reader = reader
+
+            file_size:  int     = reader.size( )
+            digest:     str     = reader.digest( )
+            version:    str     = reader.version( ) or ""
+            config:     list    = [ ]
+
+            if known_digest == digest:
+                
+                # The client already has this exact content cached
+                self.send_quick_message( self._files.format_message( FILES_COMMAND_SAME_FILE, [ file.name( ), digest, version ] ) )
+
+            elif not self.__send_file_delta( file, reader, known_version ):
+                config = self._network.get_raw_details( file_size )
+
+                self.send_quick_message( self._files.format_message( FILES_COMMAND_SET_FILE, [ file.name( ), str( file_size ), digest, version ] ) )
+
+            for info in config:
+                start       = info[ 0 ]
+                end         = info[ 1 ]
+                has_next    = info[ 2 ] and b'1' or b'0'
+
+                chunk: bytes = has_next + reader.read( start, end )
+                
+                self._security.increase_output_sequence_number( )
+
+                with METRIC_PROTECT_TIME.time( ):
+                    chunk = self._security.dual_protect( chunk )
+
+                result = self._network.send_bytes( chunk )
+                if not result:
+                    return # self.disconnect( False, True, False )
+            
+        self.__event_client_log( f"sent file { file_name } to client ( { self( 'username' ) } )" )
+
+        # After we done with the file. need to notify the client with locked lines
+        lines: list = file.locked_lines( )
+        for line in lines:
+            message: c_files_message = self._files.format_message( FILES_COMMAND_PREPARE_UPDATE, [ file.name( ), str( line ), file.line_owner( line ) or "?" ] )
+            self.send_quick_message( message )
+
+
+    def __send_file_delta( self, file: c_virtual_file, reader: c_file_reader, known_version: str ) -> bool:
+        """
+        Send the line operations between the client's version and the reader's version.
+
+        Receive:
+        - file (c_virtual_file): Requested file
+        - reader (c_file_reader): Opened reader of the file
+        - known_version (str): Version of the content the client has
+
+        Returns:
+        - bool: True if the delta was sent. False if a full transfer is needed
+        """
+
+        if known_version is None or reader.version( ) is None:
+            return False
+        
+        operations: list = file.changes_since( known_version, reader.version( ) )
+        if operations is None:
+            return False
+        
+        encoded: str = json.dumps( operations )
+
+        # Many changes can cost more than the file itself
+        if len( encoded ) >= reader.size( ):
+            return False
+        
+        message: c_files_message = self._files.format_message( FILES_COMMAND_FILE_DELTA, [ file.name( ), reader.digest( ), reader.version( ), encoded ] )
+        self.send_quick_message( message )
+
+        return True
 
 
     def __request_line( self, command: c_command ):
@@ -980,7 +1471,7 @@ class c_client_handle:
         if not file:
             return self.lower_trust_factor( 5, "Invalid file name" ) 
         
-        access_level: int = file.access_level( )
+        access_level: int = self._files.access_level( file.name( ) )
         if access_level != FILE_ACCESS_LEVEL_EDIT:
             return self.lower_trust_factor( 10, "Unauthorized request" )
         
@@ -996,9 +1487,10 @@ class c_client_handle:
 
         self.__event_client_log( f"response for line { line_number } in { file_name } completed" )
 
-        # Change the command arguments into real values
+        # Change the command arguments into real values.
+        # The catalog name, since the client can still use an old name of the file, and the lane is chosen by it
         command.clear_arguments( )
-        command.add_arguments( file_name )
+        command.add_arguments( file.name( ) )
         command.add_arguments( line_number )
 
         # In the end process the command in commands pool
@@ -1034,7 +1526,7 @@ class c_client_handle:
         if not file:
             return self.lower_trust_factor( 5, "Invalid file name" ) 
         
-        access_level: int = file.access_level( )
+        access_level: int = self._files.access_level( file.name( ) )
         if access_level != FILE_ACCESS_LEVEL_EDIT:
             return self.lower_trust_factor( 10, "Unauthorized request" )
 
@@ -1048,7 +1540,7 @@ class c_client_handle:
 
         # Change the command arguments into real values
         command.clear_arguments( )
-        command.add_arguments( file_name )
+        command.add_arguments( file.name( ) )
         command.add_arguments( line_number )
 
         # In the end process the command in commands pool
@@ -1085,7 +1577,7 @@ class c_client_handle:
         if not file:
             return self.lower_trust_factor( 5, "Invalid file name" ) 
         
-        access_level: int = file.access_level( )
+        access_level: int = self._files.access_level( file.name( ) )
         if access_level != FILE_ACCESS_LEVEL_EDIT:
             return self.lower_trust_factor( 10, "Unauthorized request" )
         
@@ -1095,18 +1587,20 @@ class c_client_handle:
         if line_number != self.selected_line( ):
             return self.lower_trust_factor( 5, "Incorrect line index" )
 
+        # All the lines come in a single payload. Empty payload is not sent at all
         new_lines: list = [ ]
-        for index in range( lines_number ):
-            new_line: bytes = self.__receive( )
 
-            if not new_line:
-                raise Exception( f"Failed to get line on index { index + 1 }" )
-            
-            new_line: str = base64.b64decode( new_line ).decode( )
-            if new_line == "\n":
-                new_line = ""
-            
-            new_lines.append( new_line )
+        if lines_number > 0:
+            payload: any = self.__next_message( )
+
+            if not payload:
+                raise Exception( "Failed to get the lines" )
+
+            new_lines = self._files.unpack_lines( payload )
+            del payload
+
+        if len( new_lines ) != lines_number:
+            return self.lower_trust_factor( 5, "Incorrect lines count" )
 
         self.__event_client_log( f"update for line { line_number } in { file_name } completed" )
 
@@ -1149,7 +1643,7 @@ class c_client_handle:
         if not file:
             return self.lower_trust_factor( 5, "Invalid file name" ) 
         
-        access_level: int = file.access_level( )
+        access_level: int = self._files.access_level( file.name( ) )
         if access_level != FILE_ACCESS_LEVEL_EDIT:
             return self.lower_trust_factor( 10, "Unauthorized request" )
         
@@ -1207,22 +1701,22 @@ class c_client_handle:
         if not file:
             return
         
-        old_access_level: int = file.access_level( )
+        old_access_level: int = self._files.access_level( file.name( ) )
         
         self.__event_client_log( f"changed access level in file { file_name } to { new_level } from { old_access_level }", user=f"client ( { self( 'username' ) } )" )
 
         if old_access_level == FILE_ACCESS_LEVEL_EDIT and new_level != FILE_ACCESS_LEVEL_EDIT and ( self._selected_file is not None and self._selected_file.name( ) == file.name( ) ) and self._selected_line != 0:
             # Disable line lock
             command = c_command( self, ENUM_PROTOCOL_FILES, FILES_COMMAND_DISCARD_UPDATE, [ ] )
-            command.add_arguments( file_name )
+            command.add_arguments( file.name( ) )
             command.add_arguments( self._selected_line )
 
             self.__event_client_command( command )
 
-        file.access_level( new_level )
+        self._files.access_level( file_name, new_level )
 
         # Prepare message for client
-        message: str = self._files.format_message( FILES_COMMAND_UPDATE_FILE, [ file.name( ), str( new_level ) ] )
+        message: c_files_message = self._files.format_message( FILES_COMMAND_UPDATE_FILE, [ file.name( ), str( new_level ) ] )
         self.send_quick_message( message )
 
     # endregion
@@ -1270,7 +1764,7 @@ class c_client_handle:
         if not file:
             return self.lower_trust_factor( 5, "Invalid file name" ) 
         
-        access_level: int = file.access_level( )
+        access_level: int = self._files.access_level( file.name( ) )
         if access_level != FILE_ACCESS_LEVEL_EDIT:
             return self.lower_trust_factor( 10, "Unauthorized request" )
         
@@ -1304,7 +1798,7 @@ class c_client_handle:
         if not file:
             return self.lower_trust_factor( 5, "Invalid file name" ) 
         
-        if file.access_level( ) == FILE_ACCESS_LEVEL_HIDDEN:
+        if self._files.access_level( file.name( ) ) == FILE_ACCESS_LEVEL_HIDDEN:
             return self.lower_trust_factor( 10, "Unauthorized request" )
 
         command.clear_arguments( )
@@ -1329,7 +1823,7 @@ class c_client_handle:
         - int: Offset
         """
 
-        return sum( self._offsets )
+        return self._offsets.total( )
     
 
     def add_offset( self, offset: int ):
@@ -1342,7 +1836,7 @@ class c_client_handle:
         Returns: None
         """
 
-        self._offsets.append( offset )
+        self._offsets.add( offset )
 
     
     def is_offset( self, offset: int ) -> bool:
@@ -1356,11 +1850,7 @@ class c_client_handle:
         - bool : Is the offset in the client
         """
 
-        for item in self._offsets:
-            if offset == item:
-                return True
-            
-        return False
+        return self._offsets.has( offset )
     
 
     def remove_offset( self, offset: int ) -> bool:
@@ -1374,11 +1864,7 @@ class c_client_handle:
         - bool : Is the offset removed
         """
 
-        if not self.is_offset( offset ):
-            return False
-        
-        self._offsets.remove( offset )
-        return True
+        return self._offsets.acknowledge( offset )
 
     # endregion
 
@@ -1402,13 +1888,17 @@ class c_client_handle:
             
             return self._selected_file.name( )
         
-        new_value_type = type( new_value )
+        old_file:       c_virtual_file  = self._selected_file
+        new_value_type                  = type( new_value )
 
         if new_value_type == str:
             self._selected_file = self._files.search_file( new_value )
 
         elif new_value_type == c_virtual_file:
             self._selected_file = new_value
+
+        if old_file is not self._selected_file:
+            self.__event_client_file_selected( old_file, self._selected_file )
         
         return self._selected_file
     
@@ -1470,7 +1960,7 @@ class c_client_handle:
         if not file:
             return [ "Unknown", 0 ]
 
-        return [ file.name( ), file.access_level( ) ]
+        return [ file.name( ), self._files.access_level( file.name( ) ) ]
 
     # endregion
 
@@ -1506,22 +1996,49 @@ class c_client_handle:
         return self._trust_factor > 0
     
 
-    def trust_factor_latency( self ):
+    def trust_factor_latency( self ) -> float:
         """
-        Create delay for receving data on lower trust factor.
+        Get delay between handled messages on lower trust factor.
 
         Receive: None
 
-        Returns: None
+        Returns:
+        - float: Seconds between messages
         """
 
         pure_value = DEFAULT_TRUST_FACTOR - self._trust_factor
         
-        if pure_value == 0:
-            return
+        if pure_value <= 0:
+            return 0
         
         pure_value = pure_value / DEFAULT_TRUST_FACTOR
-        time.sleep( pure_value * 4 )
+        return pure_value * THROTTLE_MAX_DELAY
+
+
+    def __take_throttle_token( self ) -> bool:
+        """
+        Check if a message can be handled now. Token bucket refilled by the trust factor latency.
+
+        Receive: None
+
+        Returns:
+        - bool: True if the message can be handled
+        """
+
+        delay: float = self.trust_factor_latency( )
+        if delay <= 0:
+            return True
+
+        now: float = time.monotonic( )
+
+        self._throttle_tokens   = min( 1.0, self._throttle_tokens + ( now - self._throttle_time ) / delay )
+        self._throttle_time     = now
+
+        if self._throttle_tokens < 1.0:
+            return False
+
+        self._throttle_tokens -= 1.0
+        return True
     
 
     def trust_factor( self, value: int = None ) -> int:
@@ -1664,8 +2181,23 @@ class c_host_business_logic:
     _events:                dict
     
     _command_pool:          queue.Queue
+    _command_lanes:         list                # Queue of each commands worker
+    _command_waits:         dict                # Command -> [ count, total seconds, max seconds ] waited in the pool
+    _command_waits_lock:    threading.Lock
+    _shutdown:              threading.Event     # Set once the host stops running
 
     _clients:               list
+    _handshake_pool:        ThreadPoolExecutor  # Secures and registers new connections
+    _handshakes_pending:    int                 # Admitted connections that are not clients yet
+    _waiting:               deque               # ( socket, address ) of connections that wait for a free slot
+    _admission:             threading.Condition # Notified when a slot may be free or a connection waits
+    _broadcast_pool:        ThreadPoolExecutor  # Sends one broadcast to many clients at once
+    _subscribers:           dict                # c_virtual_file -> { id( client ) : client } of clients that opened it
+    _subscriptions:         dict                # id( client ) -> c_virtual_file it opened
+    _subscribers_lock:      threading.Lock
+
+    _watcher:               c_path_watcher      # Picks up files changes made outside the program
+    _metrics_server:        c_metrics_server    # Local metrics endpoint and snapshot file
 
     _host_client:           c_client_handle     # For the host user should be also client that contains the information about file and line...
     # It is easier to control the host user with client handle
@@ -1723,6 +2255,7 @@ class c_host_business_logic:
             "on_client_command":        c_event( ),
 
             "on_files_refresh":         c_event( ),
+            "on_files_progress":        c_event( ),
 
             # Host user actions events
             "on_file_set":              c_event( ),
@@ -1757,7 +2290,24 @@ class c_host_business_logic:
 
         self._clients = [ ]
 
-        self._command_pool = queue.Queue( )
+        self._handshake_pool        = None
+        self._handshakes_pending    = 0
+        self._waiting               = deque( )
+        self._admission             = threading.Condition( )
+
+        self._broadcast_pool        = None
+
+        self._subscribers           = { }
+        self._subscriptions         = { }
+        self._subscribers_lock      = threading.Lock( )
+
+        self._command_pool          = queue.Queue( )
+        self._command_lanes         = [ ]
+        self._command_waits         = { }
+        self._command_waits_lock    = threading.Lock( )
+        self._shutdown      = threading.Event( )
+        self._watcher      = None
+        self._metrics_server = None
 
         self._host_client = c_client_handle( )
         self._host_client.attach_network(   self._network )
@@ -1822,6 +2372,13 @@ class c_host_business_logic:
         
         # Update is Running flag
         self._information[ "running" ] = True
+        self._shutdown.clear( )
+
+        # Handshakes of the last run do not count anymore
+        self._handshakes_pending = 0
+
+        self._handshake_pool = ThreadPoolExecutor( max_workers=HANDSHAKE_WORKERS, thread_name_prefix="handshake" )
+        self._broadcast_pool = ThreadPoolExecutor( max_workers=BROADCAST_WORKERS, thread_name_prefix="broadcast" )
 
         # Call event
         self.__event_host_start( )
@@ -1832,6 +2389,12 @@ class c_host_business_logic:
         # Start the server process
         self.__attach_processes( )
 
+        # Start watching the project files
+        self.__start_watcher( )
+
+        # Expose the host metrics
+        self.__start_metrics( )
+
         return True
 
 
@@ -1847,26 +2410,68 @@ class c_host_business_logic:
         if not self._information[ "running" ]:
             return self._network.end_connection( )
  
-        # Update is Running flag
-        self._information[ "running" ] = False
+        # Update is Running flag. Handshakes that end after it do not list their clients
+        with self._admission:
+            self._information[ "running" ] = False
+
+        self._shutdown.set( )
         c_debug.log_information( "Set [running] flag to False" )
 
+        if self._watcher is not None:
+            self._watcher.stop( )
+            self._watcher = None
+
+        if self._metrics_server is not None:
+            self._metrics_server.stop( )
+            self._metrics_server = None
+
+        # Wake the admission process, it closes the waiting connections
+        with self._admission:
+            self._admission.notify_all( )
+
+        # Connections that are still waiting for a handshake are closed by their jobs
+        handshake_pool: ThreadPoolExecutor = self._handshake_pool
+        self._handshake_pool = None
+
+        if handshake_pool is not None:
+            handshake_pool.shutdown( wait=False )
+
         # Call event
         self.__event_host_stop( )
         c_debug.log_information( "Called __event_host_stop( )" )
 
-        # Disconnect from the database
-        self._database.disconnect( )
-        c_debug.log_information( "Disconnected from the database" )
+        # Disconnect all the remaining clients.
+        # The fields are written after, in parallel, since each write costs a key derivation
+        clients: list = self._clients.copy( )
 
-        # Disconnect all the remaining clients
-        for client in self._clients:
+        for client in clients:
             client: c_client_handle = client
 
-            client.disconnect( True, False )
+            client.disconnect( True, False, False )
 
         c_debug.log_information( "Disconnected every client" )
 
+        # Wake the commands thread. Commands placed before it are still handled
+        self._command_pool.put( None )
+
+        self.__flush_clients_fields( clients )
+        c_debug.log_information( "Saved clients fields" )
+
+        # Late broadcasts are sent on the calling thread
+        broadcast_pool: ThreadPoolExecutor = self._broadcast_pool
+        self._broadcast_pool = None
+
+        if broadcast_pool is not None:
+            broadcast_pool.shutdown( wait=False )
+
+        # Write files changes that are still in memory
+        self._files.save_all( )
+        c_debug.log_information( "Saved files" )
+
+        # Disconnect from the database
+        self._database.disconnect( )
+        c_debug.log_information( "Disconnected from the database" )
+
         self._clients.clear( )
         c_debug.log_information( "Cleared client list" )
 
@@ -1906,202 +2511,793 @@ class c_host_business_logic:
         # Start the process for handling connections
         self._information[ "connection_thread" ] = self.__process_handle_connections( )
 
+        # Start the process for admitting the waiting connections
+        self._information[ "admission_thread" ] = self.__process_admission( )
+
         # Start the process for handling commands
         self._information[ "command_thread" ] = self.__process_handle_commands( )
 
+        # Start the process for saving clients fields
+        self._information[ "checkpoint_thread" ] = self.__process_checkpoint_fields( )
 
-    @standalone_execute
-    def __process_handle_connections( self ):
+        # Start the process for snapshots and change logs compaction
+        self._information[ "history_thread" ] = self.__process_maintain_history( )
+
+
+    def __start_watcher( self ):
         """
-        Process for handling connections.
+        Start watching the original and virtual files paths.
 
         Receive: None
-            
+
         Returns: None
         """
 
-        while self._information[ "running" ]:
-
-            while len( self._clients ) >= self._information[ "max_clients" ]:
-                time.sleep( SLEEP_ON_IDLE )
+        if self._watcher is not None:
+            self._watcher.stop( )
 
-            # Get the new client
-            client_socket, client_addr = self._network.accept_connection( TIMEOUT_CONNECTION )
+        paths: list = [ self._information[ "original_path" ], self._information[ "normal_path" ] ]
 
-            # If there is no client, continue
-            if client_socket is None or client_addr is None:
-                continue
+        self._watcher = c_path_watcher( paths, self.__on_paths_changed )
+        mode: str = self._watcher.start( )
 
-            self.__event_client_connected( client_socket, client_addr )
+        c_debug.log_information( f"Watching project files using { mode }" )
 
 
-    @standalone_execute
-    def __process_handle_commands( self ):
+    def __start_metrics( self ):
         """
-        Process for handling commands.
+        Register the host gauges and start the metrics endpoint.
 
         Receive: None
 
         Returns: None
         """
 
-        while self._information[ "running" ] or not self._command_pool.empty( ):
+        client_values = lambda getter: { client( "username" ): getter( client ) for client in list( self._clients ) }
 
-            if not self._command_pool.empty( ):
+        c_metrics.gauge( "host.clients",                lambda: len( self._clients ) )
+        c_metrics.gauge( "host.max_clients",            lambda: self._information[ "max_clients" ] )
+        c_metrics.gauge( "host.handshakes_pending",     self.pending_handshakes )
+        c_metrics.gauge( "host.connections_waiting",    self.waiting_connections )
+        c_metrics.gauge( "host.command_pool",           lambda: self._command_pool.qsize( ) )
+        c_metrics.gauge( "host.command_lanes",          lambda: [ lane.qsize( ) for lane in self._command_lanes ] )
+        c_metrics.gauge( "host.send_backlog_bytes",     lambda: client_values( c_client_handle.send_backlog ) )
+        c_metrics.gauge( "host.deferred_messages",      lambda: client_values( c_client_handle.deferred_messages ) )
 
-                # Get the command from the pool
-                command: c_command = self._command_pool.get( block=False )
+        self._metrics_server = c_metrics_server( )
 
-                # If there is no command, continue
-                if command is None:
-                    continue
-
-                self.__handle_command( command )
+        if METRICS_PORT != -1:
+            port: int = safe_call( c_debug.log_error )( self._metrics_server.start_endpoint )( METRICS_PORT )
 
+            if port is None:
+                # For example, the port is already in use
+                c_debug.log_error( f"Failed to start metrics endpoint on 127.0.0.1:{ METRICS_PORT }" )
             else:
-                
-                # If our command queue is empty, just sleep for 0.1 seconds.
-                # Otherwise this thread will run million times per second.
-                time.sleep( TIMEOUT_COMMAND )
+                self._information[ "metrics_port" ] = port
 
-    # endregion
+                c_debug.log_information( f"Metrics endpoint on 127.0.0.1:{ port }" )
 
-    # region : Commands
+        if METRICS_SNAPSHOT_FILE != "":
+            self._metrics_server.start_snapshots( METRICS_SNAPSHOT_FILE, METRICS_INTERVAL )
 
-    @safe_call( c_debug.log_error )
-    def __handle_command( self, command: c_command ):
+
+    def metrics( self ) -> dict:
         """
-        Handle command request.
+        Get all the metrics of the process.
 
-        Receive:
-        - command (c_command): Command object from client
+        Receive: None
 
-        Returns: None
+        Returns:
+        - dict: Metric name -> value
         """
 
-        base_command_callbacks = {
-            FILES_COMMAND_PREPARE_UPDATE:   self.__command_execute_prepare_update,
-            FILES_COMMAND_DISCARD_UPDATE:   self.__command_execute_discard_update,
-            FILES_COMMAND_UPDATE_LINE:      self.__command_execute_commit_update,
-            FILES_COMMAND_DELETE_LINE:      self.__command_execute_commit_delete,
-            FILES_COMMAND_APPLY_UPDATE:     self.__command_execute_accept_offset,
-            FILES_COMMAND_UPDATE_FILE_NAME: self.__command_execute_change_file_name
-        }
-
-        base_command_callbacks[ command.command( ) ]( command.client( ), command.arguments( ) )
+        return c_metrics.snapshot( )
 
-        # Clear the memory from useless command that we processed already
-        del command
 
-    @safe_call( c_debug.log_error )
-    def __command_execute_prepare_update( self, client: c_client_handle, arguments: list ):
+    def __on_paths_changed( self, paths: list ):
         """
-        Command for prepare line update.
+        Watcher callback. Moves the changes to the commands thread,
+        so they are ordered with the clients changes.
 
         Receive:
-        - client (c_client_handle): Client handle that requested
-        - arguments (list): Arguments from the command
+        - paths (list): Changed files paths
 
         Returns: None
         """
 
-        file_name:      str = arguments[ 0 ]
-        line_number:    int = arguments[ 1 ]
+        # Late retries can come after the host stopped
+        if not self._information[ "running" ]:
+            return
 
-        file: c_virtual_file = client.files( ).search_file( file_name )
+        new_command: c_command = c_command( self._host_client, ENUM_PROTOCOL_FILES, COMMAND_EXTERNAL, [ ] )
+        new_command.add_arguments( paths )
 
-        is_locked:  bool    = file.is_line_locked( line_number )
-        response:   str     = is_locked and "1" or "0"
+        self._command_pool.put( new_command )
 
-        if not is_locked:
-            client.selected_line( line_number )
-            file.lock_line( line_number )
 
-            client_username: str = client( "username" ) or "Failed"
+    @standalone_execute
+    def __process_handle_connections( self ):
+        """
+        Process for handling connections.
 
-            self.__broadcast_for_shareable_clients( file, client, self.__broadcast_lock_line, line_number, client_username )
+        Receive: None
+            
+        Returns: None
+        """
 
-            self.__event_line_lock( file.name( ), line_number, client_username )
+        while self._information[ "running" ]:
 
-        message: str = self._files.format_message( FILES_COMMAND_PREPARE_RESPONSE, [ file.name( ), str( line_number ), response ] )
-        client.send_quick_message( message )
+            # Get the new client
+            client_socket, client_addr = self._network.accept_connection( TIMEOUT_CONNECTION )
 
+            # If there is no client, continue
+            if client_socket is None or client_addr is None:
+                continue
 
-    def __command_execute_discard_update( self, client: c_client_handle, arguments: list ):
-        """
-        Command for discard line update.
+            with self._admission:
+                is_full: bool = len( self._waiting ) >= MAX_WAITING_CLIENTS and not self.__has_free_slot( )
 
-        Receive:
-        - client (c_client_handle): Client handle that requested
-        - arguments (list): Arguments from the command
+                if not is_full:
+                    # The admission process decides when it becomes a client
+                    self._waiting.append( ( client_socket, client_addr ) )
+                    self._admission.notify_all( )
 
-        Returns: None
+            if is_full:
+                self.__reject_connection( client_socket, client_addr )
+
+
+    @standalone_execute
+    def __process_admission( self ):
         """
+        Process for admitting waiting connections once there is a free slot.
+        The ones that still wait are told their position.
 
-        file_name:      str = arguments[ 0 ]
-        line_number:    int = arguments[ 1 ]
+        Receive: None
 
-        file: c_virtual_file = client.files( ).search_file( file_name )
+        Returns: None
+        """
 
-        file.unlock_line( line_number )
-        client.selected_line( 0 )
+        while self._information[ "running" ]:
+            admitted:   list = [ ]
+            waiting:    list = [ ]
 
-        self.__broadcast_for_shareable_clients( file, client, self.__broadcast_unlock_line, line_number )
+            with self._admission:
+                if not ( self._waiting and self.__has_free_slot( ) ):
+                    self._admission.wait( TIMEOUT_WAITING_UPDATE )
 
-        self.__event_line_unlock( file.name( ), line_number )
+                while self._waiting and self.__has_free_slot( ) and self._information[ "running" ]:
+                    client_socket, client_address = self._waiting.popleft( )
 
-    
-    def __command_execute_commit_update( self, client: c_client_handle, arguments: list ):
-        """
-        Command for commit line update.
+                    admitted.append( ( self.__create_client( ), client_socket, client_address ) )
+                    self._handshakes_pending += 1
 
-        Receive:
-        - client (c_client_handle): Client handle that requested
-        - arguments (list): Arguments from the command
+                    METRIC_ADMITTED.add( )
 
-        Returns: None
-        """
+                waiting = list( self._waiting )
 
-        file_name:      str     = arguments[ 0 ]
-        line_number:    int     = arguments[ 1 ]
-        new_lines:      list    = arguments[ 2 ]
+            for new_client, client_socket, client_address in admitted:
+                self.__queue_handshake( new_client, client_socket, client_address )
 
-        file: c_virtual_file = client.files( ).search_file( file_name )
+            # Positions are sent when they change and periodically as keep alive
+            for position, ( client_socket, client_address ) in enumerate( waiting, 1 ):
+                message: bytes = f"{ ADMISSION_WAIT }:{ position }".encode( )
 
-        file.unlock_line( line_number )
-        client.selected_line( 0 )
+                if not self.__send_admission( client_socket, message ):
+                    self.__drop_waiting( client_socket )
 
-        file.change_line( line_number, new_lines, { "user": client( "username" ) } )
+        # The host stopped. Connections that still wait are closed
+        with self._admission:
+            waiting = list( self._waiting )
+            self._waiting.clear( )
 
-        self.__broadcast_for_shareable_clients( file, client, self.__broadcast_update_line, line_number, new_lines )
+        for client_socket, client_address in waiting:
+            self.__reject_connection( client_socket, client_address )
 
-        if not client == self._host_client:
-            self.__correct_host_offset( file, line_number, len( new_lines ) )
-            self.__event_line_update( file.name( ), line_number, new_lines )
-    
 
-    def __command_execute_commit_delete( self, client: c_client_handle, arguments: list ):
+    def __has_free_slot( self ) -> bool:
         """
-        Command for commit line delete.
+        Check if another connection can be admitted. Must be called with the admission lock.
 
-        Receive:
-        - client (c_client_handle): Client handle that requested
-        - arguments (list): Arguments from the command
+        Receive: None
 
-        Returns: None
+        Returns:
+        - bool: Result
         """
 
-        file_name:      str     = arguments[ 0 ]
-        line_number:    int     = arguments[ 1 ]
+        if len( self._clients ) + self._handshakes_pending >= self._information[ "max_clients" ]:
+            return False
 
-        file: c_virtual_file = client.files( ).search_file( file_name )
+        return self._handshakes_pending < MAX_PENDING_HANDSHAKES
 
-        file.unlock_line( line_number )
-        client.selected_line( 0 )
 
-        file.remove_line( line_number, { "user": client( "username" ) } )
+    def __send_admission( self, client_socket: socket, message: bytes ) -> bool:
+        """
+        Send admission message to a connection that was not secured yet.
 
-        self.__broadcast_for_shareable_clients( file, client, self.__broadcast_delete_line, line_number )
+        Receive:
+        - client_socket (socket): Client socket
+        - message (bytes): Admission message
+
+        Returns:
+        - bool: True on success
+        """
+
+        try:
+            client_socket.settimeout( TIMEOUT_CONNECTION )
+            client_socket.sendall( self._network.get_message_header( len( message ) ) + message )
+
+            return True
+
+        except OSError:
+            return False
+
+
+    def __reject_connection( self, client_socket: socket, client_address: tuple ):
+        """
+        Tell the connection that the server is full and close it.
+
+        Receive:
+        - client_socket (socket): Client socket
+        - client_address (tuple): Client address
+
+        Returns: None
+        """
+
+        c_debug.log_information( f"Server is full, rejected connection from { client_address[ 0 ] }:{ client_address[ 1 ] }" )
+
+        METRIC_REJECTED.add( )
+
+        self.__send_admission( client_socket, f"{ ADMISSION_FULL }:{ RETRY_AFTER }".encode( ) )
+        client_socket.close( )
+
+
+    def __drop_waiting( self, client_socket: socket ):
+        """
+        Remove a connection that left the waiting queue.
+
+        Receive:
+        - client_socket (socket): Client socket
+
+        Returns: None
+        """
+
+        with self._admission:
+            self._waiting = deque( item for item in self._waiting if item[ 0 ] is not client_socket )
+
+        client_socket.close( )
+
+
+    def __queue_handshake( self, new_client: c_client_handle, client_socket: socket, client_address: tuple ):
+        """
+        Pass an admitted connection to the handshake workers.
+
+        Receive:
+        - new_client (c_client_handle): Client handle for the connection
+        - client_socket (socket): Client socket
+        - client_address (tuple): Client address
+
+        Returns: None
+        """
+
+        handshake_pool: ThreadPoolExecutor = self._handshake_pool
+
+        if self.__send_admission( client_socket, ADMISSION_ACCEPT.encode( ) ):
+            try:
+                handshake_pool.submit( self.__process_handshake, handshake_pool, new_client, client_socket, client_address )
+                return
+
+            except ( RuntimeError, AttributeError ):
+                # The host was terminated meanwhile
+                pass
+
+        self.__remove_client( new_client )
+        self.__finish_handshake( handshake_pool )
+        client_socket.close( )
+
+
+    def __process_handshake( self, handshake_pool: ThreadPoolExecutor, new_client: c_client_handle, client_socket: socket, client_address: tuple ):
+        """
+        Handshake worker job. Secures and registers a single connection.
+
+        Receive:
+        - handshake_pool (ThreadPoolExecutor): Pool that the job was queued in
+        - new_client (c_client_handle): Client handle for the connection
+        - client_socket (socket): Client socket
+        - client_address (tuple): Client address
+
+        Returns: None
+        """
+
+        is_connected: bool = False
+
+        try:
+            if handshake_pool is not self._handshake_pool:
+                # The host was terminated before the job started
+                client_socket.close( )
+
+            else:
+                with METRIC_HANDSHAKE_TIME.time( ):
+                    is_connected = safe_call( c_debug.log_error )( new_client.connect )( client_socket, client_address ) is True
+
+        finally:
+            if not is_connected:
+                # Failed handshakes usually remove themselves, but not on exceptions
+                self.__remove_client( new_client )
+                METRIC_HANDSHAKE_FAILS.add( )
+
+            self.__finish_handshake( handshake_pool )
+
+        if not is_connected:
+            return
+        
+        with self._admission:
+            is_running: bool = self._information[ "running" ]
+            is_valid:   bool = new_client.network( ).is_valid( )
+
+            if is_running and is_valid:
+                self._clients.append( new_client )
+
+        if not is_valid:
+            # The client already left and was disconnected
+            return
+        
+        if not is_running:
+            # The host was terminated during the handshake
+            return new_client.disconnect( True, False, False )
+        
+        self.__event_client_connected( )
+
+
+    def __finish_handshake( self, handshake_pool: ThreadPoolExecutor ):
+        """
+        Mark a pending handshake as done.
+
+        Receive:
+        - handshake_pool (ThreadPoolExecutor): Pool that the handshake was queued in
+
+        Returns: None
+        """
+
+        with self._admission:
+            # The counter is reset when the host starts again
+            if handshake_pool is self._handshake_pool:
+                self._handshakes_pending -= 1
+
+            self._admission.notify_all( )
+
+
+    def pending_handshakes( self ) -> int:
+        """
+        Get the amount of admitted connections that are still in handshake.
+
+        Receive: None
+
+        Returns:
+        - int: Pending handshakes
+        """
+
+        return self._handshakes_pending
+
+
+    def waiting_connections( self ) -> int:
+        """
+        Get the amount of connections that wait for a free slot.
+
+        Receive: None
+
+        Returns:
+        - int: Waiting connections
+        """
+
+        return len( self._waiting )
+
+
+    @standalone_execute
+    def __process_handle_commands( self ):
+        """
+        Process for routing commands to the workers.
+        Commands of the same file are handled in order, and different files in parallel.
+
+        Receive: None
+
+        Returns: None
+        """
+
+        self._command_lanes = [ queue.Queue( ) for index in range( COMMAND_LANES ) ]
+        lanes_threads: list = [ self.__process_command_lane( lane ) for lane in self._command_lanes ]
+
+        is_running: bool = True
+
+        while is_running:
+
+            # Sleep until there is a command, and take every other pending one with it
+            batch: list = [ self._command_pool.get( ) ]
+
+            while len( batch ) < COMMANDS_BATCH_SIZE:
+                try:
+                    batch.append( self._command_pool.get_nowait( ) )
+                except queue.Empty:
+                    break
+
+            for command in batch:
+                command: c_command = command
+
+                # None is placed by terminate( )
+                if command is None:
+                    is_running = False
+                    continue
+
+                lane: int = self.__command_lane( command )
+
+                if lane is not None:
+                    self._command_lanes[ lane ].put( command )
+                    continue
+
+                # Commands that affect many files wait for every worker to finish,
+                # and are handled alone
+                for lane_queue in self._command_lanes:
+                    lane_queue.join( )
+
+                self.__execute_command( command )
+
+        for lane_queue in self._command_lanes:
+            lane_queue.put( None )
+
+        for thread in lanes_threads:
+            thread.join( )
+
+        # Commands that were still in the pool on terminate could change files
+        self._files.save_all( )
+
+
+    @standalone_execute
+    def __process_command_lane( self, lane: queue.Queue ):
+        """
+        Process for handling the commands of a single worker.
+
+        Receive:
+        - lane (queue.Queue): Commands of this worker
+
+        Returns: None
+        """
+
+        while True:
+            command: c_command = lane.get( )
+
+            try:
+                if command is None:
+                    return
+                
+                self.__execute_command( command )
+
+            finally:
+                lane.task_done( )
+
+
+    def __command_lane( self, command: c_command ) -> int:
+        """
+        Find the worker of a command, based on its file.
+
+        Receive:
+        - command (c_command): Command to handle
+
+        Returns:
+        - int: Worker index or None if the command must be handled alone
+        """
+
+        command_name:   str     = command.command( )
+        arguments:      list    = command.arguments( )
+
+        if command_name in ( FILES_COMMAND_UPDATE_FILE_NAME, COMMAND_EXTERNAL ):
+            return None
+        
+        if command_name == FILES_COMMAND_APPLY_UPDATE:
+            if arguments[ 0 ] != FILE_UPDATE_CONTENT:
+                return None
+            
+            # Offsets belong to the changes in the selected file of the client
+            file_name: str = command.client( ).selected_file( )
+        else:
+            file_name: str = arguments[ 0 ]
+
+        return hash( file_name ) % COMMAND_LANES
+    
+
+    @safe_call( c_debug.log_error )
+    def __execute_command( self, command: c_command ):
+        """
+        Handle a command and count the time it waited.
+
+        Receive:
+        - command (c_command): Command to handle
+
+        Returns: None
+        """
+
+        self.__record_command_wait( command )
+
+        with c_metrics.histogram( f"command.{ command.command( ) }.handle_seconds" ).time( ):
+            self.__handle_command( command )
+
+
+    def __record_command_wait( self, command: c_command ):
+        """
+        Add the time a command waited in the pool to its statistics.
+
+        Receive:
+        - command (c_command): Command that is about to be handled
+
+        Returns: None
+        """
+
+        wait_time: float = command.age( )
+
+        c_metrics.histogram( f"command.{ command.command( ) }.wait_seconds" ).record( wait_time )
+
+        with self._command_waits_lock:
+            record: list = self._command_waits.setdefault( command.command( ), [ 0, 0.0, 0.0 ] )
+
+            record[ 0 ] += 1
+            record[ 1 ] += wait_time
+            record[ 2 ] = max( record[ 2 ], wait_time )
+
+
+    def command_wait_times( self ) -> dict:
+        """
+        Get how long commands waited in the pool before they were handled.
+
+        Receive: None
+
+        Returns:
+        - dict: Command -> { "count", "average", "max" } in seconds
+        """
+
+        result: dict = { }
+
+        with self._command_waits_lock:
+            records: list = [ ( command, record.copy( ) ) for command, record in self._command_waits.items( ) ]
+
+        for command, record in records:
+            count, total, longest = record
+
+            result[ command ] = { "count": count, "average": total / count, "max": longest }
+
+        return result
+
+
+    @standalone_execute
+    def __process_checkpoint_fields( self ):
+        """
+        Process for periodically saving the clients fields.
+
+        Receive: None
+
+        Returns: None
+        """
+
+        # .wait( ) returns True once terminate( ) is called
+        while not self._shutdown.wait( CHECKPOINT_INTERVAL ):
+
+            for client in self._clients.copy( ):
+                client: c_client_handle = client
+
+                client.save_fields( )
+
+
+    @standalone_execute
+    def __process_maintain_history( self ):
+        """
+        Process for periodically taking files snapshots and compacting their change logs.
+
+        Receive: None
+
+        Returns: None
+        """
+
+        while not self._shutdown.wait( HISTORY_INTERVAL ):
+
+            for file in list( self._files.get_files( ).values( ) ):
+                file: c_virtual_file = file
+
+                # One file at a time, each compaction limits its own disk usage
+                safe_call( c_debug.log_error )( file.maintain_history )( )
+
+                if self._shutdown.is_set( ):
+                    break
+
+
+    def __flush_clients_fields( self, clients: list ):
+        """
+        Save the fields of many clients in parallel.
+
+        Receive:
+        - clients (list): Client handles to save
+
+        Returns: None
+        """
+
+        if len( clients ) == 0:
+            return
+        
+        with ThreadPoolExecutor( max_workers=min( len( clients ), MAX_FLUSH_WORKERS ) ) as executor:
+            for client in clients:
+                executor.submit( client.save_fields )
+
+    # endregion
+
+    # region : Commands
+
+    @safe_call( c_debug.log_error )
+    def __handle_command( self, command: c_command ):
+        """
+        Handle command request.
+
+        Receive:
+        - command (c_command): Command object from client
+
+        Returns: None
+        """
+
+        base_command_callbacks = {
+            FILES_COMMAND_PREPARE_UPDATE:   self.__command_execute_prepare_update,
+            FILES_COMMAND_DISCARD_UPDATE:   self.__command_execute_discard_update,
+            FILES_COMMAND_UPDATE_LINE:      self.__command_execute_commit_update,
+            FILES_COMMAND_DELETE_LINE:      self.__command_execute_commit_delete,
+            FILES_COMMAND_APPLY_UPDATE:     self.__command_execute_accept_offset,
+            FILES_COMMAND_UPDATE_FILE_NAME: self.__command_execute_change_file_name,
+            COMMAND_EXTERNAL:               self.__command_execute_external_changes
+        }
+
+        base_command_callbacks[ command.command( ) ]( command.client( ), command.arguments( ) )
+
+        # Clear the memory from useless command that we processed already
+        del command
+
+    @safe_call( c_debug.log_error )
+    def __command_execute_prepare_update( self, client: c_client_handle, arguments: list ):
+        """
+        Command for prepare line update.
+
+        Receive:
+        - client (c_client_handle): Client handle that requested
+        - arguments (list): Arguments from the command
+
+        Returns: None
+        """
+
+        file_name:      str = arguments[ 0 ]
+        line_number:    int = arguments[ 1 ]
+
+        file: c_virtual_file = client.files( ).search_file( file_name )
+
+        client_username: str = client( "username" ) or "Failed"
+
+        is_locked:  bool    = not file.lock_line( line_number, client_username, client )
+        response:   str     = is_locked and "1" or "0"
+
+        if not is_locked:
+            client.selected_line( line_number )
+
+            self.__broadcast_for_shareable_clients( file, client, self.__broadcast_lock_line, line_number, client_username )
+
+            self.__event_line_lock( file.name( ), line_number, client_username )
+
+        message: c_files_message = self._files.format_message( FILES_COMMAND_PREPARE_RESPONSE, [ file.name( ), str( line_number ), response ] )
+        client.send_quick_message( message )
+
+
+    def __is_lock_owner( self, client: c_client_handle, file: c_virtual_file, line: int ) -> bool:
+        """
+        Check that a line is locked by the client that wants to release it.
+
+        Receive:
+        - client (c_client_handle): Client handle that requested
+        - file (c_virtual_file): File of the line
+        - line (int): Line number
+
+        Returns:
+        - bool: Result. Lowers the client trust factor if not
+        """
+
+        if file.line_session( line ) is client:
+            return True
+
+        client.lower_trust_factor( 10, "Line is not locked by the client" )
+        return False
+
+
+    def __command_execute_discard_update( self, client: c_client_handle, arguments: list ):
+        """
+        Command for discard line update.
+
+        Receive:
+        - client (c_client_handle): Client handle that requested
+        - arguments (list): Arguments from the command
+
+        Returns: None
+        """
+
+        file_name:      str = arguments[ 0 ]
+        line_number:    int = arguments[ 1 ]
+
+        file: c_virtual_file = client.files( ).search_file( file_name )
+
+        if not self.__is_lock_owner( client, file, line_number ):
+            return
+
+        file.unlock_line( line_number )
+        client.selected_line( 0 )
+
+        self.__broadcast_for_shareable_clients( file, client, self.__broadcast_unlock_line, line_number )
+
+        self.__event_line_unlock( file.name( ), line_number )
+
+    
+    def __command_execute_commit_update( self, client: c_client_handle, arguments: list ):
+        """
+        Command for commit line update.
+
+        Receive:
+        - client (c_client_handle): Client handle that requested
+        - arguments (list): Arguments from the command
+
+        Returns: None
+        """
+
+        file_name:      str     = arguments[ 0 ]
+        line_number:    int     = arguments[ 1 ]
+        new_lines:      list    = arguments[ 2 ]
+
+        file: c_virtual_file = client.files( ).search_file( file_name )
+
+        if not self.__is_lock_owner( client, file, line_number ):
+            return
+
+        file.unlock_line( line_number )
+        client.selected_line( 0 )
+
+        file.change_line( line_number, new_lines, { "user": client( "username" ) } )
+
+        # Move every lock below the changed line at once
+        file.shift_locked_lines( line_number, len( new_lines ) - 1 )
+
+        # The payload is the same for every viewer, only the encryption is not
+        frames: list = self.__prepare_update_line( file, line_number, new_lines )
+        self.__broadcast_for_shareable_clients( file, client, self.__broadcast_update_line, line_number, len( new_lines ), frames )
+
+        if not client == self._host_client:
+            self.__correct_host_offset( file, line_number, len( new_lines ) )
+            self.__event_line_update( file.name( ), line_number, new_lines )
+    
+
+    def __command_execute_commit_delete( self, client: c_client_handle, arguments: list ):
+        """
+        Command for commit line delete.
+
+        Receive:
+        - client (c_client_handle): Client handle that requested
+        - arguments (list): Arguments from the command
+
+        Returns: None
+        """
+
+        file_name:      str     = arguments[ 0 ]
+        line_number:    int     = arguments[ 1 ]
+
+        file: c_virtual_file = client.files( ).search_file( file_name )
+
+        if not self.__is_lock_owner( client, file, line_number ):
+            return
+
+        file.unlock_line( line_number )
+        client.selected_line( 0 )
+
+        file.remove_line( line_number, { "user": client( "username" ) } )
+
+        # Move every lock below the removed line at once
+        file.shift_locked_lines( line_number, -1 )
+
+        self.__broadcast_for_shareable_clients( file, client, self.__broadcast_delete_line, line_number )
 
         if not client == self._host_client:
             self.__correct_host_offset( file, line_number, 0 )
@@ -2163,12 +3359,152 @@ class c_host_business_logic:
         new_index:          str = arguments[ 1 ]
         new_default_level:  int = arguments[ 2 ]
 
+        # Connected clients keep the access level they have. The new default is for other clients
+        for connected_client in list( self._clients ):
+            connected_client: c_client_handle = connected_client
+
+            client_files: c_files_manager_protocol = connected_client.files( )
+            client_files.access_level( old_index, client_files.access_level( old_index ) )
+
         file: c_virtual_file = self._files.update_name( old_index, new_index, True )
         file.access_level( new_default_level )
 
         self.__broadcast_for_shareable_clients( None, client, self.__broadcast_change_file_name, old_index, new_index )
 
     
+
+
+    @safe_call( c_debug.log_error )
+    def __command_execute_external_changes( self, client: c_client_handle, arguments: list ):
+        """
+        Command for files that were changed outside the program.
+
+        Receive:
+        - client (c_client_handle): Host client handle
+        - arguments (list): Arguments from the command
+
+        Returns: None
+        """
+
+        paths:                  list    = arguments[ 0 ]
+
+        original_path:          str     = self._information[ "original_path" ]
+        normal_path:            str     = self._information[ "normal_path" ]
+        access_level:           int     = self._information[ "default_access" ]
+        scan_types:             int     = self._information[ "scan_types" ]
+        should_scan_virtual:    bool    = self._information[ "should_scan_virtual" ]
+
+        allowed_file_types = ( ".py", ".cpp", ".hpp", ".c", ".h", ".cs", ".txt" )
+
+        added_files:    list = [ ]
+        edited_paths:   list = [ ]
+
+        for path in paths:
+            name, is_virtual = self.__resolve_watched_path( path )
+
+            if name is None or not name.endswith( allowed_file_types ) or name.endswith( "_changes.txt" ):
+                continue
+
+            file: c_virtual_file = self._files.search_file( name )
+
+            if is_virtual:
+                # Virtual copy was changed
+                
+                if file is not None:
+                    if len( file.locked_lines( ) ) > 0:
+                        edited_paths.append( path )
+                        continue
+
+                    if file.reload( ):
+                        self.__notify_file_changed( file )
+
+                    continue
+
+                if not should_scan_virtual or not os.path.exists( f"{ normal_path }\\{ name }" ):
+                    continue
+
+                file = self._files.create_new_file( name, access_level, True )
+                file.attach( normal_path )
+
+            else:
+                # Original file was changed
+
+                if scan_types == ENUM_SCAN_DISABLE or not os.path.exists( f"{ original_path }\\{ name }" ):
+                    continue
+
+                if file is not None:
+                    if scan_types != ENUM_SCAN_OVERWRITE:
+                        continue
+
+                    if len( file.locked_lines( ) ) > 0:
+                        edited_paths.append( path )
+                        continue
+
+                    r = file.copy( original_path, normal_path )
+                    if r is not None:
+                        c_debug.log_error( r )
+                        continue
+
+                    self.__notify_file_changed( file )
+                    continue
+
+                file = self._files.create_new_file( name, access_level, True )
+                
+                r = file.copy( original_path, normal_path )
+                if r is not None:
+                    self._files.remove_file( name )
+                    c_debug.log_error( r )
+                    continue
+
+            self.__register_file_for_clients( file )
+            added_files.append( file.name( ) )
+
+        if len( added_files ) > 0:
+            self.log_information( f"Found { len( added_files ) } new files" )
+            self.__event_files_refresh( added_files )
+
+        if len( edited_paths ) > 0:
+            # Lines are locked, the change is applied once they are released
+            self.log_information( f"Delayed outside changes of { len( edited_paths ) } files, since they are being edited" )
+
+            retry_timer = threading.Timer( EXTERNAL_RETRY_TIME, self.__on_paths_changed, args=( edited_paths, ) )
+            retry_timer.daemon = True
+            retry_timer.start( )
+
+
+    def __resolve_watched_path( self, path: str ) -> tuple:
+        """
+        Convert a path reported by the watcher into a file name.
+
+        Receive:
+        - path (str): Full path of the changed file
+
+        Returns:
+        - tuple: ( name, is_virtual ). Name is None if the path is not a project file
+        """
+
+        original_path:  str = os.path.abspath( self._information[ "original_path" ] )
+        normal_path:    str = os.path.abspath( self._information[ "normal_path" ] )
+
+        path = os.path.abspath( path )
+
+        # Check the virtual path first, since it is placed inside the original one
+        for root, is_virtual in ( ( normal_path, True ), ( original_path, False ) ):
+            if not path.startswith( root + os.sep ):
+                continue
+
+            name: str = path[ len( root ) + 1: ].replace( os.sep, "\\" )
+
+            if not is_virtual and name.split( "\\" )[ 0 ] == DEFAULT_FOLDER_NAME:
+                return None, False
+            
+            # Same rule as the scan. Hidden folders are not part of the project
+            if any( part.startswith( "." ) for part in name.split( "\\" )[ :-1 ] ):
+                return None, False
+
+            return name, is_virtual
+        
+        return None, False
     # endregion
 
     # region : Broadcasting
@@ -2185,13 +3521,53 @@ class c_host_business_logic:
         Returns: None
         """
 
-        for client in self._clients:
-            client: c_client_handle = client
+        if file is None:
+            clients: list = list( self._clients )
+        else:
+            with self._subscribers_lock:
+                clients: list = list( self._subscribers.get( file, { } ).values( ) )
+
+        clients = [ client for client in clients if exception is None or client != exception ]
+
+        with METRIC_BROADCAST_TIME.time( ):
+            self.__send_broadcast( clients, file, broadcast_function, *args )
+
+
+    def __send_broadcast( self, clients: list, file: c_virtual_file, broadcast_function: any, *args ):
+        """
+        Execute broadcast function for each client, in parallel for many clients.
+
+        Receive:
+        - clients (list): Clients to notify
+        - file (c_virtual_file): Specific shared file
+        - broadcase_function (function): Function to execute for each client
+
+        Returns: None
+        """
+
+        broadcast_pool: ThreadPoolExecutor = self._broadcast_pool
 
-            if ( file is not None and client.selected_file( ) == file.name( ) ) or file is None:
-                
-                if exception is None or client != exception:
-                    broadcast_function( client, file, *args )
+        if broadcast_pool is None or len( clients ) < BROADCAST_POOL_MIN:
+            for client in clients:
+                broadcast_function( client, file, *args )
+
+            return
+
+        try:
+            futures: list = [ broadcast_pool.submit( broadcast_function, client, file, *args ) for client in clients ]
+        except RuntimeError:
+            # The pool was shut down meanwhile
+            for client in clients:
+                broadcast_function( client, file, *args )
+
+            return
+
+        # Wait for everyone, so the next broadcast cannot pass this one
+        for future in as_completed( futures ):
+            error = future.exception( )
+
+            if error is not None:
+                c_debug.log_error( f"Failed to broadcast. { error }" )
 
 
     def __broadcast_lock_line( self, client: c_client_handle, file: c_virtual_file, line: int, username: str ):
@@ -2231,7 +3607,25 @@ class c_host_business_logic:
         client.send_quick_message( message )
     
 
-    def __broadcast_update_line( self, client: c_client_handle, file: c_virtual_file, line: int, new_lines: list ):
+    def __prepare_update_line( self, file: c_virtual_file, line: int, new_lines: list ) -> list:
+        """
+        Serialize a line update once for all the clients.
+
+        Receive:
+        - file (c_virtual_file) File that is shared
+        - line (int): Locked line
+        - new_lines (list): New lines
+
+        Returns:
+        - list: Update message followed by the lines payload
+        """
+
+        message = self._files.format_message( FILES_COMMAND_UPDATE_LINE, [ file.name( ), str( line ), str( len( new_lines ) ) ] )
+
+        return [ message, self._files.pack_lines( new_lines ) ]
+
+
+    def __broadcast_update_line( self, client: c_client_handle, file: c_virtual_file, line: int, lines_count: int, frames: list ):
         """
         Notify the client that a specific line is updated.
 
@@ -2239,33 +3633,22 @@ class c_host_business_logic:
         - client (c_client_handle): Client to notify
         - file (c_virtual_file) File that is shared
         - line (int): Locked line
-        - new_lines (list): New lines
+        - lines_count (int): Amount of new lines
+        - frames (list): Prepared update from __prepare_update_line
 
         Returns: None
         """
 
         client_line: int = client.selected_line( )
-        count_new_lines = len( new_lines ) - 1
+        count_new_lines = lines_count - 1
 
+        # The lock itself was already moved in the lock table
         if client_line > 0 and client_line > line:
 
-            if file.is_line_locked( client_line ):
-                file.unlock_line( client_line )
-                file.lock_line( client_line + count_new_lines )
-
             client.add_offset( count_new_lines )
             client.selected_line( client_line + count_new_lines )
 
-        message = self._files.format_message( FILES_COMMAND_UPDATE_LINE, [ file.name( ), str( line ), str( count_new_lines + 1 ) ] )
-        client.send_quick_message( message )
-
-        for new_line in new_lines:
-            new_line: str = new_line
-
-            if new_line == "":
-                new_line = "\n"
-
-            client.send_quick_bytes( base64.b64encode( new_line.encode( ) ) )
+        client.send_quick_frames( frames )
 
 
     def __broadcast_delete_line( self, client: c_client_handle, file: c_virtual_file, line: int ):
@@ -2282,12 +3665,9 @@ class c_host_business_logic:
 
         client_line: int = client.selected_line( )
 
+        # The lock itself was already moved in the lock table
         if client_line > 0 and client_line > line:
 
-            if file.is_line_locked( client_line ):
-                file.unlock_line( client_line )
-                file.lock_line( client_line - 1 )
-
             client.add_offset( -1 )
             client.selected_line( client_line - 1 )
 
@@ -2308,14 +3688,16 @@ class c_host_business_logic:
         Returns: None
         """
 
+        # The catalog file is already renamed. Only the client's access level is moved
         client_files: c_files_manager_protocol = client.files( )
-        file = client_files.search_file( old_index )
 
-        if not file:
-            return
+        # The client can use the old name until it accepts the rename
+        client_files.update_name( old_index, new_index, True )
 
-        if file.access_level( ) == FILE_ACCESS_LEVEL_HIDDEN:
-            return client.files( ).update_name( old_index, new_index )
+        if client_files.access_level( new_index ) == FILE_ACCESS_LEVEL_HIDDEN:
+            # Hidden files are not announced, so there is nothing to accept
+            client_files.update_name( old_index, new_index )
+            return
         
         message = self._files.format_message( FILES_COMMAND_UPDATE_FILE_NAME, [ old_index, new_index ] )
         client.send_quick_message( message )
@@ -2378,6 +3760,9 @@ class c_host_business_logic:
         Returns: None
         """
 
+        # The scan reads the files from disk
+        self._files.save_all( )
+
         self.__setup_files( )
 
         self.__event_files_refresh( )
@@ -2414,21 +3799,52 @@ class c_host_business_logic:
             c_debug.log_error( r )
 
         # Now we need to setup the files for connected clients
-        if len( self._clients ) == 0:
-            return
+        self.__register_file_for_clients( file )
+
+
+    def __register_file_for_clients( self, file: c_virtual_file ):
+        """
+        Share a new file with the connected clients.
 
+        Receive:
+        - file (c_virtual_file): New host file
+
+        Returns: None
+        """
+
+        # The file is already in the shared catalog. Only notify the clients
         for client in self._clients:
             client: c_client_handle = client
 
-            client_files: c_files_manager_protocol = client.files( )
-            
-            for file_index in self._files.get_files( ):
-                v_file: c_virtual_file = self._files.search_file( file_index )
+            client.change_access_level( file.name( ), file.access_level( ) )
+
+
+    def __notify_file_changed( self, file: c_virtual_file ):
+        """
+        Notify the clients that can see a file, that its content was changed.
+        Clients that have it opened receive the new content.
+
+        Receive:
+        - file (c_virtual_file): Changed host file
+
+        Returns: None
+        """
+
+        for client in self._clients:
+            client: c_client_handle = client
+
+            access_level: int = client.files( ).access_level( file.name( ) )
+            if access_level == FILE_ACCESS_LEVEL_HIDDEN:
+                continue
 
-                if v_file and not client_files.search_file( file_index ):
-                    client_files.copy( v_file )
+            message = self._files.format_message( FILES_COMMAND_UPDATE_FILE, [ file.name( ), str( access_level ) ] )
+            client.send_quick_message( message )
 
-                    client.change_access_level( v_file.name( ), v_file.access_level( ) )
+            if client.selected_file( ) == file.name( ):
+                client.refresh_file( file.name( ) )
+
+        if self._host_client.selected_file( ) == file.name( ):
+            self.request_file( file.name( ) )( )
 
 
     def __setup_path( self ):
@@ -2476,6 +3892,7 @@ class c_host_business_logic:
     def __dump_path( self, path: str ):
         """
         Dump specific path.
+        Files that did not change since the last import are only attached, the rest are copied in parallel.
 
         Receive: 
         - path (str): Full path to a folder to dump
@@ -2488,6 +3905,66 @@ class c_host_business_logic:
         access_level            = self._information[ "default_access" ]
         should_avoid_rescanning = self._information[ "scan_types" ] == ENUM_SCAN_CREATE_NEW
 
+        found_files: list = [ ]
+        self.__scan_path( path, found_files )
+
+        # Avoid recreating the same file.
+        if should_avoid_rescanning:
+            found_files = [ information for information in found_files if self._files.search_file( information[ 0 ] ) is None ]
+
+        manifest:       dict    = self.__load_manifest( )
+        new_manifest:   dict    = { }
+
+        total:  int = len( found_files )
+        done:   int = 0
+        step:   int = max( total // 100, 1 )
+
+        self.__event_files_progress( done, total )
+
+        with ThreadPoolExecutor( max_workers=MAX_IMPORT_WORKERS ) as executor:
+            tasks: dict = { }
+
+            for fixed_name, stat in found_files:
+                
+                # Register here, the workers only touch the disk
+                file = self._files.create_new_file( fixed_name, access_level, True )
+                task = executor.submit( self.__import_file, file, stat, manifest.get( fixed_name ), original_path, normal_path )
+
+                tasks[ task ] = fixed_name
+
+            for task in as_completed( tasks ):
+                fixed_name: str = tasks[ task ]
+
+                try:
+                    new_manifest[ fixed_name ] = task.result( )
+                except Exception as e:
+                    c_debug.log_error( str( e ) )
+
+                done += 1
+                if done % step == 0 or done == total:
+                    self.__event_files_progress( done, total )
+
+        # Files that were skipped this time are still valid
+        if should_avoid_rescanning:
+            manifest.update( new_manifest )
+            new_manifest = manifest
+
+        self.__save_manifest( new_manifest )
+
+
+    def __scan_path( self, path: str, result: list ):
+        """
+        Collect the allowed files in a path.
+
+        Receive: 
+        - path (str): Full path to a folder to scan
+        - result (list): List to add ( name, stat ) of each found file
+
+        Returns: None
+        """
+
+        original_path = self._information[ "original_path" ]
+
         allowed_file_types = ( ".py", ".cpp", ".hpp", ".c", ".h", ".cs", ".txt" )
 
         with os.scandir( path ) as entries:
@@ -2503,20 +3980,130 @@ class c_host_business_logic:
                     if not fixed_name.endswith( allowed_file_types ):
                         continue
 
-                    # Avoid recreating the same file.
-                    if should_avoid_rescanning and self._files.search_file( fixed_name ) is not None:
-                        continue
-                    
-                    file = self._files.create_new_file( fixed_name, access_level, True )
-                    r = file.copy( original_path, normal_path )
-
-                    if r is not None:
-                        c_debug.log_error( r )
+                    result.append( ( fixed_name, entry.stat( ) ) )
 
                 if entry.is_dir( ) and entry.name != DEFAULT_FOLDER_NAME and not entry.name.startswith( "." ):
                     # Is Folder
                     
-                    self.__dump_path( f"{ path }\\{ entry.name }" )
+                    self.__scan_path( f"{ path }\\{ entry.name }", result )
+
+
+    def __import_file( self, file: c_virtual_file, stat: os.stat_result, record: dict, original_path: str, normal_path: str ) -> dict:
+        """
+        Copy a single file, unless the manifest shows that its copy is up to date.
+        Executed on the import workers.
+
+        Receive:
+        - file (c_virtual_file): Registered virtual file
+        - stat (os.stat_result): Stat of the original file
+        - record (dict): Manifest record from the last import. None if new
+        - original_path (str): Project path
+        - normal_path (str): Virtual files path
+
+        Returns:
+        - dict: Manifest record of the file
+        """
+
+        source_path: str = f"{ original_path }\\{ file.name( ) }"
+        target_path: str = f"{ normal_path }\\{ file.name( ) }"
+
+        digest: str = None
+
+        if record is not None and os.path.exists( target_path ):
+            target_stat = os.stat( target_path )
+
+            # If the copy was edited after the import, it must be overwritten
+            is_copy_untouched: bool = record[ "copy_size" ] == target_stat.st_size and record[ "copy_mtime" ] == target_stat.st_mtime_ns
+            is_same_size:      bool = record[ "size" ] == stat.st_size
+
+            if is_copy_untouched and is_same_size:
+
+                # Same size but touched. Only the content can tell
+                if record[ "mtime" ] != stat.st_mtime_ns:
+                    digest = self.__hash_file( source_path )
+
+                if record[ "mtime" ] == stat.st_mtime_ns or digest == record[ "hash" ]:
+                    file.attach( normal_path )
+
+                    record[ "mtime" ] = stat.st_mtime_ns
+                    return record
+
+        r = file.copy( original_path, normal_path )
+        if r is not None:
+            raise Exception( r )
+        
+        target_stat = os.stat( target_path )
+
+        return {
+            "size":         stat.st_size,
+            "mtime":        stat.st_mtime_ns,
+            "hash":         digest or self.__hash_file( target_path ),
+
+            "copy_size":    target_stat.st_size,
+            "copy_mtime":   target_stat.st_mtime_ns
+        }
+    
+
+    def __hash_file( self, path: str ) -> str:
+        """
+        Calculate the digest of a file on disk.
+
+        Receive:
+        - path (str): Full path of the file
+
+        Returns:
+        - str: Hex BLAKE2b digest
+        """
+
+        digest = hashlib.blake2b( digest_size=DIGEST_SIZE )
+
+        with open( path, "rb" ) as f:
+            for chunk in iter( lambda: f.read( INDEX_CHUNK_SIZE ), b"" ):
+                digest.update( chunk )
+
+        return digest.hexdigest( )
+    
+
+    def __load_manifest( self ) -> dict:
+        """
+        Load the manifest of the last import.
+
+        Receive: None
+
+        Returns:
+        - dict: File name -> record
+        """
+
+        path: str = f"{ self._information[ 'normal_path' ] }\\{ MANIFEST_FILE_NAME }"
+        if not os.path.exists( path ):
+            return { }
+        
+        try:
+            with open( path, "r" ) as f:
+                return json.load( f )
+            
+        except Exception as e:
+            c_debug.log_error( f"Failed to load import manifest. { e }" )
+            return { }
+        
+
+    def __save_manifest( self, manifest: dict ):
+        """
+        Save the manifest of the import.
+
+        Receive:
+        - manifest (dict): File name -> record
+
+        Returns: None
+        """
+
+        path:       str = f"{ self._information[ 'normal_path' ] }\\{ MANIFEST_FILE_NAME }"
+        temp_path:  str = f"{ path }.tmp"
+
+        with open( temp_path, "w" ) as f:
+            json.dump( manifest, f )
+
+        os.replace( temp_path, path )
     
 
     def __dump_previous_path( self, path: str ):
@@ -2587,7 +4174,7 @@ class c_host_business_logic:
         self.__event_file_update( file )
 
         for line in file.locked_lines( ):
-            self.__event_line_lock( file.name( ), line )
+            self.__event_line_lock( file.name( ), line, file.line_owner( line ) or "?" )
     
 
     def request_line( self, file_name: str, line: int ):
@@ -2605,12 +4192,10 @@ class c_host_business_logic:
         if not file:
             return
         
-        # First check if line is locked
-        is_locked: bool = file.is_line_locked( line )
-        if is_locked:
+        # Lock the line only if it is free
+        if not file.lock_line( line, self._information[ "username" ], self._host_client ):
             return
         
-        file.lock_line( line )
         self._host_client.selected_line( line )
 
         self.__broadcast_for_shareable_clients( file, None, self.__broadcast_lock_line, line, self._information[ "username" ] )
@@ -2692,6 +4277,61 @@ class c_host_business_logic:
         self._command_pool.put( new_command )
 
     
+    def save_files( self ):
+        """
+        Write all the pending files changes to disk.
+
+        Receive: None
+
+        Returns: None
+        """
+
+        self._files.save_all( )
+
+    
+    def file_history( self, file_name: str, start_line: int = None, end_line: int = None, user: str = None, since: float = None, until: float = None, limit: int = HISTORY_LIMIT ) -> list:
+        """
+        Find changes of a file by line range, user and time.
+
+        Receive:
+        - file_name (str): File name
+        - start_line (int, optional): First line of the range
+        - end_line (int, optional): Last line of the range
+        - user (str, optional): Username
+        - since (float, optional): Earliest time, in seconds since epoch
+        - until (float, optional): Latest time, in seconds since epoch
+        - limit (int, optional): Maximum amount of changes
+
+        Returns:
+        - list: Changes, newest first. Empty if the file has no history
+        """
+
+        file: c_virtual_file = self._files.search_file( file_name )
+        if not file:
+            return [ ]
+        
+        return file.history( start_line, end_line, user, since, until, limit ) or [ ]
+    
+
+    def blame_line( self, file_name: str, line: int ) -> dict:
+        """
+        Find who changed a line of a file, and when.
+
+        Receive:
+        - file_name (str): File name
+        - line (int): Line number ( starts from 1 )
+
+        Returns:
+        - dict: Last change that wrote this line or None
+        """
+
+        file: c_virtual_file = self._files.search_file( file_name )
+        if not file:
+            return None
+        
+        return file.blame( line )
+
+
     def find_file_information( self, file_name: str ) -> tuple:
         """
         Search and file information about a specific registered file.
@@ -2768,28 +4408,26 @@ class c_host_business_logic:
         event.invoke( )
 
     
-    def __event_client_connected( self, client_socket: socket, client_address: tuple ):
+    def __create_client( self ) -> c_client_handle:
         """
-        Event when a client connected to the server.
+        Create a client handle for an admitted connection.
 
-        Receive:    
-        - client_socket (socket): Client socket
-        - client_address (tuple): Client address
+        Receive: None
 
-        Returns: None
+        Returns:
+        - c_client_handle: New client handle
         """
 
-        # Create a new client handle
+        # Create a new client handle.
+        # It is listed in the clients only after the handshake succeeds
         new_client = c_client_handle( )
 
-        # Save the client object
-        self._clients.append( new_client )
-
         # Set the client events
         host_log_fn = lambda event: self.log_information( event( "message" ), event( "save_in_app" ), event( "log_type" ), event( "user" ) )
 
         new_client.set_event( "on_client_disconnected", self.__event_client_disconnected,   "Host Client Disconnect" )
         new_client.set_event( "on_client_command",      self.__event_client_command,        "Host Client Command" )
+        new_client.set_event( "on_client_file_selected",self.__event_client_file_selected,  "Host Client File Selected" )
         new_client.set_event( "on_client_log",          host_log_fn,                        "Host Logging" )
 
         # Load path for database.
@@ -2798,8 +4436,17 @@ class c_host_business_logic:
         # Attach files for client
         new_client.load_files( self._files )
 
-        # Connect the client
-        new_client.connect( client_socket, client_address )
+        return new_client
+
+
+    def __event_client_connected( self ):
+        """
+        Event when a client connected to the server.
+
+        Receive: None
+
+        Returns: None
+        """
 
         # Call the event
         event: c_event = self._events[ "on_client_connected" ]
@@ -2816,16 +4463,83 @@ class c_host_business_logic:
         Returns: None
         """
 
-        if event( "remove" ) == 1:
-            client: c_client_handle = event( "client" )
+        client: c_client_handle = event( "client" )
+
+        # Disconnected client will not receive broadcasts anymore
+        self.__subscribe_client( client, None )
 
+        if event( "remove" ) == 1:
             # Remove the client from the list
-            self._clients.remove( client )
+            self.__remove_client( client )
 
         # Call the event
         event: c_event = self._events[ "on_client_disconnected" ]
         event.invoke( )
 
+
+    def __event_client_file_selected( self, event ):
+        """
+        Event when a client opened another file.
+
+        Receive:    
+        - event (callable): Event information
+
+        Returns: None
+        """
+
+        self.__subscribe_client( event( "client" ), event( "new_file" ) )
+
+
+    def __subscribe_client( self, client: c_client_handle, file: c_virtual_file ):
+        """
+        Move a client to the subscribers of a file.
+
+        Receive:    
+        - client (c_client_handle): Client handle
+        - file (c_virtual_file): Opened file or None to only unsubscribe
+
+        Returns: None
+        """
+
+        # Client handles compare by address, so they are kept by identity
+        key: int = id( client )
+
+        with self._subscribers_lock:
+            old_file: c_virtual_file = self._subscriptions.pop( key, None )
+
+            if old_file is not None:
+                subscribers: dict = self._subscribers.get( old_file )
+
+                if subscribers is not None:
+                    subscribers.pop( key, None )
+
+                    if len( subscribers ) == 0:
+                        del self._subscribers[ old_file ]
+
+            if file is not None:
+                self._subscriptions[ key ] = file
+                self._subscribers.setdefault( file, { } )[ key ] = client
+
+    
+    def __remove_client( self, client: c_client_handle ):
+        """
+        Remove a client handle and wake the admission process.
+
+        Receive:    
+        - client (c_client_handle): Client handle
+
+        Returns: None
+        """
+
+        with self._admission:
+            # Handles compare by address, which is not set before the connection
+            for index, other in enumerate( self._clients ):
+                if other is client:
+                    del self._clients[ index ]
+                    break
+
+            self._admission.notify_all( )
+
     
     def __event_client_command( self, event ):
         """
@@ -2849,22 +4563,24 @@ class c_host_business_logic:
         event.invoke( )
 
     
-    def __event_files_refresh( self ):
+    def __event_files_refresh( self, result: list = None ):
         """
         Event when the host files are refreshed.
 
-        Receive: None
+        Receive:
+        - result (list, optional): Only these files names. All the files by default
 
         Returns: None
         """
 
-        files = self._files.get_files( )
+        if result is None:
+            files = self._files.get_files( )
 
-        result = [ ]
-        for index in files:
-            file: c_virtual_file = files[ index ]
+            result = [ ]
+            for index in files:
+                file: c_virtual_file = files[ index ]
 
-            result.append( file.name( ) )
+                result.append( file.name( ) )
 
         event: c_event = self._events[ "on_files_refresh" ]
         event.attach( "files", result )
@@ -2872,6 +4588,25 @@ class c_host_business_logic:
         event.invoke( )
 
 
+    def __event_files_progress( self, done: int, total: int ):
+        """
+        Event when the project import makes progress.
+
+        Receive:
+        - done (int): Imported files
+        - total (int): Files to import
+
+        Returns: None
+        """
+
+        event: c_event = self._events[ "on_files_progress" ]
+
+        event.attach( "done",   done )
+        event.attach( "total",  total )
+
+        event.invoke( )
+
+
     def __event_file_set( self, file: c_virtual_file ):
         """
         Event when the the host user request file.
@@ -3071,12 +4806,9 @@ class c_host_business_logic:
         client_line: int = self._host_client.selected_line( )
         count_new_lines = new_lines - 1
 
+        # The lock itself was already moved in the lock table
         if client_line > 0 and client_line > line:
 
-            if file.is_line_locked( client_line ):
-                file.unlock_line( client_line )
-                file.lock_line( client_line + count_new_lines )
-
             self._host_client.selected_line( client_line + count_new_lines )
 
 
@@ -61,6 +61,7 @@ class c_host_gui:
     _solution_explorer:         c_solution_explorer
     _button_dump_path:          c_button
     _button_add_file:           c_button
+    _button_save_files:         c_button
 
     _opened_what:               int
 
@@ -144,6 +145,7 @@ class c_host_gui:
         """
 
         self._logic.set_event( "on_files_refresh",  self.__event_update_files_list, "gui_update_files_list",    True )
+        self._logic.set_event( "on_files_progress", self.__event_files_progress,    "gui_files_progress",       True )
         self._logic.set_event( "on_file_set",       self.__event_clear_editor,      "gui_clear_editor",         True )
         self._logic.set_event( "on_file_update",    self.__event_add_editor_line,   "gui_update_editor",        True )
         self._logic.set_event( "on_accept_line",    self.__event_accept_line,       "gui_editor_accept_line",   True )
@@ -196,6 +198,7 @@ class c_host_gui:
         self._application.create_image( "title_loading",        execution_directory + TITLE_ICON_LOADING,      vector( 500, 170 ) )
         
         self._temp[ "setup_process" ] = 0
+        self._temp[ "import_progress" ] = ""
         
         self._application_config.wallpaper = self._application.image( "wallpaper_blurred" )
 
@@ -435,6 +438,12 @@ class c_host_gui:
             image_size: vector = image.size( )
             render.image( image, vector( screen.x * 0.3 - image_size.x / 2 - values.x, start_box.y + 10 ), color( ) * values.y )
 
+        # Project import progress while loading
+        import_progress: str = self._temp[ "import_progress" ]
+        if selected == 3 and import_progress != "":
+            text_size: vector = render.measure_text( self._general_font, import_progress )
+            render.text( self._general_font, vector( screen.x * 0.75 - text_size.x / 2, screen.y * 0.5 - text_size.y / 2 ), color( ) * fade, import_progress )
+
     
     def __scene_setup_draw_instructions( self ):
         """
@@ -804,6 +813,7 @@ class c_host_gui:
         info_icon:      c_image = self._application.image( "icon_info" )
         add_file_icon:  c_image = self._application.image( "icon_addfile" )
         refresh_icon:   c_image = self._application.image( "icon_refresh" )
+        save_icon:      c_image = self._application.image( "icon_check" )
 
         solution_config = solution_explorer_config_t( )
         solution_config.folder_icon = self._application.image( "icon_folder" )
@@ -817,6 +827,7 @@ class c_host_gui:
         self._solution_explorer = c_solution_explorer( self._scene_project, vector( 50, 140 ), vector( 250, 500 ), self._general_font, solution_config )
         self._button_dump_path  = c_button( self._scene_project, vector( 50, 660 ), 40, self._general_font, refresh_icon, "Refresh path", self.__callback_on_press_refresh_path )
         self._button_add_file   = c_button( self._scene_project, vector( 50, 720 ), 40, self._general_font, add_file_icon, "Add file", self.__callback_on_press_new_file )
+        self._button_save_files = c_button( self._scene_project, vector( 50, 780 ), 40, self._general_font, save_icon, "Save files", self.__callback_on_press_save_files )
 
         self._button_share  = c_button( self._scene_project, vector( 50, 140 ), 40, self._general_font, share_icon, "Share", self.__callback_on_press_share )
         self._button_users  = c_button( self._scene_project, vector( 50, 200 ), 40, self._general_font, user_icon, "Users", self.__callback_on_press_users )
@@ -932,6 +943,7 @@ class c_host_gui:
         self._solution_explorer.visible(    current[ 0 ] )
         self._button_dump_path.visible(     current[ 0 ] )
         self._button_add_file.visible(      current[ 0 ] )
+        self._button_save_files.visible(    current[ 0 ] )
         
         self._button_share.visible(         current[ 1 ] )
         self._button_users.visible(         current[ 1 ] )
@@ -1278,6 +1290,18 @@ class c_host_gui:
 
         self._logic.complete_setup_files( )
 
+
+    def __callback_on_press_save_files( self ):
+        """
+        Callback to write all the pending files changes to disk.
+
+        Receive: None
+
+        Returns: None
+        """
+
+        self._logic.save_files( )
+
     
     def __callback_on_press_new_file( self ):
         """
@@ -1412,6 +1436,64 @@ class c_host_gui:
             new_window.show( False )
 
         c_button( new_window, vector( 10, 250 ), 40, self._general_font, self._application.image( "icon_check" ), "Update File details", callback_on_file_details_update )
+        c_button( new_window, vector( 280, 250 ), 40, self._general_font, self._application.image( "icon_visible" ), "History", self.__callback_show_file_history( file_index ) )
+
+
+    @static_arguments
+    def __callback_show_file_history( self, file_index: str ):
+        """
+        Callback to init a window to search the changes history of a file.
+
+        Receive:
+        - file_index (str): File name
+
+        Returns: None
+        """
+
+        window_config = window_config_t( )
+        window_config.show_bar      = True
+        window_config.title_font    = self._general_font
+        window_config.bar_title     = f"{ file_index } history"
+
+        window_size:    vector  = vector( 900, 600 )
+        results:        queue.Queue = queue.Queue( )
+
+        new_window: c_window = self._scene_project.create_window( vector( 350, 200 ), window_size, window_config )
+
+        lines_input:    c_text_input    = c_text_input( new_window, vector( 10, 10 ), 40, vector( 200, 30 ), self._general_font, self._application.image( "icon_file" ), "lines ( 10 or 10-20 )", "" )
+        user_input:     c_text_input    = c_text_input( new_window, vector( 270, 10 ), 40, vector( 200, 30 ), self._general_font, self._application.image( "icon_username" ), "username", "" )
+
+        c_multiline_label( new_window, vector( 0, 60 ), vector( window_size.x, window_size.y - 60 ), self._general_font, results )
+
+        def format_change( change: dict ) -> str:
+            text: str = f"#{ change[ 'seq' ] } { change.get( 'time', '?' ) } { change.get( 'user', '?' ) } line { change[ 'line' ] } : - { change.get( 'removed', '' ) }"
+
+            if "added" in change:
+                text = f"{ text } + { ' | '.join( change[ 'added' ] ) }"
+
+            return text
+
+        @safe_call( c_debug.log_error )
+        def callback_on_search( ):
+            results.queue.clear( )
+
+            lines:      list    = [ math.cast_to_number( value ) for value in lines_input.get( ).split( "-" ) if value.strip( ) != "" ]
+            user:       str     = user_input.get( ).strip( ) or None
+
+            start_line: int     = len( lines ) > 0 and lines[ 0 ] or None
+            end_line:   int     = len( lines ) > 1 and lines[ 1 ] or start_line
+
+            # The label draws the last item at the top
+            for change in reversed( self._logic.file_history( file_index, start_line, end_line, user ) ):
+                results.put_nowait( format_change( change ) )
+
+            if start_line is not None and start_line == end_line:
+                change: dict = self._logic.blame_line( file_index, start_line )
+
+                if change is not None:
+                    results.put_nowait( f"Current line { start_line } was written by { format_change( change ) }" )
+
+        c_button( new_window, vector( 530, 10 ), 40, self._general_font, self._application.image( "icon_check" ), "Search", callback_on_search )
 
     # endregion
 
@@ -1454,6 +1536,22 @@ class c_host_gui:
             # self._solution_explorer.add_item( file, lambda: print( f"Left clicked on { file }" ) )
     
 
+    def __event_files_progress( self, event ):
+        """
+        Event callback to show the project import progress.
+
+        Receive :
+        - event (callable): Event information
+
+        Returns: None
+        """
+
+        done:   int = event( "done" )
+        total:  int = event( "total" )
+
+        self._temp[ "import_progress" ] = f"Importing files { done } / { total }"
+    
+
     def __event_clear_editor( self, event ):
         """
         Event callback for clearing the editor.
@@ -0,0 +1,664 @@
+"""
+This file is not official part of the Digital Editor project, but a side script for measurements.
+
+Headless load generator. Connects many simulated clients ( user business logic without the GUI ) to a host.
+Each client opens a file and keeps locking random lines, then updates, deletes or discards them at a target rate.
+At the end it prints the throughput, the lock and edit propagation latency, and the host CPU usage.
+
+The host runs in a child process by default, so its CPU time is measured without the clients.
+"""
+
+from host.business_logic        import *
+from user.business_logic        import c_user_business_logic
+from utilities.metrics          import c_counter, c_histogram
+
+import user.business_logic      as user_logic
+import multiprocessing
+import threading
+import argparse
+import tempfile
+import random
+import shutil
+import socket
+import base64
+import time
+import os
+
+PASSWORD:           str     = "L0ad!Password"
+HOST_USERNAME:      str     = "load_host"
+CLIENT_USERNAME:    str     = "load_{}"
+
+LINE_MARKER:        str     = "#load"   # Updated lines carry the marker, the sender and the send time
+
+TIMEOUT_MESSAGE:    float   = 30.0      # Registration answer waits for the host password hashing of every client before it
+TIMEOUT_FILES:      float   = 10.0
+TIMEOUT_LOCK:       float   = 5.0
+TIMEOUT_HOST:       float   = 60.0
+
+SETTLE_TIME:        float   = 0.2       # Files list and content have no end message, they are done once nothing arrives for a while
+RELEASE_GAP:        float   = 0.02      # Releases and offsets are not answered. The gap lets the host apply them before the next request
+
+DEFAULT_MIX:        str     = "update=6,delete=2,discard=2"
+OPERATIONS:         tuple   = ( "update", "delete", "discard" )
+
+
+class c_simulated_client:
+
+    _index:         int
+    _name:          str
+    _logic:         c_user_business_logic
+
+    _files:         list    # Editable files from the host
+    _file:          str
+    _lines:         int     # Lines in the opened file, as this client knows them
+    _line:          int     # Locked line, in the host numbering. 0 if nothing is locked
+    _sequence:      int
+    _offset_time:   float   # Last time an offset was accepted
+
+    _lock:          threading.Lock
+    _files_ready:   threading.Event
+    _file_ready:    threading.Event
+    _response:      threading.Event
+    _accepted:      bool
+    _connected:     bool
+
+    _report:        "c_load_report"
+
+    def __init__( self, index: int, report: "c_load_report", cache_folder: str ):
+        """
+        Default constructor for simulated client.
+
+        Receive:
+        - index (int): Client index, used for the username
+        - report (c_load_report): Shared measurements
+        - cache_folder (str): Folder for the received files cache of this client
+
+        Returns:
+        - c_simulated_client: Simulated client object
+        """
+
+        self._index     = index
+        self._name      = CLIENT_USERNAME.format( index )
+        self._report    = report
+
+        self._file      = None
+        self._lines     = 0
+        self._line      = 0
+        self._sequence  = 0
+
+        self._offset_time   = 0.0
+
+        self._lock          = threading.Lock( )
+        self._files_ready   = threading.Event( )
+        self._file_ready    = threading.Event( )
+        self._response      = threading.Event( )
+        self._accepted      = False
+        self._connected     = False
+        self._files         = [ ]
+
+        # Every client reads the cache folder when created. An absolute path keeps them apart
+        user_logic.CACHE_FOLDER = cache_folder
+        self._logic = c_user_business_logic( )
+
+        self._logic.set_event( "on_file_register",      self.__event_file_register,     "load_file_register" )
+        self._logic.set_event( "on_register_files",     self.__event_register_files,    "load_register_files",  False )
+        self._logic.set_event( "on_file_set",           self.__event_file_set,          "load_file_set" )
+        self._logic.set_event( "on_file_update",        self.__event_file_update,       "load_file_update" )
+        self._logic.set_event( "on_accept_line",        self.__event_accept_line,       "load_accept_line" )
+        self._logic.set_event( "on_line_update",        self.__event_line_update,       "load_line_update" )
+        self._logic.set_event( "on_line_delete",        self.__event_line_delete,       "load_line_delete" )
+        self._logic.set_event( "on_post_disconnect",    self.__event_disconnect,        "load_disconnect",      False )
+
+    # region : Setup
+
+    def connect( self, code: str ) -> bool:
+        """
+        Register a new user, or log in if it already exists on the host.
+
+        Receive:
+        - code (str): Project code
+
+        Returns:
+        - bool: Is connected
+        """
+
+        for register_type in ( "Register", "Login" ):
+            if self._logic.connect( code, self._name, PASSWORD, register_type ):
+                self._connected = True
+                return True
+
+        print( f"{ self._name } failed to connect : { self._logic( 'last_error' ) }" )
+        return False
+
+
+    def open_file( self, index: int ) -> bool:
+        """
+        Open one of the editable files.
+
+        Receive:
+        - index (int): Index of the file, wraps around the files count
+
+        Returns:
+        - bool: Is the file content received
+        """
+
+        # The files list response comes before the files themselves
+        if not self._files_ready.wait( TIMEOUT_FILES ) or settle( lambda: len( self._files ) ) == 0:
+            print( f"{ self._name } did not get any editable file" )
+            return False
+
+        self._file = sorted( self._files )[ index % len( self._files ) ]
+        self._logic.request_file( self._file )
+
+        if not self._file_ready.wait( TIMEOUT_FILES ):
+            print( f"{ self._name } did not get { self._file }" )
+            return False
+
+        return settle( lambda: self._lines ) > 0
+
+
+    def disconnect( self ):
+
+        if self._connected:
+            self._connected = False
+            self._logic.disconnect( )
+
+    # endregion
+
+    # region : Load
+
+    def run( self, deadline: float, rate: float, weights: list, window: int, hold: float ):
+        """
+        Run edit cycles until the deadline.
+
+        Receive:
+        - deadline (float): perf_counter time to stop at
+        - rate (float): Cycles per second
+        - weights (list): Weight for each of the OPERATIONS
+        - window (int): Lock only the first lines. 0 for the whole file
+        - hold (float): Seconds to hold a lock before releasing it
+
+        Returns: None
+        """
+
+        generator   = random.Random( self._index )
+        interval    = 1 / rate
+        next_cycle  = time.perf_counter( ) + generator.random( ) * interval
+
+        while self._connected:
+            now: float = time.perf_counter( )
+            if now >= deadline:
+                break
+
+            if now < next_cycle:
+                time.sleep( min( next_cycle, deadline ) - now )
+                continue
+
+            # Do not send a burst to catch up, if a cycle took too long
+            next_cycle = max( next_cycle + interval, now )
+
+            if not self.__cycle( generator, weights, window, hold ):
+                break
+
+
+    def __cycle( self, generator: random.Random, weights: list, window: int, hold: float ) -> bool:
+        """
+        Lock a line and change it.
+
+        Receive:
+        - generator (random.Random): Random values source
+        - weights (list): Weight for each of the OPERATIONS
+        - window (int): Lock only the first lines. 0 for the whole file
+        - hold (float): Seconds to hold a lock before releasing it
+
+        Returns:
+        - bool: Can continue
+        """
+
+        with self._lock:
+            lines: int = window > 0 and min( window, self._lines ) or self._lines
+            line:  int = generator.randint( 1, max( lines, 1 ) )
+
+            self._response.clear( )
+            self._logic.request_line( self._file, line )
+
+        sent: float = time.perf_counter( )
+
+        if not self._response.wait( TIMEOUT_LOCK ):
+            # The host does not answer requests it refuses, the lock state is unknown from now on
+            self._report.operations[ "stalled" ].add( )
+            return False
+
+        self._report.lock_latency.record( time.perf_counter( ) - sent )
+
+        if not self._accepted:
+            self._report.operations[ "rejected" ].add( )
+            return True
+
+        self._report.operations[ "lock" ].add( )
+
+        if hold > 0:
+            time.sleep( hold )
+
+        operation: str = generator.choices( OPERATIONS, weights )[ 0 ]
+
+        offset_wait: float = self._offset_time + RELEASE_GAP - time.perf_counter( )
+        if offset_wait > 0:
+            time.sleep( offset_wait )
+
+        with self._lock:
+            if operation == "delete" and self._lines <= 1:
+                operation = "discard"
+
+            if operation == "update":
+                self._sequence += 1
+                new_lines: list = [ f"{ LINE_MARKER } { self._name } { self._sequence } { time.perf_counter( ):.6f}" ]
+
+                # Deletes shrink the file, updates bring it back to the initial size
+                if self._lines < self._report.initial_lines:
+                    new_lines.append( "" )
+
+                self._logic.update_line( self._file, self._line, new_lines )
+                self._lines += len( new_lines ) - 1
+
+            elif operation == "delete":
+                self._logic.delete_line( self._file, self._line )
+                self._lines -= 1
+
+            else:
+                self._logic.discard_line( self._file, self._line )
+
+            self._line = 0
+
+        self._report.operations[ operation ].add( )
+
+        time.sleep( RELEASE_GAP )
+        return True
+
+    # endregion
+
+    # region : Events
+
+    def __event_file_register( self, event ):
+
+        if event( "access_level" ) == FILE_ACCESS_LEVEL_EDIT:
+            self._files.append( event( "file" ) )
+
+
+    def __event_register_files( self ):
+        self._files_ready.set( )
+
+
+    def __event_file_set( self, event ):
+
+        if event( "file" ) != self._file:
+            return
+
+        self._lines = 0
+        self._file_ready.set( )
+
+
+    def __event_file_update( self, event ):
+        self._lines += 1
+
+
+    def __event_accept_line( self, event ):
+
+        if event( "file" ) != self._file:
+            return
+
+        with self._lock:
+            self._accepted = event( "accept" )
+            self._line     = self._accepted and event( "line" ) or 0
+
+        self._response.set( )
+
+
+    def __event_line_update( self, event ):
+
+        received:   float   = time.perf_counter( )
+
+        file:       str     = event( "file" )
+        line:       int     = event( "line" )
+        new_lines:  list    = event( "new_lines" )
+
+        if file != self._file:
+            return
+
+        with self._lock:
+            self._lines += len( new_lines ) - 1
+
+            # Same as the editor. Lines above the locked one moved it, the host waits for the offset to be accepted
+            if self._line > line:
+                self._line += len( new_lines ) - 1
+                self._logic.accept_offset( file, len( new_lines ) - 1 )
+
+                self._offset_time = time.perf_counter( )
+
+        fields: list = len( new_lines ) > 0 and new_lines[ 0 ].split( " " ) or [ ]
+        if len( fields ) == 4 and fields[ 0 ] == LINE_MARKER:
+            self._report.propagation_latency.record( received - float( fields[ 3 ] ) )
+
+
+    def __event_line_delete( self, event ):
+
+        file:   str = event( "file" )
+        line:   int = event( "line" )
+
+        if file != self._file:
+            return
+
+        with self._lock:
+            self._lines -= 1
+
+            if self._line > line:
+                self._line -= 1
+                self._logic.accept_offset( file, -1 )
+
+                self._offset_time = time.perf_counter( )
+
+
+    def __event_disconnect( self ):
+
+        if self._connected:
+            self._report.operations[ "disconnected" ].add( )
+
+        self._connected = False
+        self._response.set( )
+
+    # endregion
+
+
+class c_load_report:
+
+    operations:             dict    # Name -> c_counter
+    lock_latency:           c_histogram
+    propagation_latency:    c_histogram
+    initial_lines:          int
+
+    def __init__( self, initial_lines: int ):
+
+        self.operations             = { name: c_counter( ) for name in ( "lock", "rejected", *OPERATIONS, "stalled", "disconnected" ) }
+        self.lock_latency           = c_histogram( )
+        self.propagation_latency    = c_histogram( )
+        self.initial_lines          = initial_lines
+
+
+def create_project( folder: str, files: int, lines: int ) -> str:
+    """
+    Create project files to edit.
+
+    Receive:
+    - folder (str): Work folder
+    - files (int): Amount of files
+    - lines (int): Lines in each file
+
+    Returns:
+    - str: Project path
+    """
+
+    project: str = os.path.join( folder, "project" )
+    os.makedirs( project, exist_ok=True )
+
+    for file_index in range( files ):
+        content: str = "".join( f"value_{ line } = { line }\n" for line in range( lines ) )
+
+        with open( os.path.join( project, f"load_{ file_index }.py" ), "w" ) as f:
+            f.write( content )
+
+        # The host reads the files content from project + "\\" + name, which is a Windows path.
+        # On other systems that is a single file next to the project folder, so it is written too
+        if os.sep != "\\":
+            with open( f"{ project }\\load_{ file_index }.py", "w" ) as f:
+                f.write( content )
+
+    return project
+
+
+def settle( value: any ) -> int:
+    """
+    Wait for a growing value to stop changing.
+
+    Receive:
+    - value (callable): Function that returns the current value
+
+    Returns:
+    - int: Last value
+    """
+
+    last:       int = -1
+    current:    int = value( )
+
+    while current != last:
+        time.sleep( SETTLE_TIME )
+        last, current = current, value( )
+
+    return current
+
+
+def free_port( ) -> int:
+
+    with socket.socket( ) as probe:
+        probe.bind( ( "127.0.0.1", 0 ) )
+        return probe.getsockname( )[ 1 ]
+
+
+def run_host( pipe: any, folder: str, port: int, clients: int, files: int, lines: int ):
+    """
+    Run a host until asked to stop. Used as the child process, or as a thread with --inline.
+
+    Receive:
+    - pipe (Connection): Control pipe to the load generator
+    - folder (str): Work folder
+    - port (int): Port to listen on
+    - clients (int): Max clients
+    - files (int): Amount of files
+    - lines (int): Lines in each file
+
+    Returns: None
+    """
+
+    project: str = create_project( folder, files, lines )
+
+    # The database is created in the working folder
+    os.chdir( folder )
+
+    host = c_host_business_logic( )
+
+    host.setup( "127.0.0.1", port, HOST_USERNAME, clients )
+    if not host( "success" ):
+        return pipe.send( ( False, host( "last_error" ) ) )
+
+    host.initialize_base_values( project, FILE_ACCESS_LEVEL_EDIT, ENUM_SCAN_OVERWRITE, False )
+
+    if not host.connect_to_database( PASSWORD ):
+        return pipe.send( ( False, host( "last_error" ) ) )
+
+    host.complete_setup_files( )
+
+    if not host.start( ):
+        return pipe.send( ( False, host( "last_error" ) ) )
+
+    pipe.send( ( True, base64.b64encode( f"127.0.0.1:{ port }".encode( ) ).decode( ) ) )
+
+    # Registration hashes every password, only the edits are measured
+    pipe.recv( )
+    c_metrics.reset( )
+
+    cpu_start:  float = time.process_time( )
+    wall_start: float = time.perf_counter( )
+
+    pipe.recv( )
+
+    result: dict = {
+        "cpu":      time.process_time( ) - cpu_start,
+        "wall":     time.perf_counter( ) - wall_start,
+        "metrics":  host.metrics( )
+    }
+
+    host.terminate( )
+    pipe.send( result )
+
+
+def parse_mix( value: str ) -> list:
+    """
+    Parse operations mix, like "update=6,delete=2,discard=2".
+
+    Receive:
+    - value (str): Mix string
+
+    Returns:
+    - list: Weight for each of the OPERATIONS
+    """
+
+    weights: dict = { name: 0.0 for name in OPERATIONS }
+
+    for item in value.split( "," ):
+        name, _, weight = item.partition( "=" )
+        name = name.strip( )
+
+        if name not in weights:
+            raise argparse.ArgumentTypeError( f"Unknown operation { name }, expected one of { ', '.join( OPERATIONS ) }" )
+
+        weights[ name ] = float( weight or 1 )
+
+    if sum( weights.values( ) ) <= 0:
+        raise argparse.ArgumentTypeError( "At least one operation must have a weight" )
+
+    return [ weights[ name ] for name in OPERATIONS ]
+
+
+def print_report( report: c_load_report, duration: float, connected: int, host_result: dict ):
+
+    print( )
+    print( f"{ 'operation':<16}{ 'count':>10}{ 'per second':>14}" )
+
+    for name, counter in report.operations.items( ):
+        count: float = counter.snapshot( )
+        print( f"{ name:<16}{ count:>10.0f}{ count / duration:>14.1f}" )
+
+    print( )
+    print( f"{ 'latency ms':<16}{ 'count':>10}{ 'p50':>10}{ 'p99':>10}{ 'max':>10}" )
+
+    for name, histogram in ( ( "lock", report.lock_latency ), ( "propagation", report.propagation_latency ) ):
+        snapshot: dict = histogram.snapshot( )
+
+        if snapshot[ "count" ] == 0:
+            print( f"{ name:<16}{ 0:>10}" )
+            continue
+
+        print( f"{ name:<16}{ snapshot[ 'count' ]:>10}{ snapshot[ 'p50' ] * 1e3:>10.2f}{ snapshot[ 'p99' ] * 1e3:>10.2f}{ snapshot[ 'max' ] * 1e3:>10.2f}" )
+
+    print( )
+    print( f"clients connected : { connected }" )
+
+    if host_result is None:
+        return
+
+    print( f"host cpu          : { host_result[ 'cpu' ]:.2f} s in { host_result[ 'wall' ]:.2f} s ( { host_result[ 'cpu' ] / host_result[ 'wall' ] * 100:.1f}% of one core )" )
+
+    metrics: dict = host_result[ "metrics" ]
+    for name in ( "network.bytes_in", "network.bytes_out" ):
+        if name in metrics:
+            print( f"{ name:<18}: { metrics[ name ]:.0f}" )
+
+    for name, value in metrics.items( ):
+        if isinstance( value, dict ) and value.get( "count" ) and ( name.startswith( "command." ) or name == "host.broadcast_seconds" ):
+            print( f"{ name:<40} count { value[ 'count' ]:>8}  p50 { value[ 'p50' ] * 1e3:>8.2f} ms  p99 { value[ 'p99' ] * 1e3:>8.2f} ms" )
+
+
+def main( ):
+
+    parser = argparse.ArgumentParser( description="Headless simulated clients load generator" )
+
+    parser.add_argument( "--clients",   type=int,       default=8,      help="Simulated clients" )
+    parser.add_argument( "--files",     type=int,       default=2,      help="Project files. Clients are spread over them" )
+    parser.add_argument( "--lines",     type=int,       default=200,    help="Lines in each file" )
+    parser.add_argument( "--duration",  type=float,     default=20.0,   help="Seconds of load" )
+    parser.add_argument( "--rate",      type=float,     default=2.0,    help="Edit cycles per second, for each client" )
+    parser.add_argument( "--mix",       type=parse_mix, default=DEFAULT_MIX, help="Weights of the operations after a lock" )
+    parser.add_argument( "--window",    type=int,       default=0,      help="Lock only the first lines, for more contention. 0 for the whole file" )
+    parser.add_argument( "--hold",      type=float,     default=0.0,    help="Seconds to hold each lock" )
+    parser.add_argument( "--inline",    action="store_true",            help="Run the host in this process. The host CPU includes the clients" )
+    parser.add_argument( "--code",      type=str,       default=None,   help="Project code of an already running host. No host CPU is reported" )
+
+    arguments = parser.parse_args( )
+
+    user_logic.TIMEOUT_MESSAGE = TIMEOUT_MESSAGE
+
+    folder: str = tempfile.mkdtemp( prefix="digital_load_" )
+    os.chdir( folder )
+
+    host_pipe   = None
+    code: str   = arguments.code
+
+    if code is None:
+        host_pipe, child_pipe = multiprocessing.Pipe( )
+        host_arguments: tuple = ( child_pipe, folder, free_port( ), arguments.clients, arguments.files, arguments.lines )
+
+        if arguments.inline:
+            threading.Thread( target=run_host, args=host_arguments, daemon=True ).start( )
+        else:
+            multiprocessing.get_context( "spawn" ).Process( target=run_host, args=host_arguments, daemon=True ).start( )
+
+        if not host_pipe.poll( TIMEOUT_HOST ):
+            raise Exception( "Host did not start in time" )
+
+        success, code = host_pipe.recv( )
+        if not success:
+            raise Exception( f"Host failed to start : { code }" )
+
+    report:     c_load_report   = c_load_report( arguments.lines )
+    clients:    list            = [ ]
+
+    print( f"connecting { arguments.clients } clients" )
+
+    for index in range( arguments.clients ):
+        client = c_simulated_client( index, report, os.path.join( folder, "cache", str( index ) ) )
+
+        if not client.connect( code ):
+            continue
+
+        if client.open_file( index ):
+            clients.append( client )
+        else:
+            client.disconnect( )
+
+    if host_pipe is not None:
+        host_pipe.send( "start" )
+
+    print( f"running { len( clients ) } clients for { arguments.duration:g} s" )
+
+    start:      float   = time.perf_counter( )
+    deadline:   float   = start + arguments.duration
+
+    threads: list = [ threading.Thread( target=client.run, args=( deadline, arguments.rate, arguments.mix, arguments.window, arguments.hold ), daemon=True ) for client in clients ]
+
+    for thread in threads:
+        thread.start( )
+
+    for thread in threads:
+        thread.join( )
+
+    # Let the last updates arrive
+    time.sleep( 0.5 )
+
+    for client in clients:
+        client.disconnect( )
+
+    host_result: dict = None
+    if host_pipe is not None:
+        host_pipe.send( "stop" )
+
+        if host_pipe.poll( TIMEOUT_HOST ):
+            host_result = host_pipe.recv( )
+
+    # Stalled clients wait past the deadline, the rates are for the load time only
+    print_report( report, arguments.duration, len( clients ), host_result )
+
+    os.chdir( tempfile.gettempdir( ) )
+    shutil.rmtree( folder, ignore_errors=True )
+
+
+if __name__ == "__main__":
+    main( )
@@ -0,0 +1,267 @@
+"""
+    project     : Digital Editor
+
+    type:       : Protocol
+    file        : Codec
+
+    description : Binary command codec. Encodes a command and its arguments
+                  into typed, length prefixed fields instead of base64 text.
+"""
+
+import struct
+
+CODEC_MARKER:       bytes   = b'\xde'   # Never a valid start of the text protocol messages
+CODEC_VERSION:      int     = 1
+CODEC_HEADER:       bytes   = CODEC_MARKER + bytes( [ CODEC_VERSION ] )
+
+FIELD_STRING:       int     = 0x73      # 's'
+FIELD_INTEGER:      int     = 0x69      # 'i'
+FIELD_BYTES:        int     = 0x62      # 'b'
+FIELD_LIST:         int     = 0x6c      # 'l'
+
+INTEGER_FORMAT:     str     = ">q"
+
+
+class c_command_codec:
+
+    # Frame layout :
+    # [ marker ][ version ][ varint command length ][ command ][ varint arguments count ][ fields... ]
+    # Field layout :
+    # [ type ][ varint payload length ][ payload ]
+
+    # region : Frame
+
+    @staticmethod
+    def is_binary( data: any ) -> bool:
+        """
+        Check if a message is a binary frame.
+
+        Receive:
+        - data (any): Received message
+
+        Returns:
+        - bool: Result
+        """
+
+        return isinstance( data, ( bytes, bytearray ) ) and data[ :1 ] == CODEC_MARKER
+
+
+    @staticmethod
+    def encode( command: str, arguments: list ) -> bytes:
+        """
+        Encode a command into a binary frame.
+
+        Receive:
+        - command (str): Command to send
+        - arguments (list): Arguments to follow it
+
+        Returns:
+        - bytes: Binary frame
+        """
+
+        result = bytearray( CODEC_HEADER )
+
+        command_bytes: bytes = command.encode( )
+        c_command_codec.__write_varint( result, len( command_bytes ) )
+        result += command_bytes
+
+        c_command_codec.__write_varint( result, len( arguments ) )
+
+        for argument in arguments:
+            # Most of the arguments are short strings
+            if type( argument ) is str and len( argument ) < 0x80:
+                payload: bytes = argument.encode( )
+
+                if len( payload ) < 0x80:
+                    result.append( FIELD_STRING )
+                    result.append( len( payload ) )
+                    result += payload
+                    continue
+
+            c_command_codec.__write_field( result, argument )
+
+        return bytes( result )
+
+
+    @staticmethod
+    def decode( data: bytes ) -> tuple:
+        """
+        Decode a binary frame.
+
+        Receive:
+        - data (bytes): Binary frame
+
+        Returns:
+        - tuple: Command and list of arguments
+        """
+
+        view: bytes = bytes( data )
+
+        if view[ :1 ] != CODEC_MARKER:
+            raise Exception( "Invalid codec marker" )
+
+        if view[ 1 ] > CODEC_VERSION:
+            raise Exception( f"Unsupported codec version { view[ 1 ] }" )
+
+        position: int = 2
+
+        length, position = c_command_codec.__read_varint( view, position )
+        command: str = view[ position:position + length ].decode( )
+        position += length
+
+        count, position = c_command_codec.__read_varint( view, position )
+
+        arguments: list = [ ]
+        for index in range( count ):
+            # Short strings are read directly
+            if view[ position ] == FIELD_STRING and view[ position + 1 ] < 0x80:
+                end: int = position + 2 + view[ position + 1 ]
+                arguments.append( view[ position + 2:end ].decode( ) )
+                position = end
+                continue
+
+            value, position = c_command_codec.__read_field( view, position )
+            arguments.append( value )
+
+        return command, arguments
+
+    # endregion
+
+    # region : Fields
+
+    @staticmethod
+    def __write_field( result: bytearray, value: any ):
+        """
+        Write a single typed field.
+
+        Receive:
+        - result (bytearray): Output buffer
+        - value (any): Value to write. Unknown types are written as strings
+
+        Returns: None
+        """
+
+        if isinstance( value, bool ) or not isinstance( value, ( int, bytes, bytearray, list, tuple ) ):
+            value = str( value )
+
+        if isinstance( value, str ):
+            field_type  = FIELD_STRING
+            payload     = value.encode( )
+
+        elif isinstance( value, int ):
+            field_type  = FIELD_INTEGER
+            payload     = struct.pack( INTEGER_FORMAT, value )
+
+        elif isinstance( value, ( list, tuple ) ):
+            field_type  = FIELD_LIST
+            payload     = bytearray( )
+
+            c_command_codec.__write_varint( payload, len( value ) )
+            for item in value:
+                c_command_codec.__write_field( payload, item )
+
+        else:
+            field_type  = FIELD_BYTES
+            payload     = value
+
+        result.append( field_type )
+        c_command_codec.__write_varint( result, len( payload ) )
+        result += payload
+
+
+    @staticmethod
+    def __read_field( view: bytes, position: int ) -> tuple:
+        """
+        Read a single typed field.
+
+        Receive:
+        - view (bytes): Frame data
+        - position (int): Start of the field
+
+        Returns:
+        - tuple: Value and position after the field
+        """
+
+        field_type: int = view[ position ]
+
+        length, position = c_command_codec.__read_varint( view, position + 1 )
+
+        end: int = position + length
+        if end > len( view ):
+            raise Exception( "Field is out of the frame" )
+
+        payload: bytes = view[ position:end ]
+
+        if field_type == FIELD_STRING:
+            return payload.decode( ), end
+
+        if field_type == FIELD_INTEGER:
+            return struct.unpack( INTEGER_FORMAT, payload )[ 0 ], end
+
+        if field_type == FIELD_BYTES:
+            return payload, end
+
+        if field_type == FIELD_LIST:
+            count, item_position = c_command_codec.__read_varint( payload, 0 )
+
+            items: list = [ ]
+            for index in range( count ):
+                item, item_position = c_command_codec.__read_field( payload, item_position )
+                items.append( item )
+
+            return items, end
+
+        raise Exception( f"Unknown field type { field_type }" )
+
+    # endregion
+
+    # region : Utilities
+
+    @staticmethod
+    def __write_varint( result: bytearray, value: int ):
+        """
+        Write unsigned LEB128 integer.
+
+        Receive:
+        - result (bytearray): Output buffer
+        - value (int): Non negative value
+
+        Returns: None
+        """
+
+        while value > 0x7f:
+            result.append( ( value & 0x7f ) | 0x80 )
+            value >>= 7
+
+        result.append( value )
+
+
+    @staticmethod
+    def __read_varint( view: bytes, position: int ) -> tuple:
+        """
+        Read unsigned LEB128 integer.
+
+        Receive:
+        - view (bytes): Frame data
+        - position (int): Start of the value
+
+        Returns:
+        - tuple: Value and position after it
+        """
+
+        result: int = 0
+        shift:  int = 0
+
+        while True:
+            byte: int = view[ position ]
+            position += 1
+
+            result |= ( byte & 0x7f ) << shift
+            if byte & 0x80 == 0:
+                return result, position
+
+            shift += 7
+            if shift > 63:
+                raise Exception( "Invalid varint" )
+
+    # endregion
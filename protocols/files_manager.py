@@ -9,39 +9,2553 @@
 
 from utilities.wrappers import safe_call
 from utilities.debug    import *
+from utilities.math     import math
+from protocols.codec    import *
 
+from collections import deque
+
+import threading
+import hashlib
+import bisect
+import heapq
+import struct
+import secrets
 import shutil
+import mmap
 import base64
 import json
 import time
 import os
 
-FILES_MANAGER_HEADER = "FL_UNK"
+FILES_MANAGER_HEADER = "FL_UNK"
+
+FILES_COMMAND_REQ_FILES = "ReqFiles"
+FILES_COMMAND_RES_FILES = "ResFiles"
+
+FILES_COMMAND_GET_FILE = "GetFileCont"
+FILES_COMMAND_SET_FILE = "SetFileCont"
+FILES_COMMAND_SAME_FILE = "SameFileCont"    # Response when the client already has the requested content
+
+FILES_COMMAND_GET_FILE_SINCE    = "GetFileSince"    # Request only the changes after a known version
+FILES_COMMAND_FILE_DELTA        = "FileDelta"       # Changes to apply on a known version
+
+FILES_COMMAND_PREPARE_UPDATE    = "PrepUpdateLine"
+FILES_COMMAND_PREPARE_RESPONSE  = "ResPrepUpdate"
+FILES_COMMAND_UPDATE_LINE       = "UpdateLine"
+FILES_COMMAND_DELETE_LINE       = "DelLine"
+FILES_COMMAND_DISCARD_UPDATE    = "DisUpdateLine"
+FILES_COMMAND_UPDATE_FILE       = "UpdateFile"   # Use this command to update file access level and register new files
+FILES_COMMAND_UPDATE_FILE_NAME  = "ChangeFileName"
+
+# This command is extremely important.
+# FILES_COMMAND_APPLY_UPDATE - Update_ENUM - Update details
+FILES_COMMAND_APPLY_UPDATE      = "ApplyUpdateLine"
+
+FILE_ACCESS_LEVEL_HIDDEN    = 0     # This file should be hidden ( used only for host )
+FILE_ACCESS_LEVEL_EDIT      = 1     # This file can be edited
+FILE_ACCESS_LEVEL_LIMIT     = 2     # This file cannot be edited
+
+FILES_CODEC_TEXT    = 0                 # base64 text messages
+FILES_CODEC_BINARY  = CODEC_VERSION     # Binary frames of protocols.codec
+ENABLE_BINARY_CODEC = True              # Offer / accept the binary codec. Text is always understood
+
+FILE_UPDATE_CONTENT = 0
+FILE_UPDATE_NAME    = 1
+
+FLUSH_DELAY         = 2.0   # Seconds without edits before a changed file is written to disk
+INDEX_CHUNK_SIZE    = 65536 # Bytes to read at once while indexing a file from disk
+MMAP_THRESHOLD      = 262144    # Files above this size are mapped instead of loaded for transfers
+READER_TIMEOUT      = 5.0   # Seconds to wait for mapped transfer readers before the file on disk is written or replaced
+DIGEST_SIZE         = 16    # Bytes of the BLAKE2b content digest
+RECENT_CHANGES      = 1024  # Changes kept in memory for delta sync. Older versions get a full transfer
+
+SNAPSHOT_CHANGES    = 500       # Changes between two snapshots of a file
+SNAPSHOT_KEEP       = 4         # Snapshots kept for each file. Older changes are folded into the oldest one
+COMPACT_RATE        = 1048576   # Bytes per second the compaction may read from a log
+HISTORY_LIMIT       = 100       # Default amount of changes returned by a history query
+
+INDEX_RECORD        = struct.Struct( "<QQiiId" )    # Sequence, log offset, line, added lines, user id, time
+INDEX_INSERT_LIMIT  = 64        # New index records up to this amount are inserted one by one, more are merged
+
+
+class c_file_reader:
+
+    # NOTE ! Reader is created for a single transfer. It keeps the content that existed when
+    # it was opened, so edits made during the transfer will not mix into it.
+
+    _buffer:    any             # c_line_buffer that opened this reader
+    _data:      any             # bytes or mmap of the content
+    _view:      memoryview      # View on the content to slice without copies
+    _file:      any             # Open file handle when mapped
+
+    _revision:  int             # Buffer revision of the content
+    _digest:    str             # Content digest. None until requested
+    _version:   str             # Change log version of the content. None if not logged
+
+    # region : Initialize
+
+    def __init__( self, buffer: any, data: bytes = None, path: str = None, revision: int = 0, digest: str = None ):
+        """
+        Default constructor for file reader object.
+
+        Receive:
+        - buffer (c_line_buffer): Buffer that owns this reader
+        - data (bytes, optional): Content snapshot from memory
+        - path (str, optional): Path of a file to map instead
+        - revision (int, optional): Buffer revision of the content
+        - digest (str, optional): Known digest of the content
+
+        Returns:
+        - c_file_reader: File reader object
+        """
+
+        self._buffer    = buffer
+        self._file      = None
+
+        self._revision  = revision
+        self._digest    = digest
+        self._version   = None
+
+        if data is None:
+            self._file = open( path, "rb" )
+            data = mmap.mmap( self._file.fileno( ), 0, access=mmap.ACCESS_READ )
+
+        self._data      = data
+        self._view      = memoryview( data )
+
+    # endregion
+
+    # region : Access
+
+    def size( self ) -> int:
+        """
+        Get the size of the content.
+
+        Receive: None
+
+        Returns:
+        - int: Content size in bytes
+        """
+
+        return len( self._view )
+    
+
+    def read( self, start: int, end: int ) -> memoryview:
+        """
+        Read specific chunk of the content.
+
+        Receive:
+        - start (int): Start byte of the chunk
+        - end (int): End byte of the chunk
+
+        Returns:
+        - memoryview: View on the chunk
+        """
+
+        return self._view[ start:end ]
+    
+
+    def digest( self ) -> str:
+        """
+        Get the digest of the content.
+
+        Receive: None
+
+        Returns:
+        - str: Hex BLAKE2b digest
+        """
+
+        if self._digest is None:
+            self._digest = hashlib.blake2b( self._view, digest_size=DIGEST_SIZE ).hexdigest( )
+            
+            # Let the buffer keep it, if nothing changed since the reader was opened
+            self._buffer.remember_digest( self._revision, self._digest )
+
+        return self._digest
+    
+
+    def version( self, new_value: str = None ) -> str:
+        """
+        Get/Set the change log version of the content.
+
+        Receive:
+        - new_value (str, optional): Version of the content
+
+        Returns:
+        - str: Version or None if not logged
+        """
+
+        if new_value is not None:
+            self._version = new_value
+
+        return self._version
+
+
+    def close( self ):
+        """
+        Release the content and notify the buffer.
+
+        Receive: None
+
+        Returns: None
+        """
+
+        if self._view is None:
+            return
+        
+        self._view.release( )
+        self._view = None
+
+        if self._file is not None:
+            self._data.close( )
+            self._file.close( )
+
+            # Only mapped readers hold the file on disk
+            self._buffer.release_reader( )
+
+        self._data = None
+
+
+    def __enter__( self ):
+        return self
+    
+
+    def __exit__( self, exc_type, exc_value, traceback ):
+        self.close( )
+
+    # endregion
+
+
+class c_line_buffer:
+
+    # NOTE ! The buffer is shared between every copy of the same virtual file.
+    # It holds the lines in memory and writes them to disk only after the edits calm down.
+
+    _path:          str                 # Full path of the real file
+    _lines:         list                # File's lines. None until first used
+    _data:          bytes               # Encoded content. None after an edit until requested again
+    _is_raw:        bool                # Content is still the exact bytes of the real file
+
+    # Start byte of each line in the content. Only the first _offsets_valid entries are correct,
+    # an edit invalidates from the edited line and the rest is rebuilt when requested.
+    _offsets:       list
+    _offsets_valid: int
+
+    _revision:      int                 # Increased on every edit
+    _digest:        str                 # Digest of the current content. None until requested
+
+    _is_dirty:      bool                # Has changes that are not on the disk
+    _flush_timer:   threading.Timer     # Debounce timer for writing changes. One at most
+    _last_edit:     float               # Monotonic time of the last edit
+    _readers:       int                 # Open mapped transfer readers. Disk writes wait for them
+    _released:      threading.Condition # Notified when a mapped reader is closed
+
+    _lock:          threading.RLock
+
+    # region : Initialize
+
+    def __init__( self ):
+        """
+        Default constructor for line buffer object.
+
+        Receive: None
+
+        Returns:
+        - c_line_buffer: Line buffer object
+        """
+
+        self._path          = None
+        self._lines         = None
+        self._data          = None
+        self._is_raw        = True
+
+        self._offsets       = None
+        self._offsets_valid = 0
+
+        self._revision      = 0
+        self._digest        = None
+
+        self._is_dirty      = False
+        self._flush_timer   = None
+        self._last_edit     = 0
+        self._readers       = 0
+
+        self._lock          = threading.RLock( )
+        self._released      = threading.Condition( self._lock )
+
+    # endregion
+
+    # region : Access
+
+    def path( self, new_value: str = None ) -> str:
+        """
+        Get/Set the real file path.
+
+        Receive:
+        - new_value (str, optional): New path for the file
+
+        Returns:
+        - str: Current path
+        """
+
+        if new_value is None:
+            return self._path
+        
+        with self._lock:
+            self._path = new_value
+
+        return self._path
+
+
+    def lines( self ) -> list:
+        """
+        Get a copy of the file's lines.
+
+        Receive: None
+
+        Returns:
+        - list: List of string that represents the file content lines
+        """
+
+        with self._lock:
+            self.__load( )
+
+            return self._lines.copy( )
+    
+
+    def data( self ) -> bytes:
+        """
+        Get the file's content as it will be written on disk.
+
+        Receive: None
+
+        Returns:
+        - bytes: Encoded content
+        """
+
+        with self._lock:
+            self.__load( )
+
+            if self._data is None:
+                self._data = os.linesep.join( self._lines ).encode( )
+
+            return self._data
+    
+
+    def size( self ) -> int:
+        """
+        Get the size of the content without reading or encoding it again.
+
+        Receive: None
+
+        Returns:
+        - int: Content size in bytes
+        """
+
+        with self._lock:
+            if self._lines is None:
+                return os.path.getsize( self._path )
+            
+            return len( self.data( ) )
+    
+
+    def line_count( self ) -> int:
+        """
+        Get the number of lines in the file.
+
+        Receive: None
+
+        Returns:
+        - int: Lines count
+        """
+
+        with self._lock:
+            if self._lines is not None:
+                return len( self._lines )
+            
+            self.__build_offsets( 0 )
+
+            return len( self._offsets )
+    
+
+    def line_range( self, start: int, end: int ) -> list:
+        """
+        Get specific lines without loading the whole file.
+
+        Receive:
+        - start (int): First line ( starts from 1 )
+        - end (int): Line after the last one
+
+        Returns:
+        - list: List of lines in the range
+        """
+
+        with self._lock:
+            if self._lines is not None:
+                return self._lines[ max( start - 1, 0 ):max( end - 1, 0 ) ]
+            
+            self.__build_offsets( 0 )
+
+            start   = math.clamp( start, 1, len( self._offsets ) + 1 )
+            end     = math.clamp( end, start, len( self._offsets ) + 1 )
+
+            if start == end:
+                return [ ]
+
+            first_byte, _   = self.line_span( start )
+            _, last_byte    = self.line_span( end - 1 )
+
+            with open( self._path, "rb" ) as f:
+                f.seek( first_byte )
+                data: bytes = f.read( last_byte - first_byte )
+
+            result: list = [ ]
+
+            for line in range( start, end ):
+                line_start, line_end = self.line_span( line )
+
+                raw_line: bytes = data[ line_start - first_byte:line_end - first_byte ]
+                result.append( raw_line.rstrip( b"\n" ).rstrip( b"\r" ).decode( ) )
+
+            return result
+    
+
+    def line_span( self, line: int ) -> tuple:
+        """
+        Get the bytes span of a line in the file content, including its line break.
+
+        Receive:
+        - line (int): Line number ( starts from 1 )
+
+        Returns:
+        - tuple: Start byte and end byte of the line, or None if the line does not exist
+        """
+
+        with self._lock:
+            if line < 1 or line > self.line_count( ):
+                return None
+
+            self.__build_offsets( line )
+
+            start: int = self._offsets[ line - 1 ]
+
+            if line < len( self._offsets ):
+                return start, self._offsets[ line ]
+            
+            return start, self.size( )
+
+
+    def open_reader( self ) -> c_file_reader:
+        """
+        Open a reader over the current content for a transfer.
+
+        Receive: None
+
+        Returns:
+        - c_file_reader: Reader that must be closed after use
+        """
+
+        with self._lock:
+            # Big files that were never loaded are mapped, instead of loaded only to be sent.
+            # The disk will not be written until the reader is closed
+            if self._lines is None and os.path.getsize( self._path ) > MMAP_THRESHOLD:
+                reader: c_file_reader = c_file_reader( self, path=self._path, revision=self._revision, digest=self._digest )
+                self._readers += 1
+
+                return reader
+            
+            # Edits replace the bytes object, so holding it is enough for a snapshot
+            return c_file_reader( self, data=self.data( ), revision=self._revision, digest=self._digest )
+
+
+    def transaction( self ) -> threading.RLock:
+        """
+        Get the buffer lock, to keep an edit and its log entry together.
+
+        Receive: None
+
+        Returns:
+        - threading.RLock: Lock of the buffer
+        """
+
+        return self._lock
+
+
+    def release_reader( self ):
+        """
+        Register that a mapped reader was closed.
+
+        Receive: None
+
+        Returns: None
+        """
+
+        with self._lock:
+            self._readers = max( self._readers - 1, 0 )
+            self._released.notify_all( )
+
+
+    def wait_readers( self, timeout: float ) -> bool:
+        """
+        Wait until every mapped reader is closed.
+
+        Receive:
+        - timeout (float): Seconds to wait
+
+        Returns:
+        - bool: True if no mapped reader is open
+        """
+
+        with self._lock:
+            return self._released.wait_for( lambda: self._readers == 0, timeout )
+
+
+    def digest( self ) -> str:
+        """
+        Get the digest of the current content.
+
+        Receive: None
+
+        Returns:
+        - str: Hex BLAKE2b digest
+        """
+
+        with self._lock:
+            if self._digest is not None:
+                return self._digest
+            
+            with self.open_reader( ) as reader:
+                return reader.digest( )
+            
+
+    def remember_digest( self, revision: int, digest: str ):
+        """
+        Keep a digest that was calculated by a reader.
+
+        Receive:
+        - revision (int): Revision of the content the digest was calculated on
+        - digest (str): Hex digest
+
+        Returns: None
+        """
+
+        with self._lock:
+            if revision == self._revision:
+                self._digest = digest
+
+
+    def is_dirty( self ) -> bool:
+        """
+        Check if the buffer has changes that are not on the disk.
+
+        Receive: None
+
+        Returns:
+        - bool: Result
+        """
+
+        return self._is_dirty
+    
+    # endregion
+
+    # region : Edit
+
+    def change( self, line: int, new_lines: list ) -> str:
+        """
+        Replace a line with new lines.
+
+        Receive:
+        - line (int): Line to change ( starts from 1 )
+        - new_lines (list): New lines to add instead
+
+        Returns:
+        - str: The removed line
+        """
+
+        with self._lock:
+            self.__load( )
+
+            line -= 1
+            removed_line: str = self._lines[ line ]
+
+            self._lines[ line:line + 1 ] = new_lines
+
+            self.__mark_dirty( line )
+
+        return removed_line
+
+
+    def remove( self, line: int ) -> str:
+        """
+        Remove a line.
+
+        Receive:
+        - line (int): Line to remove ( starts from 1 )
+
+        Returns:
+        - str: The removed line
+        """
+
+        with self._lock:
+            self.__load( )
+
+            removed_line: str = self._lines.pop( line - 1 )
+
+            self.__mark_dirty( line - 1 )
+
+        return removed_line
+    
+    # endregion
+
+    # region : Disk
+
+    def flush( self, timeout: float = 0 ) -> bool:
+        """
+        Write the pending changes to the disk.
+
+        Receive:
+        - timeout (float, optional): Seconds to wait for mapped readers
+
+        Returns:
+        - bool: True if anything was written
+        """
+
+        with self._lock:
+            if self._flush_timer is not None:
+                self._flush_timer.cancel( )
+                self._flush_timer = None
+
+            if not self._is_dirty:
+                return False
+            
+            if not self.wait_readers( timeout ):
+                # A mapped transfer is still reading the file. Try again later
+                self.__schedule_flush( )
+                return False
+            
+            temp_path: str = f"{ self._path }.tmp"
+
+            with open( temp_path, "wb" ) as f:
+                f.write( self.data( ) )
+
+            os.replace( temp_path, self._path )
+
+            self._is_dirty = False
+
+        return True
+    
+
+    def unload( self, timeout: float = 0 ) -> bool:
+        """
+        Flush and release the lines from memory.
+        Changes that cannot be written are never dropped.
+
+        Receive:
+        - timeout (float, optional): Seconds to wait for mapped readers
+
+        Returns:
+        - bool: True if the lines were released
+        """
+
+        with self._lock:
+            self.flush( timeout )
+
+            if self._is_dirty:
+                return False
+
+            self._lines     = None
+            self._data      = None
+            self._is_raw    = True
+
+            self._offsets       = None
+            self._offsets_valid = 0
+
+            # The file on disk can be replaced after this point
+            self._revision += 1
+            self._digest    = None
+
+        return True
+
+
+    def reload( self ) -> bool:
+        """
+        Drop the loaded content, after the file on disk was changed by someone else.
+
+        Receive: None
+
+        Returns:
+        - bool: True if the content on disk is different. False if it is the same,
+                or if there are changes in memory that must not be lost
+        """
+
+        with self._lock:
+            if self._is_dirty or self._readers > 0:
+                return False
+            
+            if not os.path.exists( self._path ):
+                return False
+            
+            known_digest: str = self._digest
+            if known_digest is None and self._data is not None:
+                known_digest = hashlib.blake2b( self._data, digest_size=DIGEST_SIZE ).hexdigest( )
+
+            if known_digest is not None:
+                disk_digest = hashlib.blake2b( digest_size=DIGEST_SIZE )
+
+                with open( self._path, "rb" ) as f:
+                    for chunk in iter( lambda: f.read( INDEX_CHUNK_SIZE ), b"" ):
+                        disk_digest.update( chunk )
+
+                # Probably our own write
+                if disk_digest.hexdigest( ) == known_digest:
+                    return False
+                
+            self.unload( )
+
+        return True
+
+
+    def __load( self ):
+        """
+        Read the file's lines into memory if not loaded yet.
+
+        Receive: None
+
+        Returns: None
+        """
+
+        if self._lines is not None:
+            return
+        
+        if self._path is None:
+            raise Exception( "Invalid file path" )
+
+        # never use .readlines( ). 
+        # This trash actually breaks everything
+        # It has incorrect encoding and more
+
+        with open( self._path, "rb" ) as f:
+            data = f.read( )
+
+        # Until the first edit, serve the exact bytes of the file
+        self._data      = data
+        self._is_raw    = True
+
+        if data.endswith( b'\n' ):
+            data = data + b'\r'
+
+        self._lines = data.decode( ).splitlines( )
+
+
+    def __mark_dirty( self, line: int ):
+        """
+        Register a change and restart the flush timer.
+
+        Receive:
+        - line (int): Index of the first changed line
+
+        Returns: None
+        """
+
+        # Raw content can have different line breaks than the ones we write,
+        # so nothing from its index can be kept
+        if self._is_raw:
+            self._offsets_valid = 0
+        else:
+            self._offsets_valid = min( self._offsets_valid, line + 1 )
+
+        self._data      = None
+        self._is_raw    = False
+        self._is_dirty  = True
+
+        self._revision += 1
+        self._digest    = None
+
+        self._last_edit = time.monotonic( )
+
+        self.__schedule_flush( )
+
+
+    def __schedule_flush( self, delay: float = FLUSH_DELAY ):
+        """
+        Arm the flush timer if it is not already pending.
+
+        Receive:
+        - delay (float, optional): Seconds until the timer fires
+
+        Returns: None
+        """
+
+        if self._flush_timer is not None:
+            return
+
+        self._flush_timer = threading.Timer( delay, safe_call( c_debug.log_error )( self.__flush_when_calm ) )
+        self._flush_timer.daemon = True
+        self._flush_timer.start( )
+
+
+    def __flush_when_calm( self ):
+        """
+        Flush timer callback. Write the changes only after no edit happened for the flush delay.
+
+        Receive: None
+
+        Returns: None
+        """
+
+        with self._lock:
+            if threading.current_thread( ) is not self._flush_timer:
+                # Cancelled or replaced while waiting for the lock
+                return
+
+            self._flush_timer = None
+
+            remaining: float = self._last_edit + FLUSH_DELAY - time.monotonic( )
+            if remaining > 0:
+                self.__schedule_flush( remaining )
+                return
+
+            self.flush( )
+
+
+    def __build_offsets( self, line: int ):
+        """
+        Make sure the lines offsets are valid up to a specific line.
+
+        Receive:
+        - line (int): Line number that must have a valid offset
+
+        Returns: None
+        """
+
+        if self._is_raw:
+
+            # Index the raw bytes once. From memory if loaded, otherwise from disk
+            if self._offsets is not None:
+                return
+            
+            if self._data is not None:
+                self._offsets = self.__scan_offsets( [ self._data ], len( self._data ) )
+            
+            else:
+                with open( self._path, "rb" ) as f:
+                    self._offsets = self.__scan_offsets( iter( lambda: f.read( INDEX_CHUNK_SIZE ), b"" ), os.path.getsize( self._path ) )
+
+            self._offsets_valid = len( self._offsets )
+            return
+
+        count: int = len( self._lines )
+        
+        if self._offsets is None:
+            self._offsets = [ ]
+
+        # Drop the invalid part and rebuild only up to the requested line
+        del self._offsets[ self._offsets_valid: ]
+
+        if len( self._offsets ) == 0 and count > 0:
+            self._offsets.append( 0 )
+
+        separator_size: int = len( os.linesep.encode( ) )
+        needed:         int = min( max( line + 1, 1 ), count )
+
+        while len( self._offsets ) < needed:
+            index: int = len( self._offsets ) - 1
+            self._offsets.append( self._offsets[ index ] + len( self._lines[ index ].encode( ) ) + separator_size )
+
+        self._offsets_valid = len( self._offsets )
+
+
+    def __scan_offsets( self, chunks: any, size: int ) -> list:
+        """
+        Find the start of each line in raw bytes.
+
+        Receive:
+        - chunks (any): Iterable of bytes chunks
+        - size (int): Total size of the content
+
+        Returns:
+        - list: Start byte of each line
+        """
+
+        # Same lines as .splitlines( ) after the trailing line break fix in __load( ),
+        # as long as the file uses only \n or \r\n for line breaks
+        if size == 0:
+            return [ ]
+        
+        offsets:    list    = [ 0 ]
+        position:   int     = 0
+
+        for chunk in chunks:
+            index: int = chunk.find( b"\n" )
+
+            while index != -1:
+                offsets.append( position + index + 1 )
+                index = chunk.find( b"\n", index + 1 )
+
+            position += len( chunk )
+
+        return offsets
+
+    # endregion
+
+
+class c_change_index:
+
+    # NOTE ! Index of a change log. Each change has a fixed size record on disk, so the
+    # whole index is loaded with a single read. Queries return offsets in the log, and only
+    # the matching changes are read from it. Users names are kept next to it, in .users file.
+
+    _path:          str                 # Index file path
+
+    _sequences:     list                # Sequence number of each record
+    _offsets:       list                # Offset of each change in the log
+    _lines:         list                # Line of each change
+    _added:         list                # Lines added instead of the changed line. 0 for removed line
+    _users:         list                # User id of each record
+    _times:         list                # Time of each change
+
+    _user_names:    list                # User id -> Username
+    _user_ids:      dict                # Username -> User id
+    _by_user:       dict                # User id -> Records positions
+    _by_line:       list                # Sorted ( line, record position )
+
+    # Record position that last wrote each line of the current content, -1 for lines that were not changed.
+    # Built on the first blame, from the records after _blame_since, and kept updated by .add( )
+    _blame:         list
+    _blame_since:   int
+
+    _lock:          threading.RLock
+
+    # region : Initialize
+
+    def __init__( self ):
+        """
+        Default constructor for change index object.
+
+        Receive: None
+
+        Returns:
+        - c_change_index: Change index object
+        """
+
+        self._path  = None
+        self._lock  = threading.RLock( )
+
+        self.__clear( )
+
+
+    def open( self, path: str ) -> bool:
+        """
+        Attach the index to a file and load it.
+
+        Receive:
+        - path (str): Index file path
+
+        Returns:
+        - bool: True if a valid index was loaded
+        """
+
+        with self._lock:
+            self._path = path
+            self.__clear( )
+
+            if not os.path.exists( path ) or not os.path.exists( f"{ path }.users" ):
+                return False
+            
+            try:
+                with open( f"{ path }.users", "rb" ) as f:
+                    user_names: list = json.loads( f.read( ) )
+
+                with open( path, "rb" ) as f:
+                    data: bytes = f.read( )
+
+                if len( data ) % INDEX_RECORD.size != 0:
+                    return False
+                
+                for name in user_names:
+                    self.__user_id( name )
+
+                records: list = list( INDEX_RECORD.iter_unpack( data ) )
+                if len( records ) > 0:
+                    self._sequences, self._offsets, self._lines, self._added, self._users, self._times = ( list( values ) for values in zip( *records ) )
+
+                # Build the lookups at once, instead of record by record
+                for position, user in enumerate( self._users ):
+                    self._by_user.setdefault( user, [ ] ).append( position )
+
+                self._by_line = sorted( zip( self._lines, range( len( self._lines ) ) ) )
+
+                return True
+
+            except Exception as e:
+                c_debug.log_error( f"Failed to load change index { path }. { e }" )
+
+                self.__clear( )
+                return False
+            
+
+    def reset( self ):
+        """
+        Remove every record, in memory and on disk.
+
+        Receive: None
+
+        Returns: None
+        """
+
+        with self._lock:
+            self.__clear( )
+
+            with open( self._path, "wb" ):
+                pass
+
+            self.__save_users( )
+    
+
+    def move( self, new_path: str ):
+        """
+        Rename the index files.
+
+        Receive:
+        - new_path (str): New index file path
+
+        Returns: None
+        """
+
+        with self._lock:
+            os.replace( self._path, new_path )
+            os.replace( f"{ self._path }.users", f"{ new_path }.users" )
+
+            self._path = new_path
+
+
+    def remove( self ):
+        """
+        Delete the index files.
+
+        Receive: None
+
+        Returns: None
+        """
+
+        with self._lock:
+            self.__clear( )
+
+            for path in ( self._path, f"{ self._path }.users" ):
+                if os.path.exists( path ):
+                    os.remove( path )
+
+    # endregion
+
+    # region : Records
+
+    def add( self, records: list ):
+        """
+        Index new changes.
+
+        Receive:
+        - records (list): List of ( change, offset in the log )
+
+        Returns: None
+        """
+
+        if len( records ) == 0:
+            return
+
+        with self._lock:
+            users_count:    int     = len( self._user_names )
+            position:       int     = len( self._sequences )
+            data:           list    = [ ]
+            by_line:        list    = [ ]
+
+            for change, offset in records:
+                sequence:       int     = change[ "seq" ]
+                line:           int     = change.get( "line", 0 )
+                added:          int     = len( change.get( "added", [ ] ) )
+                user:           int     = self.__user_id( change.get( "user", "?" ) )
+                change_time:    float   = change.get( "stamp" )
+
+                if change_time is None:
+                    change_time = self.__parse_time( change.get( "time" ) )
+
+                self._sequences.append( sequence )
+                self._offsets.append( offset )
+                self._lines.append( line )
+                self._added.append( added )
+                self._users.append( user )
+                self._times.append( change_time )
+
+                self._by_user.setdefault( user, [ ] ).append( position )
+                by_line.append( ( line, position ) )
+
+                data.append( INDEX_RECORD.pack( sequence, offset, line, added, user, change_time ) )
+
+                if self._blame is not None:
+                    self.__apply_blame( position )
+
+                position += 1
+
+            # Few records are inserted, many are sorted once and merged
+            if len( by_line ) <= INDEX_INSERT_LIMIT:
+                for item in by_line:
+                    bisect.insort( self._by_line, item )
+            else:
+                by_line.sort( )
+                self._by_line = list( heapq.merge( self._by_line, by_line ) )
+
+            if len( self._user_names ) != users_count:
+                self.__save_users( )
+
+            with open( self._path, "ab" ) as f:
+                f.write( b"".join( data ) )
+
+
+    def last_sequence( self ) -> int:
+        """
+        Get the sequence number of the last indexed change.
+
+        Receive: None
+
+        Returns:
+        - int: Sequence number or 0 if nothing was indexed
+        """
+
+        with self._lock:
+            if len( self._sequences ) == 0:
+                return 0
+            
+            return self._sequences[ -1 ]
+        
+    # endregion
+
+    # region : Queries
+
+    def query( self, start_line: int = None, end_line: int = None, user: str = None, since: float = None, until: float = None, limit: int = HISTORY_LIMIT ) -> list:
+        """
+        Find changes by the line they were made in, their user and their time.
+        The most selective index is used, and the other conditions are checked on its result.
+
+        Receive:
+        - start_line (int, optional): First line of the range
+        - end_line (int, optional): Last line of the range
+        - user (str, optional): Username
+        - since (float, optional): Earliest time, in seconds since epoch
+        - until (float, optional): Latest time, in seconds since epoch
+        - limit (int, optional): Maximum amount of changes
+
+        Returns:
+        - list: Offsets of the changes in the log, newest first
+        """
+
+        with self._lock:
+            has_lines: bool = start_line is not None or end_line is not None
+
+            start_line  = 0 if start_line is None else start_line
+            end_line    = 2 ** 31 - 1 if end_line is None else end_line
+
+            if user is not None:
+                user_id: int = self._user_ids.get( user )
+                if user_id is None:
+                    return [ ]
+                
+                positions: list = self._by_user[ user_id ]
+
+            elif has_lines:
+                first:  int = bisect.bisect_left( self._by_line, ( start_line, -1 ) )
+                last:   int = bisect.bisect_right( self._by_line, ( end_line, len( self._sequences ) ) )
+
+                positions = sorted( position for line, position in self._by_line[ first:last ] )
+
+            else:
+                first:  int = 0 if since is None else bisect.bisect_left( self._times, since )
+                last:   int = len( self._times ) if until is None else bisect.bisect_right( self._times, until )
+
+                positions = range( first, last )
+
+            result: list = [ ]
+
+            for position in reversed( positions ):
+                if has_lines and not start_line <= self._lines[ position ] <= end_line:
+                    continue
+
+                change_time: float = self._times[ position ]
+                if ( since is not None and change_time < since ) or ( until is not None and change_time > until ):
+                    continue
+
+                result.append( self._offsets[ position ] )
+
+                if len( result ) >= limit:
+                    break
+
+            return result
+        
+
+    def blame( self, line: int, since: int = 0 ) -> int:
+        """
+        Find the last change that wrote a line of the current content.
+
+        Receive:
+        - line (int): Line number in the current content
+        - since (int, optional): Sequence number when the content was last replaced without the log.
+                                 Older changes do not describe the current content
+
+        Returns:
+        - int: Offset of the change in the log or None if there is no such change
+        """
+
+        with self._lock:
+            if self._blame is None or self._blame_since != since:
+                self.__build_blame( since )
+
+            if line < 1 or line > len( self._blame ):
+                return None
+            
+            position: int = self._blame[ line - 1 ]
+            if position < 0:
+                return None
+            
+            return self._offsets[ position ]
+        
+    # endregion
+
+    # region : Utilities
+
+    def __clear( self ):
+        """
+        Remove every record from memory.
+
+        Receive: None
+
+        Returns: None
+        """
+
+        self._sequences     = [ ]
+        self._offsets       = [ ]
+        self._lines         = [ ]
+        self._added         = [ ]
+        self._users         = [ ]
+        self._times         = [ ]
+
+        self._user_names    = [ ]
+        self._user_ids      = { }
+        self._by_user       = { }
+        self._by_line       = [ ]
+
+        self._blame         = None
+        self._blame_since   = 0
+
+
+    def __build_blame( self, since: int ):
+        """
+        Replay the records after a sequence number into the blame lines.
+
+        Receive:
+        - since (int): Sequence number to start after
+
+        Returns: None
+        """
+
+        self._blame         = [ ]
+        self._blame_since   = since
+
+        for position in range( bisect.bisect_right( self._sequences, since ), len( self._sequences ) ):
+            self.__apply_blame( position )
+
+
+    def __apply_blame( self, position: int ):
+        """
+        Move the blame lines by a single record.
+
+        Receive:
+        - position (int): Record position
+
+        Returns: None
+        """
+
+        line:   int     = self._lines[ position ]
+        blame:  list    = self._blame
+
+        if line < 1:
+            return
+        
+        # Lines after the end were never changed
+        if len( blame ) < line:
+            blame.extend( [ -1 ] * ( line - len( blame ) ) )
+
+        blame[ line - 1:line ] = [ position ] * self._added[ position ]
+
+
+    def __user_id( self, name: str ) -> int:
+        """
+        Get the id of a username. Register it if needed.
+
+        Receive:
+        - name (str): Username
+
+        Returns:
+        - int: User id
+        """
+
+        user_id: int = self._user_ids.get( name )
+        if user_id is not None:
+            return user_id
+        
+        user_id = len( self._user_names )
+
+        self._user_names.append( name )
+        self._user_ids[ name ] = user_id
+
+        return user_id
+    
+
+    def __save_users( self ):
+        """
+        Write the usernames file.
+
+        Receive: None
+
+        Returns: None
+        """
+
+        temp_path: str = f"{ self._path }.users.tmp"
+
+        with open( temp_path, "wb" ) as f:
+            f.write( json.dumps( self._user_names ).encode( ) )
+
+        os.replace( temp_path, f"{ self._path }.users" )
+
+
+    def __parse_time( self, value: str ) -> float:
+        """
+        Convert the time string of old changes.
+
+        Receive:
+        - value (str): Time in the log format
+
+        Returns:
+        - float: Seconds since epoch, or 0 if it cannot be parsed
+        """
+
+        try:
+            return time.mktime( time.strptime( value, "%y-%m-%d %H:%M:%S" ) )
+        except Exception:
+            return 0.0
+
+    # endregion
+
+
+class c_change_log:
+
+    # NOTE ! The change log is shared between every copy of the same virtual file.
+    # Each line of the log file is a json object. The first one ( seq 0 ) describes the file,
+    # and every other one is a single change with a sequence number.
+
+    _path:          str                 # Full path of the log file
+    _sequence:      int                 # Sequence number of the last change
+
+    # Versions are only comparable inside the same epoch. A new epoch is created every time the
+    # log is opened, since the file itself can be replaced while the host is down
+    _epoch:         str
+    _recent:        deque               # Last changes of this epoch, for delta sync
+
+    _pending:       list                # ( Change, encoded change ) that are not on the disk yet
+    _index:         c_change_index      # Lookup of the changes by line, user and time
+    _flush_timer:   threading.Timer     # Debounce timer for writing changes
+
+    # Snapshot of the content is stored for some sequence numbers. Changes before the
+    # oldest snapshot are removed from the log, and the header keeps that sequence as "base"
+    _snapshots:     list                # Sorted sequence numbers of the stored snapshots
+    _base:          int                 # Changes up to this sequence number were folded
+    _replaced:      int                 # Sequence number when the content was last replaced without the log
+
+    _lock:          threading.RLock
+
+    # region : Initialize
+
+    def __init__( self ):
+        """
+        Default constructor for change log object.
+
+        Receive: None
+
+        Returns:
+        - c_change_log: Change log object
+        """
+
+        self._path          = None
+        self._sequence      = 0
+
+        self._epoch         = secrets.token_hex( 4 )
+        self._recent        = deque( maxlen=RECENT_CHANGES )
+
+        self._pending       = [ ]
+        self._flush_timer   = None
+        self._index         = c_change_index( )
+
+        self._snapshots     = [ ]
+        self._base          = 0
+        self._replaced      = 0
+
+        self._lock          = threading.RLock( )
+
+
+    def open( self, path: str, original_file: str, file_type: str ):
+        """
+        Attach the log to a log file. Create it if needed, or convert it if it uses the old format.
+
+        Receive:
+        - path (str): Full path of the log file
+        - original_file (str): Name of the logged file
+        - file_type (str): Type of the logged file
+
+        Returns: None
+        """
+
+        with self._lock:
+            self.flush( )
+
+            self._path = path
+
+            self._epoch = secrets.token_hex( 4 )
+            self._recent.clear( )
+
+            self._base  = 0
+            self.__load_snapshots( )
+
+            if not os.path.exists( path ):
+                self._sequence = 0
+
+                with open( path, "wb" ) as f:
+                    f.write( self.__encode( { "seq": 0, "original_file": original_file, "file_type": file_type } ) )
+
+                self._index.open( f"{ path }.index" )
+                self._index.reset( )
+                return
+            
+            self.convert( )
+            self.__load_sequence( )
+
+            # The index is trusted only if it ends with the same change as the log
+            if not self._index.open( f"{ path }.index" ) or self._index.last_sequence( ) != self._sequence:
+                self.__rebuild_index( )
+
+    # endregion
+
+    # region : Access
+
+    def path( self, new_value: str = None ) -> str:
+        """
+        Get/Set the log file path.
+
+        Receive:
+        - new_value (str, optional): New path for the log
+
+        Returns:
+        - str: Current path
+        """
+
+        if new_value is None:
+            return self._path
+        
+        with self._lock:
+            self._path = new_value
+
+        return self._path
+    
+
+    def sequence( self ) -> int:
+        """
+        Get the sequence number of the last change.
+
+        Receive: None
+
+        Returns:
+        - int: Sequence number
+        """
+
+        return self._sequence
+    
+
+    def version( self ) -> str:
+        """
+        Get the version of the last change.
+
+        Receive: None
+
+        Returns:
+        - str: Version in format epoch:sequence
+        """
+
+        return f"{ self._epoch }:{ self._sequence }"
+    
+
+    def new_epoch( self ):
+        """
+        Start a new epoch. Used when the file was changed without the log.
+
+        Receive: None
+
+        Returns: None
+        """
+
+        with self._lock:
+            self._epoch = secrets.token_hex( 4 )
+            self._recent.clear( )
+
+            # Blame does not go before this point
+            if self._path is not None and self._replaced != self._sequence:
+                self._replaced = self._sequence
+                self.__save_snapshots( )
+
+
+    def changes_since( self, version: str, until: str = None ) -> list:
+        """
+        Get the changes that happened after a specific version.
+
+        Receive:
+        - version (str): Known version
+        - until (str, optional): Last version to include
+
+        Returns:
+        - list: List of changes, or None if the version is too old or unknown
+        """
+
+        start:  int = self.__parse_version( version )
+        end:    int = self._sequence if until is None else self.__parse_version( until )
+
+        if start is None or end is None or start > end:
+            return None
+
+        with self._lock:
+            if end > self._sequence:
+                return None
+            
+            if start == end:
+                return [ ]
+            
+            # The first needed change must still be in memory
+            if len( self._recent ) == 0 or self._recent[ 0 ][ "seq" ] > start + 1:
+                return None
+            
+            return [ change for change in self._recent if start < change[ "seq" ] <= end ]
+
+
+    def entries( self, after_sequence: int = 0, until_sequence: int = None ) -> list:
+        """
+        Read the changes from the log.
+
+        Receive:
+        - after_sequence (int, optional): Return only changes after this sequence number
+        - until_sequence (int, optional): Return only changes up to this sequence number
+
+        Returns:
+        - list: List of changes
+        """
+
+        with self._lock:
+            self.flush( )
+
+            result: list = [ ]
+
+            with open( self._path, "rb" ) as f:
+                for raw_line in f:
+                    if not raw_line.strip( ):
+                        continue
+
+                    entry: dict = json.loads( raw_line )
+                    sequence: int = entry.get( "seq", 0 )
+
+                    if until_sequence is not None and sequence > until_sequence:
+                        break
+
+                    if sequence > after_sequence:
+                        result.append( entry )
+
+            return result
+    
+    # endregion
+
+    # region : Changes
+
+    def append( self, change: dict ) -> int:
+        """
+        Register a new change.
+
+        Receive:
+        - change (dict): Change information
+
+        Returns:
+        - int: Sequence number of the change
+        """
+
+        with self._lock:
+            self._sequence += 1
+
+            change[ "seq" ]     = self._sequence
+            change[ "time" ]    = time.strftime( "%y-%m-%d %H:%M:%S", time.localtime( ) )
+            change[ "stamp" ]   = time.time( )
+
+            self._pending.append( ( change, self.__encode( change ) ) )
+            self._recent.append( change )
+
+            if self._flush_timer is None:
+                self._flush_timer = threading.Timer( FLUSH_DELAY, safe_call( c_debug.log_error )( self.flush ) )
+                self._flush_timer.daemon = True
+                self._flush_timer.start( )
+
+            return self._sequence
+
+
+    def flush( self ) -> bool:
+        """
+        Append the pending changes to the log file.
+
+        Receive: None
+
+        Returns:
+        - bool: True if anything was written
+        """
+
+        with self._lock:
+            if self._flush_timer is not None:
+                self._flush_timer.cancel( )
+                self._flush_timer = None
+
+            if len( self._pending ) == 0:
+                return False
+            
+            with open( self._path, "ab" ) as f:
+                offset: int = f.tell( )
+
+                f.write( b"".join( encoded for change, encoded in self._pending ) )
+
+            records: list = [ ]
+            for change, encoded in self._pending:
+                records.append( ( change, offset ) )
+                offset += len( encoded )
+
+            self._index.add( records )
+
+            self._pending.clear( )
+
+        return True
+    
+
+    def convert( self ) -> bool:
+        """
+        Convert a log that uses the old single json format into json lines.
+
+        Receive: None
+
+        Returns:
+        - bool: True if the log was converted
+        """
+
+        with self._lock:
+            with open( self._path, "rb" ) as f:
+                first_line: bytes = f.readline( )
+                
+                if not first_line.strip( ):
+                    return False
+
+                header: dict = json.loads( first_line )
+                if "seq" in header:
+                    return False
+
+            # Old format. Single object, where every change is keyed by its time
+            result: list = [ self.__encode( { "seq": 0, "original_file": header.pop( "original_file", None ), "file_type": header.pop( "file_type", None ) } ) ]
+
+            sequence: int = 0
+            for change_time, change in header.items( ):
+                sequence += 1
+
+                change[ "seq" ]     = sequence
+                change[ "time" ]    = change_time
+
+                result.append( self.__encode( change ) )
+
+            temp_path: str = f"{ self._path }.tmp"
+            with open( temp_path, "wb" ) as f:
+                f.write( b"".join( result ) )
+
+            os.replace( temp_path, self._path )
+
+            self._sequence = sequence
+
+        return True
+
+
+    def move( self, new_path: str ):
+        """
+        Rename the log file and its snapshots.
+
+        Receive:
+        - new_path (str): New path for the log
+
+        Returns: None
+        """
+
+        with self._lock:
+            self.flush( )
+
+            os.rename( self._path, new_path )
+
+            for sequence in self._snapshots:
+                os.rename( self.__snapshot_path( sequence ), f"{ new_path }.{ sequence }.snapshot" )
+
+            if os.path.exists( f"{ self._path }.snapshots" ):
+                os.rename( f"{ self._path }.snapshots", f"{ new_path }.snapshots" )
+
+            self._index.move( f"{ new_path }.index" )
+
+            self._path = new_path
+
+    # endregion
+
+    # region : Snapshots
+
+    def snapshots( self ) -> list:
+        """
+        Get the sequence numbers that have a stored snapshot.
+
+        Receive: None
+
+        Returns:
+        - list: Sorted sequence numbers
+        """
+
+        with self._lock:
+            return self._snapshots.copy( )
+        
+
+    def needs_snapshot( self ) -> bool:
+        """
+        Check if enough changes were made since the last snapshot.
+
+        Receive: None
+
+        Returns:
+        - bool: Result
+        """
+
+        with self._lock:
+            # The first snapshot is taken right before the first change
+            if len( self._snapshots ) == 0:
+                return False
+            
+            return self._sequence - self._snapshots[ -1 ] >= SNAPSHOT_CHANGES
+        
+
+    def add_snapshot( self, sequence: int, data: bytes ):
+        """
+        Store the content of the file after a specific change.
+
+        Receive:
+        - sequence (int): Sequence number of the last change included in the content
+        - data (bytes): File content
+
+        Returns: None
+        """
+
+        with self._lock:
+            path:       str = self.__snapshot_path( sequence )
+            temp_path:  str = f"{ path }.tmp"
+
+            with open( temp_path, "wb" ) as f:
+                f.write( self.__encode( { "seq": sequence, "time": time.strftime( "%y-%m-%d %H:%M:%S", time.localtime( ) ) } ) )
+                f.write( data )
+
+            os.replace( temp_path, path )
+
+            if sequence not in self._snapshots:
+                bisect.insort( self._snapshots, sequence )
+                self.__save_snapshots( )
+
+
+    def nearest_snapshot( self, sequence: int ) -> int:
+        """
+        Find the latest snapshot that was taken before a specific change.
+
+        Receive:
+        - sequence (int): Sequence number
+
+        Returns:
+        - int: Sequence number of the snapshot or None if there is no such snapshot
+        """
+
+        with self._lock:
+            index: int = bisect.bisect_right( self._snapshots, sequence )
+            if index == 0:
+                return None
+            
+            return self._snapshots[ index - 1 ]
+        
+
+    def read_snapshot( self, sequence: int ) -> bytes:
+        """
+        Read the content stored in a snapshot.
+
+        Receive:
+        - sequence (int): Sequence number of the snapshot
+
+        Returns:
+        - bytes: File content or None if there is no such snapshot
+        """
+
+        with self._lock:
+            if sequence not in self._snapshots:
+                return None
+            
+            with open( self.__snapshot_path( sequence ), "rb" ) as f:
+                f.readline( )
+
+                return f.read( )
+            
+
+    def compact( self, keep: int = SNAPSHOT_KEEP, rate: int = COMPACT_RATE ) -> bool:
+        """
+        Fold old changes into the oldest kept snapshot.
+        The log is copied without holding the lock, and only the changes appended meanwhile
+        are copied under it. Reading is limited to rate bytes per second.
+
+        Receive:
+        - keep (int, optional): Snapshots to keep
+        - rate (int, optional): Bytes per second to read
+
+        Returns:
+        - bool: True if the log was compacted
+        """
+
+        with self._lock:
+            if len( self._snapshots ) <= keep or self._path is None:
+                return False
+            
+            self.flush( )
+
+            path:       str = self._path
+            base:       int = self._snapshots[ -keep ]
+            end:        int = os.path.getsize( path )
+
+        temp_path:  str     = f"{ path }.tmp"
+        started:    float   = time.monotonic( )
+        records:    list    = [ ]
+
+        with open( path, "rb" ) as source, open( temp_path, "wb" ) as target:
+            header: dict = json.loads( source.readline( ) )
+            header[ "base" ] = base
+
+            target.write( self.__encode( header ) )
+
+            while source.tell( ) < end:
+                raw_line: bytes = source.readline( )
+                if not raw_line:
+                    break
+
+                if raw_line.strip( ):
+                    change: dict = json.loads( raw_line )
+
+                    if change.get( "seq", 0 ) > base:
+                        records.append( ( change, target.tell( ) ) )
+                        target.write( raw_line )
+
+                # Keep the disk usage bounded
+                delay: float = source.tell( ) / rate - ( time.monotonic( ) - started )
+                if delay > 0:
+                    time.sleep( delay )
+
+        # The new index is built from the copied changes, also without holding the lock
+        index: c_change_index = c_change_index( )
+        index.open( f"{ temp_path }.index" )
+        index.reset( )
+        index.add( records )
+
+        with self._lock:
+            if self._path != path:
+                # Renamed meanwhile. Try again next time
+                os.remove( temp_path )
+                index.remove( )
+                return False
+            
+            self.flush( )
+
+            records = [ ]
+
+            with open( path, "rb" ) as source, open( temp_path, "ab" ) as target:
+                source.seek( end )
+
+                for raw_line in source:
+                    if raw_line.strip( ):
+                        records.append( ( json.loads( raw_line ), target.tell( ) ) )
+
+                    target.write( raw_line )
+
+            index.add( records )
+
+            os.replace( temp_path, path )
+            index.move( f"{ path }.index" )
+
+            self._base  = base
+            self._index = index
+
+            for sequence in [ sequence for sequence in self._snapshots if sequence < base ]:
+                os.remove( self.__snapshot_path( sequence ) )
+                self._snapshots.remove( sequence )
+
+            self.__save_snapshots( )
+
+        return True
+
+    # endregion
+
+    # region : History
+
+    def query( self, start_line: int = None, end_line: int = None, user: str = None, since: float = None, until: float = None, limit: int = HISTORY_LIMIT ) -> list:
+        """
+        Find changes by the line they were made in, their user and their time.
+
+        Receive:
+        - start_line (int, optional): First line of the range
+        - end_line (int, optional): Last line of the range
+        - user (str, optional): Username
+        - since (float, optional): Earliest time, in seconds since epoch
+        - until (float, optional): Latest time, in seconds since epoch
+        - limit (int, optional): Maximum amount of changes
+
+        Returns:
+        - list: Changes, newest first
+        """
+
+        with self._lock:
+            self.flush( )
+
+            offsets: list = self._index.query( start_line, end_line, user, since, until, limit )
+
+            return self.__read_entries( offsets )
+        
+
+    def blame( self, line: int ) -> dict:
+        """
+        Find the last change that wrote a line of the current content.
+
+        Receive:
+        - line (int): Line number in the current content
+
+        Returns:
+        - dict: Change or None if the line was not changed since the oldest kept change
+        """
+
+        with self._lock:
+            self.flush( )
+
+            offset: int = self._index.blame( line, self._replaced )
+            if offset is None:
+                return None
+            
+            return self.__read_entries( [ offset ] )[ 0 ]
+        
+
+    def __read_entries( self, offsets: list ) -> list:
+        """
+        Read specific changes from the log.
+
+        Receive:
+        - offsets (list): Positions of the changes in the log
+
+        Returns:
+        - list: Changes
+        """
+
+        result: list = [ ]
+
+        if len( offsets ) == 0:
+            return result
+
+        with open( self._path, "rb" ) as f:
+            for offset in offsets:
+                f.seek( offset )
+                result.append( json.loads( f.readline( ) ) )
+
+        return result
+    
+
+    def __rebuild_index( self ):
+        """
+        Index every change in the log again.
+
+        Receive: None
+
+        Returns: None
+        """
+
+        records:    list    = [ ]
+        offset:     int     = 0
+
+        with open( self._path, "rb" ) as f:
+            for raw_line in f:
+                if raw_line.strip( ):
+                    change: dict = json.loads( raw_line )
+
+                    if change.get( "seq", 0 ) > 0:
+                        records.append( ( change, offset ) )
+
+                offset += len( raw_line )
+
+        self._index.reset( )
+        self._index.add( records )
+
+    # endregion
+
+    # region : Utilities
+
+    def __parse_version( self, version: str ) -> int:
+        """
+        Get the sequence number from a version of this epoch.
+
+        Receive:
+        - version (str): Version in format epoch:sequence
+
+        Returns:
+        - int: Sequence number or None if the version is not from this epoch
+        """
+
+        if not isinstance( version, str ) or version.count( ":" ) != 1:
+            return None
+        
+        epoch, sequence = version.split( ":" )
+        if epoch != self._epoch:
+            return None
+        
+        return math.cast_to_number( sequence )
+
+
+    def __load_sequence( self ):
+        """
+        Load the last sequence number from the end of the log file.
+
+        Receive: None
+
+        Returns: None
+        """
+
+        self._sequence = 0
+
+        with open( self._path, "rb" ) as f:
+            f.seek( 0, os.SEEK_END )
+            position:   int     = f.tell( )
+            data:       bytes   = b""
+
+            # Read backwards until we have the last full line
+            while position > 0:
+                size: int = min( 4096, position )
+                position -= size
+
+                f.seek( position )
+                data = f.read( size ) + data
+
+                if data.rstrip( ).count( b"\n" ) > 0:
+                    break
+
+        with open( self._path, "rb" ) as f:
+            self._base = json.loads( f.readline( ) or b"{}" ).get( "base", 0 )
+
+        self._sequence = self._base
+
+        lines: list = data.rstrip( ).split( b"\n" )
+        if len( lines ) == 0 or not lines[ -1 ].strip( ):
+            return
+        
+        # After compaction the header can be the last line
+        self._sequence = max( json.loads( lines[ -1 ] ).get( "seq", 0 ), self._base )
+
+
+    def __snapshot_path( self, sequence: int ) -> str:
+        """
+        Get the path of a snapshot.
+
+        Receive:
+        - sequence (int): Sequence number of the snapshot
+
+        Returns:
+        - str: Full path
+        """
+
+        return f"{ self._path }.{ sequence }.snapshot"
+    
+
+    def __load_snapshots( self ):
+        """
+        Load the list of the stored snapshots of the log, and the last time the content was replaced.
+        The list is kept in its own file, so the folder is never listed.
+
+        Receive: None
+
+        Returns: None
+        """
+
+        self._snapshots = [ ]
+        self._replaced  = 0
+
+        if not os.path.exists( f"{ self._path }.snapshots" ):
+            return
+
+        try:
+            with open( f"{ self._path }.snapshots", "rb" ) as f:
+                information: dict = json.loads( f.read( ) )
+
+        except Exception as e:
+            c_debug.log_error( f"Failed to load snapshots list { self._path }. { e }" )
+            return
+
+        self._snapshots = sorted( sequence for sequence in information[ "snapshots" ] if os.path.exists( self.__snapshot_path( sequence ) ) )
+        self._replaced  = information[ "replaced" ]
+
+
+    def __save_snapshots( self ):
+        """
+        Write the list of the stored snapshots, and the last time the content was replaced.
+
+        Receive: None
+
+        Returns: None
+        """
+
+        temp_path: str = f"{ self._path }.snapshots.tmp"
+
+        with open( temp_path, "wb" ) as f:
+            f.write( json.dumps( { "snapshots": self._snapshots, "replaced": self._replaced } ).encode( ) )
+
+        os.replace( temp_path, f"{ self._path }.snapshots" )
+
+
+    def __encode( self, value: dict ) -> bytes:
+        """
+        Encode a single log line.
+
+        Receive:
+        - value (dict): Information to encode
+
+        Returns:
+        - bytes: Json line
+        """
+
+        return json.dumps( value ).encode( ) + b"\n"
+
+    # endregion
+
+
+class c_lock_table:
+
+    # NOTE ! The lock table is shared between every copy of the same virtual file.
+
+    _locks:     dict                # Line number -> ( owner, session )
+    _lock:      threading.RLock
+
+    # region : Initialize
+
+    def __init__( self ):
+        """
+        Default constructor for lock table object.
+
+        Receive: None
+
+        Returns:
+        - c_lock_table: Lock table object
+        """
+
+        self._locks = { }
+        self._lock  = threading.RLock( )
+
+    # endregion
+
+    # region : Locks
+
+    def lock( self, line: int, owner: str = "?", session: any = None ) -> bool:
+        """
+        Lock a line if it is free.
+
+        Receive:
+        - line (int): Line number
+        - owner (str, optional): Username of the owner
+        - session (any, optional): Session object of the owner
+
+        Returns:
+        - bool: True if the line was locked by this call
+        """
+
+        with self._lock:
+            if line in self._locks:
+                return False
+            
+            self._locks[ line ] = ( owner, session )
+
+        return True
+    
+
+    def unlock( self, line: int ) -> bool:
+        """
+        Unlock a line.
+
+        Receive:
+        - line (int): Line number
+
+        Returns:
+        - bool: True if the line was locked before
+        """
+
+        with self._lock:
+            return self._locks.pop( line, None ) is not None
+        
+
+    def is_locked( self, line: int ) -> bool:
+        """
+        Check if a line is locked.
+
+        Receive:
+        - line (int): Line number
+
+        Returns:
+        - bool: Result
+        """
+
+        return line in self._locks
+    
+
+    def owner( self, line: int ) -> str:
+        """
+        Get the owner of a locked line.
+
+        Receive:
+        - line (int): Line number
+
+        Returns:
+        - str: Owner username or None if not locked
+        """
+
+        information: tuple = self._locks.get( line )
+        if information is None:
+            return None
+        
+        return information[ 0 ]
+    
+
+    def session( self, line: int ) -> any:
+        """
+        Get the session that locked a line.
+
+        Receive:
+        - line (int): Line number
+
+        Returns:
+        - any: Session object or None if not locked
+        """
+
+        information: tuple = self._locks.get( line )
+        if information is None:
+            return None
+        
+        return information[ 1 ]
+    
+
+    def lines( self ) -> list:
+        """
+        Get the locked lines.
+
+        Receive: None
+
+        Returns:
+        - list: Sorted list of locked lines
+        """
+
+        with self._lock:
+            return sorted( self._locks )
+        
+
+    def shift( self, line: int, delta: int ):
+        """
+        Move every lock after a specific line. Used when lines are added or removed.
+
+        Receive:
+        - line (int): Edited line. Locks below it are moved
+        - delta (int): How many lines to move by
+
+        Returns: None
+        """
+
+        if delta == 0:
+            return
+        
+        with self._lock:
+            self._locks = { ( locked_line + delta if locked_line > line else locked_line ): information for locked_line, information in self._locks.items( ) }
+
+    # endregion
+
+
+class c_file_cache:
+
+    # NOTE ! Client side cache of received files content.
+    # Content is stored by its digest, and an index keeps the last digest and version of each file.
+
+    _path:      str             # Cache folder
+    _index:     dict            # File name -> { "digest", "version" }
+    _lock:      threading.Lock
+
+    # region : Initialize
+
+    def __init__( self, path: str ):
+        """
+        Default constructor for file cache object.
+
+        Receive:
+        - path (str): Folder to keep the cache in
+
+        Returns:
+        - c_file_cache: File cache object
+        """
+
+        self._path  = path
+        self._index = { }
+        self._lock  = threading.Lock( )
+
+        self.__load_index( )
+
+    # endregion
+
+    # region : Access
+
+    def digest( self, name: str ) -> str:
+        """
+        Get the digest of the cached content of a file.
+
+        Receive:
+        - name (str): File name
+
+        Returns:
+        - str: Digest or None if the file is not cached
+        """
+
+        information: dict = self._index.get( name )
+        if information is None:
+            return None
+        
+        digest: str = information[ "digest" ]
+        if not os.path.exists( self.__content_path( digest ) ):
+            return None
+        
+        return digest
+    
+
+    def version( self, name: str ) -> str:
+        """
+        Get the host version of the cached content of a file.
+
+        Receive:
+        - name (str): File name
+
+        Returns:
+        - str: Version or None if unknown
+        """
+
+        if self.digest( name ) is None:
+            return None
+        
+        return self._index[ name ].get( "version" )
+    
+
+    def load( self, digest: str ) -> bytes:
+        """
+        Load cached content.
+
+        Receive:
+        - digest (str): Content digest
+
+        Returns:
+        - bytes: Content or None if missing or corrupted
+        """
+
+        path: str = self.__content_path( digest )
+        if not os.path.exists( path ):
+            return None
+        
+        with open( path, "rb" ) as f:
+            data: bytes = f.read( )
+
+        if hashlib.blake2b( data, digest_size=DIGEST_SIZE ).hexdigest( ) != digest:
+            return None
+        
+        return data
+    
+
+    def store( self, name: str, digest: str, data: bytes, version: str = None ):
+        """
+        Store content of a file.
+
+        Receive:
+        - name (str): File name
+        - digest (str): Content digest
+        - data (bytes): Content
+        - version (str, optional): Host version of the content
+
+        Returns: None
+        """
+
+        with self._lock:
+            os.makedirs( self._path, exist_ok=True )
+
+            path: str = self.__content_path( digest )
+            if not os.path.exists( path ):
+                with open( path, "wb" ) as f:
+                    f.write( data )
+
+            old_information: dict = self._index.get( name )
+            self._index[ name ] = { "digest": digest, "version": version }
+
+            if old_information is not None:
+                self.__release( old_information[ "digest" ] )
+            self.__save_index( )
+    
+
+    def forget( self, name: str ):
+        """
+        Remove a file from the cache.
+
+        Receive:
+        - name (str): File name
+
+        Returns: None
+        """
+
+        with self._lock:
+            old_information: dict = self._index.pop( name, None )
+            if old_information is None:
+                return
+            
+            self.__release( old_information[ "digest" ] )
+            self.__save_index( )
+
+
+    def rename( self, old_name: str, new_name: str ):
+        """
+        Move the cache of a file to a new name.
+
+        Receive:
+        - old_name (str): Old file name
+        - new_name (str): New file name
+
+        Returns: None
+        """
+
+        with self._lock:
+            information: dict = self._index.pop( old_name, None )
+            if information is None:
+                return
+            
+            self._index[ new_name ] = information
+            self.__save_index( )
+
+
+    def apply_operations( self, data: bytes, operations: list ) -> bytes:
+        """
+        Apply line operations received from delta sync on raw content.
+
+        Receive:
+        - data (bytes): Raw content of the known version
+        - operations (list): Operations as [ line, added lines ] or [ line ]
+
+        Returns:
+        - bytes: Content after the operations, encoded the same way the host does
+        """
+
+        if len( operations ) == 0:
+            return data
+        
+        if data.endswith( b'\n' ):
+            data = data + b'\r'
+
+        lines: list = data.decode( ).splitlines( )
+
+        for operation in operations:
+            line: int = operation[ 0 ] - 1
+
+            if len( operation ) > 1:
+                lines[ line:line + 1 ] = operation[ 1 ]
+            else:
+                lines.pop( line )
+
+        return os.linesep.join( lines ).encode( )
+
+    # endregion
+
+    # region : Utilities
+
+    def __content_path( self, digest: str ) -> str:
+        """
+        Get the path of cached content.
+
+        Receive:
+        - digest (str): Content digest
+
+        Returns:
+        - str: Path of the content file
+        """
+
+        return os.path.join( self._path, f"{ digest }.cache" )
+    
+
+    def __release( self, digest: str ):
+        """
+        Remove content that no file points to anymore.
+
+        Receive:
+        - digest (str): Content digest
+
+        Returns: None
+        """
+
+        if digest is None:
+            return
+        
+        for information in self._index.values( ):
+            if information[ "digest" ] == digest:
+                return
+        
+        path: str = self.__content_path( digest )
+        if os.path.exists( path ):
+            os.remove( path )
+
 
-FILES_COMMAND_REQ_FILES = "ReqFiles"
-FILES_COMMAND_RES_FILES = "ResFiles"
+    def __load_index( self ):
+        """
+        Load the cache index from the disk.
 
-FILES_COMMAND_GET_FILE = "GetFileCont"
-FILES_COMMAND_SET_FILE = "SetFileCont"
+        Receive: None
 
-FILES_COMMAND_PREPARE_UPDATE    = "PrepUpdateLine"
-FILES_COMMAND_PREPARE_RESPONSE  = "ResPrepUpdate"
-FILES_COMMAND_UPDATE_LINE       = "UpdateLine"
-FILES_COMMAND_DELETE_LINE       = "DelLine"
-FILES_COMMAND_DISCARD_UPDATE    = "DisUpdateLine"
-FILES_COMMAND_UPDATE_FILE       = "UpdateFile"   # Use this command to update file access level and register new files
-FILES_COMMAND_UPDATE_FILE_NAME  = "ChangeFileName"
+        Returns: None
+        """
 
-# This command is extremely important.
-# FILES_COMMAND_APPLY_UPDATE - Update_ENUM - Update details
-FILES_COMMAND_APPLY_UPDATE      = "ApplyUpdateLine"
+        path: str = os.path.join( self._path, "index.json" )
+        if not os.path.exists( path ):
+            return
+        
+        try:
+            with open( path, "r" ) as f:
+                self._index = json.load( f )
+        except Exception:
+            self._index = { }
+    
 
-FILE_ACCESS_LEVEL_HIDDEN    = 0     # This file should be hidden ( used only for host )
-FILE_ACCESS_LEVEL_EDIT      = 1     # This file can be edited
-FILE_ACCESS_LEVEL_LIMIT     = 2     # This file cannot be edited
+    def __save_index( self ):
+        """
+        Write the cache index to the disk.
 
-FILE_UPDATE_CONTENT = 0
-FILE_UPDATE_NAME    = 1
+        Receive: None
+
+        Returns: None
+        """
+
+        with open( os.path.join( self._path, "index.json" ), "w" ) as f:
+            json.dump( self._index, f )
+
+    # endregion
 
 
 class c_virtual_file:
@@ -55,7 +2569,10 @@ class c_virtual_file:
     _normal_path:           str     # Project new folder path
 
     _access_level:          int     # File's access level
-    _locked_lines:          list    # File's locked lines
+    _locked_lines:          c_lock_table    # File's locked lines. Shared between copies
+
+    _buffer:                c_line_buffer   # File's lines in memory. Shared between copies
+    _change_log:            c_change_log    # File's changes history. Shared between copies
 
     _content:               list    # File's content
 
@@ -82,7 +2599,10 @@ class c_virtual_file:
         self._normal_path   = None
 
         self._content       = [ ]
-        self._locked_lines  = [ ]
+        self._locked_lines  = c_lock_table( )
+
+        self._buffer        = c_line_buffer( )
+        self._change_log    = c_change_log( )
 
 
     def __create_logging_file( self ):
@@ -102,16 +2622,7 @@ class c_virtual_file:
         file_name = f"{ file_name }_changes.txt"
         file_path = f"{ self._normal_path }\\{ file_name }"
 
-        if os.path.exists( file_path ):
-            return
-
-        with open( file_path, "w" ) as f:
-            json.dump( 
-                { 
-                    "original_file":    self._name,
-                    "file_type":        file_type
-                }, 
-            f )
+        self._change_log.open( file_path, self._name, file_type )
 
     # endregion
 
@@ -139,6 +2650,7 @@ class c_virtual_file:
                 f.write( "\n" )
 
             self._normal_path = path
+            self._buffer.path( file_path )
 
             self.__create_logging_file( )
 
@@ -169,12 +2681,36 @@ class c_virtual_file:
         try:
             os.makedirs( os.path.dirname( file_path_to ), exist_ok=True )
 
-            shutil.copy( file_path_from, file_path_to )
+            with self._buffer.transaction( ):
+
+                # Changes in memory are written first, so nothing is lost if the copy fails.
+                # A mapped file cannot be replaced on Windows, so the transfers that map it must end before
+                self._buffer.flush( READER_TIMEOUT )
+
+                if self._buffer.is_dirty( ) or not self._buffer.wait_readers( READER_TIMEOUT ):
+                    return f"File { file_path_to } is still being transferred"
+
+                temp_path: str = f"{ file_path_to }.tmp"
+                shutil.copy( file_path_from, temp_path )
+
+                os.replace( temp_path, file_path_to )
+
+                # The real file was replaced, drop anything that was loaded before
+                self._buffer.unload( )
 
             self._normal_path = path_to
+            self._buffer.path( file_path_to )
 
             self.__create_logging_file( )
 
+            # Like in .reload( ), the log does not include this change. Without snapshots
+            # the first change takes one, so only a log that already has some needs it now
+            if self._log_changes:
+                self._change_log.new_epoch( )
+
+                if len( self._change_log.snapshots( ) ) > 0:
+                    self.snapshot( )
+
         except Exception as e:
             return str( e )
     
@@ -192,6 +2728,7 @@ class c_virtual_file:
         """
 
         self._normal_path = path
+        self._buffer.path( f"{ path }\\{ self._name }" )
 
         self.__create_logging_file( )
 
@@ -212,6 +2749,8 @@ class c_virtual_file:
         self._original_path = original._original_path
         self._normal_path   = original._normal_path
         self._locked_lines  = original._locked_lines
+        self._buffer        = original._buffer
+        self._change_log    = original._change_log
         
         return self 
 
@@ -257,15 +2796,17 @@ class c_virtual_file:
         name_path: str = f"{ self._normal_path }\\{ new_name }"
 
         if should_operate:
+            self._buffer.flush( )
+
             os.rename( file_path, name_path )
+            self._buffer.path( name_path )
 
         if should_operate and self._log_changes:
             file_name, file_type = self.name( True )
 
-            file_path = f"{ self._normal_path }\\{ file_name }_changes.txt"
             name_path = f"{ self._normal_path }\\{ new_name.rsplit( '.', 1 )[ 0 ] }_changes.txt"
 
-            os.rename( file_path, name_path )
+            self._change_log.move( name_path )
         
         self._name = new_name
 
@@ -316,9 +2857,7 @@ class c_virtual_file:
         if not os.path.exists( file_path ):
             return -1
         
-        size:       int = os.path.getsize( file_path )
-
-        return size
+        return self._buffer.size( )
 
     # endregion
 
@@ -339,14 +2878,92 @@ class c_virtual_file:
         if self._normal_path is None:
             return None
         
-        file_path   = f"{ self._normal_path }\\{ self._name }"
-        data        = b''
+        return self._buffer.data( )[ start:end ]
+    
 
-        with open( file_path, 'rb' ) as f:
-            f.seek( start )
-            data = f.read( end - start )
+    def open_reader( self ) -> c_file_reader:
+        """
+        Open a reader for transfering the file's content.
+        The reader keeps the content as it was when opened.
 
-        return data
+        Receive: None
+
+        Returns:
+        - c_file_reader: Reader object. Use with `with` or call .close( )
+        """
+
+        if self._normal_path is None:
+            return None
+        
+        with self._buffer.transaction( ):
+            reader: c_file_reader = self._buffer.open_reader( )
+
+            if self._log_changes:
+                reader.version( self._change_log.version( ) )
+
+        return reader
+    
+
+    def version( self ) -> str:
+        """
+        Get the version of the file's content.
+
+        Receive: None
+
+        Returns:
+        - str: Version or None if changes are not logged
+        """
+
+        if not self._log_changes:
+            return None
+        
+        return self._change_log.version( )
+    
+
+    def changes_since( self, version: str, until: str = None ) -> list:
+        """
+        Get the line operations that happened after a specific version.
+
+        Receive:
+        - version (str): Known version
+        - until (str, optional): Last version to include
+
+        Returns:
+        - list: Operations as [ line, added lines ] for change or [ line ] for remove.
+                None if the version cannot be used
+        """
+
+        if not self._log_changes:
+            return None
+        
+        changes: list = self._change_log.changes_since( version, until )
+        if changes is None:
+            return None
+        
+        result: list = [ ]
+        for change in changes:
+            if "added" in change:
+                result.append( [ change[ "line" ], change[ "added" ] ] )
+            else:
+                result.append( [ change[ "line" ] ] )
+
+        return result
+    
+
+    def digest( self ) -> str:
+        """
+        Get the digest of the file's content.
+
+        Receive: None
+
+        Returns:
+        - str: Hex BLAKE2b digest or None if the file is not attached
+        """
+
+        if self._normal_path is None:
+            return None
+        
+        return self._buffer.digest( )
     
 
     def read_lines( self ) -> list:
@@ -362,16 +2979,107 @@ class c_virtual_file:
         if self._normal_path is None:
             return None
         
-        file_path   = f"{ self._normal_path }\\{ self._name }"
-        data        = b''
+        return self._buffer.lines( )
+    
 
-        with open( file_path, 'rb' ) as f:
-            data = f.read( )
+    def read_line_range( self, start: int, end: int ) -> list:
+        """
+        Read specific lines from the file.
+        If the file wasn't edited yet, only the requested part is read from disk.
 
-        if data.endswith( b'\n' ):
-            data = data + b'\r'
+        Receive:
+        - start (int): First line ( starts from 1 )
+        - end (int): Line after the last one
+
+        Returns:
+        - list: List of string that represents the lines
+        """
+
+        if self._normal_path is None:
+            return None
+        
+        return self._buffer.line_range( start, end )
+    
+
+    def line_span( self, line: int ) -> tuple:
+        """
+        Get where a specific line is placed in the file's content.
+
+        Receive:
+        - line (int): Line number ( starts from 1 )
+
+        Returns:
+        - tuple: Start byte and end byte of the line, including its line break. None if the line does not exist
+        """
+
+        if self._normal_path is None:
+            return None
+        
+        return self._buffer.line_span( line )
+    
 
-        return data.decode( ).splitlines( )
+    def lines_count( self ) -> int:
+        """
+        Get the number of lines in the file.
+
+        Receive: None
+
+        Returns:
+        - int: Lines count
+        """
+
+        if self._normal_path is None:
+            return 0
+        
+        return self._buffer.line_count( )
+    
+
+    def reload( self ) -> bool:
+        """
+        Reload the file after it was changed on disk by someone else.
+
+        Receive: None
+
+        Returns:
+        - bool: True if the content was changed
+        """
+
+        if self._normal_path is None:
+            return False
+        
+        if not self._buffer.reload( ):
+            return False
+        
+        # Known versions do not describe this content anymore
+        if self._log_changes:
+            self._change_log.new_epoch( )
+
+            # The log does not include this change. Keep the new content as the state of the last change
+            self.snapshot( )
+
+        return True
+
+
+    def save( self, timeout: float = 0 ) -> bool:
+        """
+        Write pending changes of the file to disk.
+
+        Receive:
+        - timeout (float, optional): Seconds to wait for transfers that map the file
+
+        Returns:
+        - bool: True if anything was written
+        """
+
+        if self._normal_path is None:
+            return False
+        
+        result: bool = self._buffer.flush( timeout )
+
+        if self._log_changes and self._change_log.path( ) is not None:
+            result = self._change_log.flush( ) or result
+
+        return result
     
 
     def add_content_line( self, line: str ):
@@ -434,120 +3142,201 @@ class c_virtual_file:
         if self._normal_path is None:
             return False
         
-        file_path   = f"{ self._normal_path }\\{ self._name }"
+        # Keep the edit and its log entry together, so readers get a matching version
+        with self._buffer.transaction( ):
+            self.__ensure_snapshot( )
 
-        # never use .readlines( ). 
-        # This trash actually breaks everything
-        # It has incorrect encoding and more
+            removed_line: str = self._buffer.change( line, new_lines )
 
-        data = b''
-        with open( file_path, "rb" ) as f:
-            data = f.read( )
+            if not self._log_changes:
+                return True
+            
+            change_log[ "line" ]    = line
+            change_log[ "removed" ] = removed_line
+            change_log[ "added" ]   = new_lines
 
-        if data.endswith( b'\n' ):
-            data = data + b'\r'
+            self._change_log.append( change_log )
 
-        lines: list = data.decode( ).splitlines( )
-        del data
+        return True
 
-        line -= 1
-        removed_line = lines.pop( line )
+    
+    @safe_call( c_debug.log_error )
+    def remove_line( self, line: int, change_log: dict ) -> bool:
+        """
+        Remove a specific line from the file.
 
-        for new_line in new_lines:
-            new_line: str = new_line
-            lines.insert( line, new_line )
+        Receive :
+        - line (int): Line to remove
+        - change_log (dict): Ready to add change log
 
-            line += 1
+        Returns: 
+        - bool: Result if success or fail
+        """
 
-        with open( file_path, "wb" ) as f:
-            f.write( os.linesep.join( lines ).encode( ) )
+        if self._normal_path is None:
+            return False
         
-        lines.clear( )
+        with self._buffer.transaction( ):
+            self.__ensure_snapshot( )
 
-        if not self._log_changes:
-            return True
-        
-        file_name, file_type = self.name( True )
-        
-        file_name = f"{ file_name }_changes.txt"
-        file_path = f"{ self._normal_path }\\{ file_name }"
+            removed_line: str = self._buffer.remove( line )
+
+            if not self._log_changes:
+                return True
+            
+            change_log[ "line" ]    = line
+            change_log[ "removed" ] = removed_line
+
+            self._change_log.append( change_log )
 
-        changes: dict
-        with open( file_path, "r" ) as f:
-            changes = json.load( f )
+        return True
 
-        cur_time = time.strftime( "%y-%m-%d %H:%M:%S", time.localtime( ) )
+    # endregion
 
-        change_log[ "line" ]    = line - len( new_lines ) + 1
-        change_log[ "removed" ] = removed_line
-        change_log[ "added" ]   = new_lines
+    # region : History
 
-        changes[ cur_time ] = change_log
+    def snapshot( self ) -> int:
+        """
+        Store the current content of the file together with the log position.
 
-        with open( file_path, "w" ) as f:
-            json.dump( changes, f )
+        Receive: None
 
-        return True
+        Returns:
+        - int: Sequence number of the snapshot or None if the file has no log
+        """
+
+        if self._normal_path is None or not self._log_changes or self._change_log.path( ) is None:
+            return None
+        
+        with self._buffer.transaction( ):
+            data:       bytes   = self._buffer.data( )
+            sequence:   int     = self._change_log.sequence( )
 
+            self._change_log.add_snapshot( sequence, data )
+
+        return sequence
     
-    @safe_call( c_debug.log_error )
-    def remove_line( self, line: int, change_log: dict ) -> bool:
+
+    def maintain_history( self ) -> bool:
         """
-        Remove a specific line from the file.
+        Take a snapshot if enough changes were made, and fold the old changes.
 
-        Receive :
-        - line (int): Line to remove
-        - change_log (dict): Ready to add change log
+        Receive: None
 
-        Returns: 
-        - bool: Result if success or fail
+        Returns:
+        - bool: True if anything was done
         """
 
-        if self._normal_path is None:
+        if self._normal_path is None or not self._log_changes or self._change_log.path( ) is None:
             return False
         
-        file_path   = f"{ self._normal_path }\\{ self._name }"
+        result: bool = False
 
-        data = b''
-        with open( file_path, "rb" ) as f:
-            data = f.read( )
+        if self._change_log.needs_snapshot( ):
+            result = self.snapshot( ) is not None
+
+        return self._change_log.compact( ) or result
+    
+
+    def reconstruct( self, sequence: int ) -> list:
+        """
+        Rebuild the content of the file after a specific change.
+        Starts from the nearest snapshot and applies the logged changes after it.
+
+        Receive:
+        - sequence (int): Sequence number of the change
 
+        Returns:
+        - list: Lines of the file, or None if this version cannot be rebuilt
+        """
+
+        if self._normal_path is None or not self._log_changes or self._change_log.path( ) is None:
+            return None
+        
+        if sequence < 0 or sequence > self._change_log.sequence( ):
+            return None
+        
+        base: int = self._change_log.nearest_snapshot( sequence )
+        if base is None:
+            return None
+        
+        data: bytes = self._change_log.read_snapshot( base )
+        if data is None:
+            return None
+        
+        # Same rules as loading the file
         if data.endswith( b'\n' ):
             data = data + b'\r'
 
-        lines: list = data.decode( ).splitlines( )
-        del data
+        lines: list = data.decode( ).splitlines( )
+
+        for change in self._change_log.entries( base, sequence ):
+            index: int = change[ "line" ] - 1
+
+            if "added" in change:
+                lines[ index:index + 1 ] = change[ "added" ]
+            else:
+                del lines[ index ]
+
+        return lines
+    
+
+    def history( self, start_line: int = None, end_line: int = None, user: str = None, since: float = None, until: float = None, limit: int = HISTORY_LIMIT ) -> list:
+        """
+        Find changes of the file by line range, user and time.
+        Lines are the ones the changes were made in.
+
+        Receive:
+        - start_line (int, optional): First line of the range
+        - end_line (int, optional): Last line of the range
+        - user (str, optional): Username
+        - since (float, optional): Earliest time, in seconds since epoch
+        - until (float, optional): Latest time, in seconds since epoch
+        - limit (int, optional): Maximum amount of changes
+
+        Returns:
+        - list: Changes, newest first. None if the file has no log
+        """
+
+        if not self._log_changes or self._change_log.path( ) is None:
+            return None
+        
+        return self._change_log.query( start_line, end_line, user, since, until, limit )
+    
 
-        removed_line: str = lines.pop( line - 1 )
+    def blame( self, line: int ) -> dict:
+        """
+        Find who changed a line of the current content, and when.
 
-        with open( file_path, "wb" ) as f:
-            f.write( os.linesep.join( lines ).encode( ) )
+        Receive:
+        - line (int): Line number ( starts from 1 )
 
-        lines.clear( )
+        Returns:
+        - dict: Last change that wrote this line or None
+        """
 
-        if not self._log_changes:
-            return True
-        
-        file_name, file_type = self.name( True )
+        if not self._log_changes or self._change_log.path( ) is None:
+            return None
         
-        file_name = f"{ file_name }_changes.txt"
-        file_path = f"{ self._normal_path }\\{ file_name }"
-
-        changes: dict
-        with open( file_path, "r" ) as f:
-            changes = json.load( f )
-
-        cur_time = time.strftime( "%y-%m-%d %H:%M:%S", time.localtime( ) )
+        # Keep the content and the log in the same position
+        with self._buffer.transaction( ):
+            return self._change_log.blame( line )
+    
 
-        change_log[ "line" ]    = line
-        change_log[ "removed" ] = removed_line
+    def __ensure_snapshot( self ):
+        """
+        Store the content before the first change, so every logged version can be rebuilt.
 
-        changes[ cur_time ] = change_log
+        Receive: None
 
-        with open( file_path, "w" ) as f:
-            json.dump( changes, f )
+        Returns: None
+        """
 
-        return True
+        if not self._log_changes or self._change_log.path( ) is None:
+            return
+        
+        if len( self._change_log.snapshots( ) ) == 0:
+            self.snapshot( )
 
     # endregion
 
@@ -564,26 +3353,23 @@ class c_virtual_file:
         - bool: Result
         """
 
-        # I dont want to use .index and catch Exception...
-
-        for item in self._locked_lines:
-            if item == line:
-                return True
-            
-        return False
+        return self._locked_lines.is_locked( line )
     
 
-    def lock_line( self, line: int ):
+    def lock_line( self, line: int, owner: str = "?", session: any = None ) -> bool:
         """
         Lock specific line.
 
         Receive :
         - line (int): Line number
+        - owner (str, optional): Username of the user that locks the line
+        - session (any, optional): Session of the user that locks the line
 
-        Returns: None
+        Returns:
+        - bool: True if the line was free and now locked
         """
 
-        self._locked_lines.append( line )
+        return self._locked_lines.lock( line, owner, session )
 
 
     def unlock_line( self, line: int ):
@@ -596,10 +3382,49 @@ class c_virtual_file:
         Returns: None
         """
 
-        #if not self.is_line_locked( line ):
-        #    return
-        
-        self._locked_lines.remove( line )
+        self._locked_lines.unlock( line )
+
+
+    def line_owner( self, line: int ) -> str:
+        """
+        Get the username that locked a specific line.
+
+        Receive:
+        - line (int): Line number
+
+        Returns:
+        - str: Username or None if the line is free
+        """
+
+        return self._locked_lines.owner( line )
+    
+
+    def line_session( self, line: int ) -> any:
+        """
+        Get the session that locked a specific line.
+
+        Receive:
+        - line (int): Line number
+
+        Returns:
+        - any: Session object or None if the line is free
+        """
+
+        return self._locked_lines.session( line )
+    
+
+    def shift_locked_lines( self, line: int, delta: int ):
+        """
+        Move all the locked lines that are placed after an edited line.
+
+        Receive:
+        - line (int): Edited line number
+        - delta (int): Amount of lines that were added ( or removed if negative )
+
+        Returns: None
+        """
+
+        self._locked_lines.shift( line, delta )
 
 
     def locked_lines( self ) -> list:
@@ -612,15 +3437,71 @@ class c_virtual_file:
         - list: List of locked lines
         """ 
 
-        return self._locked_lines
+        return self._locked_lines.lines( )
     
     # endregion
     
 
+class c_files_message:
+
+    # NOTE ! Formatted message that is encoded only when sent.
+    # The same message can be sent to clients with different codecs, and each encoding is done once.
+
+    _command:   str
+    _arguments: list
+    _encoded:   dict            # Codec -> bytes
+
+    def __init__( self, command: str, arguments: list ):
+
+        self._command   = command
+        self._arguments = arguments
+        self._encoded   = { }
+
+
+    def command( self ) -> str:
+        return self._command
+    
+
+    def arguments( self ) -> list:
+        return self._arguments
+    
+
+    def encode( self, codec: int = FILES_CODEC_TEXT ) -> bytes:
+        """
+        Encode the message.
+
+        Receive:
+        - codec (int, optional): Codec to use
+
+        Returns:
+        - bytes: Ready to send message
+        """
+
+        result: bytes = self._encoded.get( codec )
+        if result is not None:
+            return result
+
+        if codec == FILES_CODEC_TEXT:
+            command:    str     = base64.b64encode( self._command.encode( ) ).decode( )
+            arguments:  list    = [ base64.b64encode( str( argument ).encode( ) ).decode( ) for argument in self._arguments ]
+
+            result = f"{ FILES_MANAGER_HEADER }::{ command }->{ '->'.join( arguments ) }".encode( )
+        else:
+            result = c_command_codec.encode( self._command, self._arguments )
+
+        self._encoded[ codec ] = result
+        return result
+    
+
+    def __str__( self ) -> str:
+        return self.encode( FILES_CODEC_TEXT ).decode( )
+
+
 class c_files_manager_protocol:
 
     _last_error:    str
     _files:         dict
+    _codec:         int         # Codec for outgoing messages
 
     # region : Initialize protocol
 
@@ -636,6 +3517,7 @@ class c_files_manager_protocol:
 
         self._last_error    = ""
         self._files         = { }
+        self._codec         = FILES_CODEC_TEXT
 
     # endregion
 
@@ -680,7 +3562,7 @@ class c_files_manager_protocol:
         return self.format_message( FILES_COMMAND_RES_FILES, files_list )
 
     
-    def format_message( self, message: str, arguments: list ):
+    def format_message( self, message: str, arguments: list ) -> c_files_message:
         """
         Format message for Files Protocol.
 
@@ -689,28 +3571,108 @@ class c_files_manager_protocol:
         - arguments (list): Arguments to follow it
 
         Returns:  
-        - str: Formated string value
+        - c_files_message: Message, encoded once sent
+        """
+
+        return c_files_message( message, list( arguments ) )
+    
+
+    def pack_lines( self, lines: list ) -> bytes:
+        """
+        Pack lines into a single payload. Each line is prefixed with its length.
+
+        Receive :
+        - lines (list): Lines to pack
+
+        Returns:  
+        - bytes: Payload to send after the update message
+        """
+
+        return "".join( f"{ len( line ) }:{ line }" for line in lines ).encode( )
+    
+
+    def unpack_lines( self, payload: any ) -> list:
+        """
+        Unpack lines from a payload of pack_lines.
+
+        Receive :
+        - payload (any): Received payload. Bytes or string
+
+        Returns:  
+        - list: Lines
+        """
+
+        if isinstance( payload, ( bytes, bytearray ) ):
+            payload = payload.decode( )
+
+        result:     list    = [ ]
+        position:   int     = 0
+
+        while position < len( payload ):
+            separator:  int = payload.index( ":", position )
+            end:        int = separator + 1 + int( payload[ position:separator ] )
+
+            if end > len( payload ):
+                raise Exception( "Line is out of the payload" )
+
+            result.append( payload[ separator + 1:end ] )
+            position = end
+
+        return result
+    
+
+    def encode_message( self, message: any ) -> bytes:
+        """
+        Encode message with the codec of this protocol.
+
+        Receive :
+        - message (any): c_files_message or plain string
+
+        Returns:  
+        - bytes: Ready to send bytes
+        """
+
+        if isinstance( message, c_files_message ):
+            return message.encode( self._codec )
+        
+        return message.encode( )
+    
+
+    def is_message( self, message: any ) -> bool:
         """
+        Check if a received message belongs to Files Protocol.
 
-        message: str = base64.b64encode( message.encode( ) ).decode( )
+        Receive :
+        - message (any): Received message
 
-        for index in range( 0, len( arguments ) ):
-            arguments[ index ] = base64.b64encode( str( arguments[ index ] ).encode( ) ).decode( )
+        Returns:  
+        - bool: Result
+        """
 
-        return f"{ FILES_MANAGER_HEADER }::{ message }->{ '->'.join( arguments ) }"
+        if c_command_codec.is_binary( message ):
+            return True
+        
+        return isinstance( message, str ) and message.startswith( FILES_MANAGER_HEADER )
 
 
-    def parse_message( self, message: str ):
+    def parse_message( self, message: any ):
         """
         Parse information from Files Protocol message.
+        Both text and binary messages are accepted.
 
         Receive :
-        - message - String value to parse
+        - message - String value or binary frame to parse
 
         Returns:
         - tuple: Command and list of arguments
         """
 
+        if c_command_codec.is_binary( message ):
+            return c_command_codec.decode( message )
+        
+        if isinstance( message, bytes ):
+            message = message.decode( )
+
         first_parse = message.split( "::" )
         
         information = first_parse[ 1 ].split( "->" )
@@ -723,6 +3685,23 @@ class c_files_manager_protocol:
         information.pop( 0 )
 
         return command, information
+    
+
+    def codec( self, new_value: int = None ) -> int:
+        """
+        Get/Set the codec for outgoing messages.
+
+        Receive :
+        - new_value (int, optional): Codec agreed with the other side
+
+        Returns:
+        - int: Current codec
+        """
+
+        if new_value is not None:
+            self._codec = new_value
+
+        return self._codec
 
     # endregion
 
@@ -786,6 +3765,40 @@ class c_files_manager_protocol:
         return None
     
 
+    def access_level( self, name: str, new_value: int = None ) -> int:
+        """
+        Get/Set the access level of a file.
+
+        Receive :
+        - name (str): File's name
+        - new_value (int, optional): New access level
+
+        Returns:  
+        - int: Access level, or hidden if there is no such file
+        """
+
+        file: c_virtual_file = self.search_file( name )
+        if not file:
+            return FILE_ACCESS_LEVEL_HIDDEN
+        
+        return file.access_level( new_value )
+    
+
+    def save_all( self ):
+        """
+        Write pending changes of all the files to disk.
+        Waits for transfers that map a changed file.
+
+        Receive: None
+
+        Returns: None
+        """
+
+        for file_name in list( self._files ):
+            file: c_virtual_file = self._files[ file_name ]
+            file.save( READER_TIMEOUT )
+    
+
     def clear_all( self ):
         """
         Clears all the files content.
@@ -863,4 +3876,151 @@ class c_files_manager_protocol:
         
         return self._last_error
 
-    # endregion
\ No newline at end of file
+    # endregion
+
+
+class c_files_overlay( c_files_manager_protocol ):
+
+    # NOTE ! Client's view of the host files.
+    # Files are not copied. All the clients share the catalog files, and only keep
+    # the access levels that were set for them. Other files use the default access level.
+
+    _catalog:       c_files_manager_protocol    # Shared host files
+    _access:        dict                        # File name -> Access level for this client
+    _renamed:       dict                        # Old file name -> New file name, until the client accepts the rename
+
+    # region : Initialize overlay
+
+    def __init__( self, catalog: c_files_manager_protocol ):
+        """
+        Default constructor for files overlay.
+
+        Receive:
+        - catalog (c_files_manager_protocol): Shared host files
+
+        Returns: 
+        - c_files_overlay: Overlay object
+        """
+
+        super( ).__init__( )
+
+        self._catalog   = catalog
+        self._access    = { }
+        self._renamed   = { }
+
+    # endregion
+
+    # region : Files
+
+    def get_files( self ) -> dict:
+        """
+        Get all registered files.
+
+        Receive: None
+
+        Returns: 
+        - dict: A dict with the catalog virtual files refs.
+        """
+
+        return self._catalog.get_files( )
+    
+
+    def search_file( self, name: str ) -> c_virtual_file:
+        """
+        Search a virtual file in the catalog.
+
+        Receive :
+        - name (str): File's name
+
+        Returns:  
+        - c_virtual_file: File object or None on fail
+        """
+
+        return self._catalog.search_file( self.__resolve_name( name ) )
+    
+
+    def access_level( self, name: str, new_value: int = None ) -> int:
+        """
+        Get/Set the access level of a file for this client.
+
+        Receive :
+        - name (str): File's name
+        - new_value (int, optional): New access level
+
+        Returns:  
+        - int: Access level, or hidden if there is no such file
+        """
+
+        name = self.__resolve_name( name )
+
+        file: c_virtual_file = self._catalog.search_file( name )
+        if not file:
+            return FILE_ACCESS_LEVEL_HIDDEN
+        
+        if new_value is not None:
+            self._access[ name ] = new_value
+
+        return self._access.get( name, file.access_level( ) )
+    
+
+    def update_name( self, old_index: str, new_index: str, should_operate: bool = False ) -> c_virtual_file:
+        """
+        Move the access level of a renamed file.
+        The catalog file itself is renamed only by the host.
+
+        Receive: 
+        - old_index (str): Old file name
+        - new_index (str): New file name
+        - should_operate (bool, optional): Keep the old name until the client accepts the rename
+
+        Returns:
+        - c_virtual_file: Catalog file ref
+        """
+
+        # The client accepted the rename
+        if self._renamed.get( old_index ) == new_index:
+            del self._renamed[ old_index ]
+            return self._catalog.search_file( new_index )
+
+        if old_index in self._access:
+            self._access[ new_index ] = self._access.pop( old_index )
+
+        if should_operate:
+            self._renamed[ old_index ] = new_index
+
+        return self._catalog.search_file( new_index )
+    
+
+    def remove_file( self, name: str ):
+        """
+        Forget the access level of a removed file.
+
+        Receive :
+        - name (str): File's name
+
+        Returns: None
+        """
+
+        self._access.pop( name, None )
+
+        for old_index in [ old_index for old_index, new_index in self._renamed.items( ) if new_index == name ]:
+            del self._renamed[ old_index ]
+    
+
+    def __resolve_name( self, name: str ) -> str:
+        """
+        Get the catalog name of a file, for old names that the client still uses.
+
+        Receive :
+        - name (str): File's name
+
+        Returns:  
+        - str: Catalog file name
+        """
+
+        if name in self._renamed and self._catalog.search_file( name ) is None:
+            return self._renamed[ name ]
+
+        return name
+
+    # endregion
@@ -11,6 +11,7 @@
 from protocols.security import *
 from utilities.wrappers import safe_call
 from utilities.debug    import *
+from utilities.metrics  import c_metrics
 import socket
 import base64
 
@@ -21,9 +22,18 @@ CHUNK_SIZE              = 1024
 DISCONNECT_MSG          = "_DISCONNECT_"
 PING_MSG                = "PING"
 
+ADMISSION_ACCEPT        = "_ADMIT_"     # Sent before the handshake when the connection got a slot
+ADMISSION_WAIT          = "_WAIT_"      # Followed by ":<position>" in the waiting queue
+ADMISSION_FULL          = "_FULL_"      # Followed by ":<seconds>" to wait before trying again
+
 CONNECTION_TYPE_CLIENT  = 1
 CONNECTION_TYPE_SERVER  = 2
 
+METRIC_BYTES_OUT        = c_metrics.counter( "network.bytes_out" )
+METRIC_BYTES_IN         = c_metrics.counter( "network.bytes_in" )
+METRIC_CHUNKS_OUT       = c_metrics.counter( "network.chunks_out" )
+METRIC_CHUNKS_IN        = c_metrics.counter( "network.chunks_in" )
+
 
 class c_connection:
 
@@ -287,6 +297,9 @@ class c_network_protocol:
         connection_object.send( self.get_message_header( length ) )
         connection_object.send( raw_bytes )
 
+        METRIC_BYTES_OUT.add( HEADER_SIZE + length )
+        METRIC_CHUNKS_OUT.add( )
+
         return True
 
 
@@ -309,8 +322,12 @@ class c_network_protocol:
             self._connection( ).settimeout( timeout )
             
         length: int = int( self._connection( ).recv( HEADER_SIZE ).decode( ) )
+        result: bytes = self.__receive_fixed( length )
 
-        return self.__receive_fixed( length )
+        METRIC_BYTES_IN.add( HEADER_SIZE + length )
+        METRIC_CHUNKS_IN.add( )
+
+        return result
 
 
     def __receive_fixed( self, length: int ) -> bytes:
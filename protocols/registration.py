@@ -31,6 +31,7 @@ from protocols.security import c_security
 from utilities.wrappers import safe_call, standalone_execute
 from utilities.debug    import *
 
+import threading
 import datetime
 import base64
 import json
@@ -476,6 +477,8 @@ class c_registration:
     _index:         str
 
     _fields:        dict
+    _saved_fields:  dict            # Last persisted value of each field ( serialized )
+    _fields_lock:   threading.Lock  # Guards the user file while flushing fields
 
     # region : Initialization
 
@@ -492,6 +495,8 @@ class c_registration:
         self._database      = None
         self._last_error    = ""
         self._fields        = None
+        self._saved_fields  = { }
+        self._fields_lock   = threading.Lock( )
 
 
     def load_database( self, database: c_database ):
@@ -584,6 +589,8 @@ class c_registration:
                 self._salt 
             ) )
 
+        self.__save_fields_snapshot( self._fields )
+
         return True
     
 
@@ -650,47 +657,95 @@ class c_registration:
         del self._fields[ "p1" ]
         del self._fields[ "p2" ]
 
+        self.__save_fields_snapshot( self._fields )
+
         return True
 
     # endregion
 
     # region : Files
 
-    def update_fields( self ):
+    def update_fields( self ) -> bool:
         """
-        Update all the fields of the user.
+        Write the changed fields of the user in a single batch.
 
         Receive: None
             
-        Returns: None
+        Returns: 
+        - bool: True if the user file was written
         """
 
-        self._index = self._database.get_id( self._username )
+        if self._fields is None:
+            return False
 
-        file_index: str = f"{ self._index }.unk"
-        user_path: str = os.path.join( self._database.get_database_path( ), DATABASE_NAME, file_index )
+        with self._fields_lock:
 
-        security: c_security = c_security( )
+            # Serialize once. The same snapshot is written and remembered,
+            # so changes made while we are writing will be caught on the next flush
+            serialized: dict = self.__serialize_fields( )
+            serialized = { name: value for name, value in serialized.items( ) if self._saved_fields.get( name ) != value }
 
-        with open( user_path, "rb" ) as file:
-            data: bytes = security.fast_decrypt( 
-                file.read( ), 
-                self._password, 
-                self._salt 
-            )
-            
-        user_information = json.loads( data.decode( ) )
-        del data
+            if len( serialized ) == 0:
+                return False
 
-        for field_name, field_value in self._fields.items( ):
-            user_information[ field_name ] = field_value
+            self._index = self._database.get_id( self._username )
 
-        with open( user_path, "wb" ) as file:
-            file.write( security.fast_encrypt( 
-                json.dumps( user_information ).encode( ), 
-                self._password, 
-                self._salt 
-            ) )
+            file_index: str = f"{ self._index }.unk"
+            user_path: str = os.path.join( self._database.get_database_path( ), DATABASE_NAME, file_index )
+
+            security: c_security = c_security( )
+
+            with open( user_path, "rb" ) as file:
+                data: bytes = security.fast_decrypt( 
+                    file.read( ), 
+                    self._password, 
+                    self._salt 
+                )
+                
+            user_information = json.loads( data.decode( ) )
+            del data
+
+            for field_name, field_value in serialized.items( ):
+                user_information[ field_name ] = json.loads( field_value )
+
+            with open( user_path, "wb" ) as file:
+                file.write( security.fast_encrypt( 
+                    json.dumps( user_information ).encode( ), 
+                    self._password, 
+                    self._salt 
+                ) )
+
+            self._saved_fields.update( serialized )
+
+        return True
+    
+
+    def __serialize_fields( self ) -> dict:
+        """
+        Serialize each field of the user.
+
+        Receive: None
+
+        Returns:
+        - dict: Field name and its json value
+        """
+
+        # Lists and dicts are shared by reference with the client handle,
+        # so compare by value and not by identity
+        return { field_name: json.dumps( field_value ) for field_name, field_value in list( self._fields.items( ) ) }
+    
+
+    def __save_fields_snapshot( self, fields: dict ):
+        """
+        Remember the fields as persisted.
+
+        Receive:
+        - fields (dict): Fields that are stored in the user file
+
+        Returns: None
+        """
+
+        self._saved_fields = { field_name: json.dumps( field_value ) for field_name, field_value in fields.items( ) }
  
     # endregion
         
@@ -722,6 +777,19 @@ class c_registration:
         """
 
         self._fields[ field_name ] = field_value
+
+
+    def has_fields( self ) -> bool:
+        """
+        Check if the user fields were loaded.
+
+        Receive: None
+
+        Returns:
+        - bool: True after successful register or login
+        """
+
+        return self._fields is not None
         
 
     @staticmethod
@@ -16,12 +16,15 @@ from utilities.math             import math
 from utilities.wrappers         import safe_call, standalone_execute
 
 import threading
+import hashlib
 import base64
 import queue
+import json
 import time
 import os
 
 TIMEOUT_MESSAGE = 0.5
+CACHE_FOLDER    = ".digital_cache"     # Received files content, used to skip downloading unchanged files
 
 class c_user_business_logic:
 
@@ -31,6 +34,7 @@ class c_user_business_logic:
     _files:         c_files_manager_protocol
     _registration:  c_registration
     _security:      c_security
+    _cache:         c_file_cache
 
     _information:   dict
     _events:        dict
@@ -73,6 +77,8 @@ class c_user_business_logic:
         self._security      = c_security( )
 
         self._network       = c_network_protocol( )
+
+        self._cache         = c_file_cache( os.path.join( os.getcwd( ), CACHE_FOLDER ) )
     
 
     def __initialize_events( self ):
@@ -87,6 +93,7 @@ class c_user_business_logic:
         self._events = {
 
             "on_connect":           c_event( ),
+            "on_waiting":           c_event( ), # Called when the host is full and tells the position in its waiting queue
 
             "on_pre_disconnect":    c_event( ),
             "on_post_disconnect":   c_event( ),
@@ -133,6 +140,8 @@ class c_user_business_logic:
         self._commands = {
             FILES_COMMAND_RES_FILES:        self.__command_received_files,
             FILES_COMMAND_SET_FILE:         self.__command_set_file,
+            FILES_COMMAND_SAME_FILE:        self.__command_same_file,
+            FILES_COMMAND_FILE_DELTA:       self.__command_file_delta,
 
             FILES_COMMAND_PREPARE_RESPONSE: self.__command_response_line_lock,
 
@@ -168,6 +177,10 @@ class c_user_business_logic:
 
         if not self.__try_to_connect( ip, port ):
             return False
+
+        if not self.__wait_for_admission( ):
+            self.__end_connection( )
+            return False
         
         if not self.__preform_safety_registration( ):
             self.__end_connection( )
@@ -225,6 +238,40 @@ class c_user_business_logic:
         return result
 
     
+    def __wait_for_admission( self ) -> bool:
+        """
+        Wait until the host has a free slot for this connection.
+
+        Receive:   None
+
+        Returns:   
+        - bool: True if admitted
+        """
+
+        while True:
+            message: bytes = self._network.receive_chunk( )
+            if not message:
+                self._information[ "last_error" ] = "The server might be full or offline."
+                return False
+
+            message: str = message.decode( )
+            if message == ADMISSION_ACCEPT:
+                return True
+
+            command, _, value = message.partition( ":" )
+
+            if command == ADMISSION_WAIT:
+                self.__event_waiting( int( value ) )
+                continue
+
+            if command == ADMISSION_FULL:
+                self._information[ "last_error" ] = f"The server is full. Try again in { value } seconds."
+                return False
+
+            self._information[ "last_error" ] = "Unexpected response from the server."
+            return False
+
+    
     def __preform_safety_registration( self ) -> bool:
         """
         Initialize and establish safety for the communication.
@@ -398,7 +445,11 @@ class c_user_business_logic:
             if not message:
                 continue
 
-            self.__handle_receive( message.decode( ) )
+            # Binary frames are passed as they are
+            if not c_command_codec.is_binary( message ):
+                message = message.decode( )
+
+            self.__handle_receive( message )
 
     # endregion
 
@@ -442,12 +493,12 @@ class c_user_business_logic:
         return result
 
 
-    def __handle_receive( self, receive: str ):
+    def __handle_receive( self, receive: any ):
         """
         Handles messages received from the host.
 
         Receive:
-        - receive (str): Message content
+        - receive (any): Message content. String or binary frame
 
         Returns:   None
         """
@@ -458,16 +509,16 @@ class c_user_business_logic:
         if receive == COMMAND_ROTATE_KEY:
             return self.__handle_security_rotation( )
         
-        if receive.startswith( self._files.get_header( ) ):
+        if self._files.is_message( receive ):
             return self.__handle_files_message( receive )
 
     
-    def __handle_files_message( self, message: str ):
+    def __handle_files_message( self, message: any ):
         """
         Handle file's protocol message.
 
         Receive:
-        - message (str): Message from server
+        - message (any): Message from server
 
         Returns: None
         """
@@ -518,6 +569,10 @@ class c_user_business_logic:
         Returns: None
         """
 
+        # Hosts that do not know about codecs answer only with the count
+        if len( arguments ) > 1 and arguments[ 1 ].isdigit( ):
+            self._files.codec( int( arguments[ 1 ] ) )
+
         self.__event_register_files( )
 
     
@@ -562,6 +617,95 @@ class c_user_business_logic:
         if len( data ) != file_size:
             raise Exception( f"Failed to receive normally file { file_name }" )
         
+        if len( arguments ) > 2:
+            version: str = len( arguments ) > 3 and arguments[ 3 ] or None
+            self._cache.store( file.name( ), arguments[ 2 ], data, version )
+        
+        self.__apply_file_content( file, data )
+
+
+    @safe_call( c_debug.log_error )
+    def __command_same_file( self, arguments: list ):
+        """
+        Command method for content that did not change since it was cached.
+
+        Receive:
+        - arguments (str): List containing files details
+
+        Returns: None
+        """
+
+        file_name:  str = arguments[ 0 ]
+        digest:     str = arguments[ 1 ]
+        version:    str = len( arguments ) > 2 and arguments[ 2 ] or None
+
+        file: c_virtual_file = self._files.search_file( file_name )
+        if not file:
+            raise Exception( f"Failed to find file { file_name }" )
+        
+        data: bytes = self._cache.load( digest )
+        if data is None:
+
+            # Cache was removed or damaged. Ask for the whole file
+            self._cache.forget( file_name )
+            return self.request_file( file_name )
+        
+        if version is not None and version != self._cache.version( file_name ):
+            self._cache.store( file_name, digest, data, version )
+        
+        self.__apply_file_content( file, data )
+
+
+    @safe_call( c_debug.log_error )
+    def __command_file_delta( self, arguments: list ):
+        """
+        Command method for changes since the cached version.
+
+        Receive:
+        - arguments (str): List containing files details
+
+        Returns: None
+        """
+
+        file_name:  str     = arguments[ 0 ]
+        digest:     str     = arguments[ 1 ]
+        version:    str     = arguments[ 2 ]
+        operations: list    = json.loads( arguments[ 3 ] )
+
+        file: c_virtual_file = self._files.search_file( file_name )
+        if not file:
+            raise Exception( f"Failed to find file { file_name }" )
+        
+        data:           bytes   = None
+        known_digest:   str     = self._cache.digest( file_name )
+
+        if known_digest is not None:
+            data = self._cache.load( known_digest )
+
+        if data is not None:
+            data = self._cache.apply_operations( data, operations )
+
+        # The result must be exactly what the host has. Otherwise ask for the whole file
+        if data is None or hashlib.blake2b( data, digest_size=DIGEST_SIZE ).hexdigest( ) != digest:
+            self._cache.forget( file_name )
+            return self.request_file( file_name )
+        
+        self._cache.store( file_name, digest, data, version )
+        
+        self.__apply_file_content( file, data )
+
+    
+    def __apply_file_content( self, file: c_virtual_file, data: bytes ):
+        """
+        Load received content into file and notify.
+
+        Receive:
+        - file (c_virtual_file): File that received content
+        - data (bytes): Raw content
+
+        Returns: None
+        """
+
         if data.endswith( b'\n' ):
             data = data + b'\r'
 
@@ -680,22 +824,19 @@ class c_user_business_logic:
         if not file:
             return
         
+        # All the lines come in a single payload. Empty payload is not sent at all
         new_lines: list = [ ]
-        for i in range( lines_count ):
 
-            received_line: bytes = self.__receive( )
-            if not received_line:
-                # Failed to do something
-                continue
+        if lines_count > 0:
+            payload: bytes = self.__receive( )
+            if not payload:
+                return
 
-            fixed_line: str = base64.b64decode( received_line ).decode( )
-            del received_line
+            new_lines = self._files.unpack_lines( payload )
+            del payload
 
-            # Maybe better approach will be to add '\n' for each line...
-            if fixed_line == "\n":
-                fixed_line = ""
-            
-            new_lines.append( fixed_line )
+        if len( new_lines ) != lines_count:
+            raise Exception( f"Expected { lines_count } lines, received { len( new_lines ) }" )
 
         self.__event_line_update( file.name( ), line, new_lines )
 
@@ -785,6 +926,7 @@ class c_user_business_logic:
             return
         
         self._files.update_name( old_index, new_index )
+        self._cache.rename( old_index, new_index )
 
         self.__event_file_rename( old_index, new_index )
 
@@ -792,17 +934,17 @@ class c_user_business_logic:
 
     # region : Communication
 
-    def __send_quick_message( self, message: str ):
+    def __send_quick_message( self, message: any ):
         """
         Send a quick message to the host.
 
         Receive:
-        - message (str): String message to send to host
+        - message (any): String or Files Protocol message to send to host
 
         Returns: None
         """
 
-        self.__send_quick_bytes( message.encode( ) )
+        self.__send_quick_bytes( self._files.encode_message( message ) )
 
     
     def __send_quick_bytes( self, data: bytes ):
@@ -844,7 +986,9 @@ class c_user_business_logic:
         if not self._network.is_valid( False ):
             return
 
-        message: str = self._files.format_message( FILES_COMMAND_REQ_FILES, ["unk"] )
+        # Offer the binary codec. The host answers with the one to use
+        codec:      int                 = ENABLE_BINARY_CODEC and FILES_CODEC_BINARY or FILES_CODEC_TEXT
+        message:    c_files_message     = self._files.format_message( FILES_COMMAND_REQ_FILES, [ "unk", str( codec ) ] )
 
         self.__send_quick_message( message )
 
@@ -866,7 +1010,21 @@ class c_user_business_logic:
         if file is None:
             return
         
-        message: str = self._files.format_message( FILES_COMMAND_GET_FILE, [ file_name ] )
+        command:    str     = FILES_COMMAND_GET_FILE
+        arguments:  list    = [ file_name ]
+
+        # Let the host know what we already have. It will send only what changed since
+        digest:     str     = self._cache.digest( file_name )
+        version:    str     = self._cache.version( file_name )
+
+        if digest is not None and version is not None:
+            command     = FILES_COMMAND_GET_FILE_SINCE
+            arguments   = [ file_name, version, digest ]
+
+        elif digest is not None:
+            arguments.append( digest )
+        
+        message: c_files_message = self._files.format_message( command, arguments )
         self.__send_quick_message( message )
 
     
@@ -885,7 +1043,7 @@ class c_user_business_logic:
         if not file:
             return
         
-        message: str = self._files.format_message( FILES_COMMAND_PREPARE_UPDATE, [ file_name, str( line ) ] )
+        message: c_files_message = self._files.format_message( FILES_COMMAND_PREPARE_UPDATE, [ file_name, str( line ) ] )
         self.__send_quick_message( message )
 
 
@@ -904,7 +1062,7 @@ class c_user_business_logic:
         if not file:
             return
         
-        message: str = self._files.format_message( FILES_COMMAND_DISCARD_UPDATE, [ file_name, str( line ) ] )
+        message: c_files_message = self._files.format_message( FILES_COMMAND_DISCARD_UPDATE, [ file_name, str( line ) ] )
         self.__send_quick_message( message )
 
     
@@ -925,15 +1083,12 @@ class c_user_business_logic:
             return
         
         # We have notified the host about the update
-        message: str = self._files.format_message( FILES_COMMAND_UPDATE_LINE, [ file.name( ), str( line ), str( len( lines ) ) ] )
+        message: c_files_message = self._files.format_message( FILES_COMMAND_UPDATE_LINE, [ file.name( ), str( line ), str( len( lines ) ) ] )
         self.__send_quick_message( message )
 
-        for line_str in lines:
-            line_str: str = line_str
-            if line_str == "":
-                line_str = "\n"
-            
-            self.__send_quick_bytes( base64.b64encode( line_str.encode( ) ) )
+        # The host reads the payload only when there are lines
+        if len( lines ) > 0:
+            self.__send_quick_bytes( self._files.pack_lines( lines ) )
 
     
     def delete_line( self, file_name: str, line: int ):
@@ -951,7 +1106,7 @@ class c_user_business_logic:
         if not file:
             return
         
-        message: str = self._files.format_message( FILES_COMMAND_DELETE_LINE, [ file.name( ), str( line ) ] )
+        message: c_files_message = self._files.format_message( FILES_COMMAND_DELETE_LINE, [ file.name( ), str( line ) ] )
         self.__send_quick_message( message )
 
     
@@ -971,7 +1126,7 @@ class c_user_business_logic:
         if not file:
             return
         
-        message: str = self._files.format_message( FILES_COMMAND_APPLY_UPDATE, [ str( FILE_UPDATE_CONTENT ), file.name( ), str( offset ) ] )
+        message: c_files_message = self._files.format_message( FILES_COMMAND_APPLY_UPDATE, [ str( FILE_UPDATE_CONTENT ), file.name( ), str( offset ) ] )
         self.__send_quick_message( message )
 
 
@@ -990,7 +1145,7 @@ class c_user_business_logic:
         if not file:
             return
         
-        message: str = self._files.format_message( FILES_COMMAND_APPLY_UPDATE, [ str( FILE_UPDATE_NAME ), old_index, new_index ] )
+        message: c_files_message = self._files.format_message( FILES_COMMAND_APPLY_UPDATE, [ str( FILE_UPDATE_NAME ), old_index, new_index ] )
         self.__send_quick_message( message )
 
     # endregion
@@ -1017,6 +1172,23 @@ class c_user_business_logic:
         event.invoke( )
 
     
+    def __event_waiting( self, position: int ):
+        """
+        Event callback when the user waits for a free slot on the host.
+
+        Receive:
+        - position (int): Position in the waiting queue
+
+        Returns:   None
+        """
+
+        event: c_event = self._events[ "on_waiting" ]
+
+        event.attach( "position",   position )
+
+        event.invoke( )
+
+    
     def __event_pre_disconnect( self ):
         """
         Event callback before disconnect process.
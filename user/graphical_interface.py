@@ -133,6 +133,7 @@ class c_user_gui:
         self._logic.set_event( "on_line_delete",        self.__event_remove_line,           "gui_editor_line_remove",   True )
         self._logic.set_event( "on_file_register",      self.__event_file_register,         "gui_file_register",        True )
         self._logic.set_event( "on_file_rename",        self.__event_file_rename,           "gui_file_rename",          True )
+        self._logic.set_event( "on_waiting",            self.__event_waiting,               "gui_waiting",              True )
 
         self._application.set_event( "unload",          self.__disconnect_on_window_close,  "gui_fast_unload",          False )
 
@@ -167,7 +168,8 @@ class c_user_gui:
         self._application.create_image( "title_connection",     execution_directory + TITLE_ICON_CONNECTION,vector( 500, 170 ) )
         self._application.create_image( "title_loading",        execution_directory + TITLE_ICON_LOADING,   vector( 500, 170 ) )
 
-        self._temp[ "setup_process" ]  = 0
+        self._temp[ "setup_process" ]     = 0
+        self._temp[ "waiting_position" ]  = 0
         
         self._application_config.wallpaper = self._application.image( "wallpaper_blurred" )
 
@@ -261,6 +263,7 @@ class c_user_gui:
 
         self._scene_setup.set_event( "draw",            self.__scene_setup_draw,                "Scene Setup Draw Main",            False )
         self._scene_setup.set_event( "draw",            self.__scene_setup_draw_instructions,   "Scene Setup Draw Instructions",    False )
+        self._scene_setup.set_event( "draw",            self.__scene_setup_draw_waiting,        "Scene Setup Draw Waiting",         False )
         self._scene_setup.set_event( "draw",            self.__scene_setup_adjust_elements,     "Scene Setup Adjust Elements",      False )
         self._scene_setup.set_event( "keyboard_input",  self.__scene_setup_control_steps,       "Scene Setup Control Elements",     False )
 
@@ -379,6 +382,30 @@ class c_user_gui:
         animations.value( "InstructionsHeight", render.measure_text( self._general_font, wrapped_text ).y + 40 )
 
 
+    def __scene_setup_draw_waiting( self ):
+        """
+        Draw the position in the host waiting queue while loading.
+
+        Receive: None
+
+        Returns: None
+        """
+
+        position: int = self._temp[ "waiting_position" ]
+        if position == 0:
+            return
+
+        screen:     vector          = self._application.window_size( )
+
+        render:     c_renderer      = self._application.render( )
+        animations: c_animations    = self._scene_setup.animations( )
+
+        fade:       float           = animations.value( "Fade" ) * animations.value( "title_loading" ).y
+
+        wrapped_text: str = render.wrap_text( self._general_font, f"The host is full. Your position in the queue is { position }", screen.x * 0.4 - 40 )
+        render.text( self._general_font, vector( screen.x * 0.5 + 20, screen.y * 0.1 + 20 ), color( ) * fade, wrapped_text )
+
+
     def __scene_setup_adjust_elements( self ):
         """
         Adjust the scene elements positions.
@@ -504,6 +531,9 @@ class c_user_gui:
             self._entry_password.get( ),
             self._registration_type.get( )
         )
+
+        # Admitted or failed, the queue is left either way
+        self._temp[ "waiting_position" ] = 0
     
         if result:
             time.sleep( LOADING_MIN_TIME )
@@ -960,6 +990,19 @@ class c_user_gui:
                 self._editor.read_only( False )
 
     
+    def __event_waiting( self, event ):
+        """
+        Show the position in the host waiting queue.
+
+        Receive: 
+        - event (callable): Event information
+
+        Returns: None
+        """
+
+        self._temp[ "waiting_position" ] = event( "position" )
+
+
     def __event_file_rename( self, event ):
         """
         Rename a specific file name.
@@ -0,0 +1,603 @@
+"""
+    project     : Digital Editor
+
+    type        : Utility
+    file        : Metrics
+
+    description : Process wide metrics registry. Provides counters, gauges and
+                  log-linear ( HDR style ) histograms, and exposes them as JSON
+                  through a local HTTP endpoint or a periodic snapshot file.
+"""
+
+from utilities.wrappers import safe_call
+from utilities.debug    import c_debug
+
+from http.server        import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+import threading
+import json
+import time
+import os
+
+HISTOGRAM_SUB_BITS:     int     = 5         # Values below 32 are exact. Above, 16 sub buckets for each power of two, about 6% precision
+HISTOGRAM_SUB_COUNT:    int     = 1 << HISTOGRAM_SUB_BITS
+HISTOGRAM_SUB_HALF:     int     = HISTOGRAM_SUB_COUNT >> 1
+HISTOGRAM_UNIT:         float   = 1e-6      # Recorded values are kept in micro units ( seconds -> microseconds )
+HISTOGRAM_PERCENTILES:  tuple   = ( 50, 90, 99, 99.9 )
+
+METRICS_PATHS:          tuple   = ( "/", "/metrics" )
+
+
+class c_counter:
+
+    _value:     float
+    _lock:      threading.Lock
+
+    def __init__( self ):
+        """
+        Default constructor for counter object.
+
+        Receive: None
+
+        Returns:
+        - c_counter: Counter object
+        """
+
+        self._value = 0
+        self._lock  = threading.Lock( )
+
+
+    def add( self, value: float = 1 ):
+        """
+        Increase the counter.
+
+        Receive:
+        - value (float, optional): Amount to add
+
+        Returns: None
+        """
+
+        with self._lock:
+            self._value += value
+
+
+    def reset( self ):
+        """
+        Set the counter back to zero.
+
+        Receive: None
+
+        Returns: None
+        """
+
+        with self._lock:
+            self._value = 0
+
+
+    def snapshot( self ) -> float:
+        return self._value
+
+
+class c_gauge:
+
+    _value:     any
+    _source:    any     # Called on snapshot, instead of a stored value
+
+    def __init__( self, source: any = None ):
+        """
+        Default constructor for gauge object.
+
+        Receive:
+        - source (callable, optional): Function that returns the current value
+
+        Returns:
+        - c_gauge: Gauge object
+        """
+
+        self._value     = 0
+        self._source    = source
+
+
+    def set( self, value: any ):
+        """
+        Set the current value.
+
+        Receive:
+        - value (any): JSON compatible value
+
+        Returns: None
+        """
+
+        self._value = value
+
+
+    def source( self, source: any ):
+        """
+        Replace the function that returns the current value.
+
+        Receive:
+        - source (callable): Function or None to use the stored value
+
+        Returns: None
+        """
+
+        self._source = source
+
+
+    def reset( self ):
+        self._value = 0
+
+
+    def snapshot( self ) -> any:
+
+        if self._source is None:
+            return self._value
+
+        return safe_call( c_debug.log_error )( self._source )( )
+
+
+class c_histogram:
+
+    # Values are counted in buckets. Below HISTOGRAM_SUB_COUNT each value has its own bucket,
+    # above it every power of two is split into HISTOGRAM_SUB_HALF buckets of the same width.
+    # That keeps the relative error fixed, no matter how large the values are.
+
+    _unit:      float
+    _counts:    list
+    _count:     int
+    _total:     float
+    _min:       float
+    _max:       float
+    _lock:      threading.Lock
+
+    def __init__( self, unit: float = HISTOGRAM_UNIT ):
+        """
+        Default constructor for histogram object.
+
+        Receive:
+        - unit (float, optional): Smallest value that can be told apart
+
+        Returns:
+        - c_histogram: Histogram object
+        """
+
+        self._unit  = unit
+        self._lock  = threading.Lock( )
+
+        self.reset( )
+
+
+    def record( self, value: float ):
+        """
+        Add a value to the histogram.
+
+        Receive:
+        - value (float): Recorded value, in the histogram units ( usually seconds )
+
+        Returns: None
+        """
+
+        bucket: int = self.__bucket( max( 0, int( value / self._unit ) ) )
+
+        with self._lock:
+            if bucket >= len( self._counts ):
+                self._counts.extend( [ 0 ] * ( bucket + 1 - len( self._counts ) ) )
+
+            self._counts[ bucket ] += 1
+
+            self._count += 1
+            self._total += value
+            self._min   = min( self._min, value )
+            self._max   = max( self._max, value )
+
+
+    def time( self ) -> "c_histogram_timer":
+        """
+        Measure a block of code.
+
+        Receive: None
+
+        Returns:
+        - c_histogram_timer: Context manager that records the time it was open
+        """
+
+        return c_histogram_timer( self )
+
+
+    def percentile( self, percent: float ) -> float:
+        """
+        Get the value below which a given percent of the values are.
+
+        Receive:
+        - percent (float): Percent between 0 and 100
+
+        Returns:
+        - float: Value or 0 if nothing was recorded
+        """
+
+        with self._lock:
+            return self.__percentile( percent )
+
+
+    def reset( self ):
+        """
+        Remove all the recorded values.
+
+        Receive: None
+
+        Returns: None
+        """
+
+        with self._lock:
+            self._counts    = [ ]
+            self._count     = 0
+            self._total     = 0.0
+            self._min       = float( "inf" )
+            self._max       = 0.0
+
+
+    def snapshot( self ) -> dict:
+
+        with self._lock:
+            if self._count == 0:
+                return { "count": 0 }
+
+            result: dict = {
+                "count":    self._count,
+                "mean":     self._total / self._count,
+                "min":      self._min,
+                "max":      self._max
+            }
+
+            for percent in HISTOGRAM_PERCENTILES:
+                result[ f"p{ percent:g}" ] = self.__percentile( percent )
+
+        return result
+
+
+    def __percentile( self, percent: float ) -> float:
+        """
+        Get percentile value. Must be called with the lock.
+
+        Receive:
+        - percent (float): Percent between 0 and 100
+
+        Returns:
+        - float: Middle of the bucket that holds the percentile
+        """
+
+        if self._count == 0:
+            return 0
+
+        target:     int = max( 1, int( self._count * percent / 100 + 0.5 ) )
+        seen:       int = 0
+
+        for bucket, count in enumerate( self._counts ):
+            seen += count
+
+            if seen >= target:
+                lower, width = self.__bucket_range( bucket )
+                value: float = ( lower + ( width - 1 ) / 2 ) * self._unit
+
+                return min( max( value, self._min ), self._max )
+
+        return self._max
+
+
+    @staticmethod
+    def __bucket( value: int ) -> int:
+        """
+        Get bucket index of a value.
+
+        Receive:
+        - value (int): Value in units
+
+        Returns:
+        - int: Bucket index
+        """
+
+        if value < HISTOGRAM_SUB_COUNT:
+            return value
+
+        shift: int = value.bit_length( ) - HISTOGRAM_SUB_BITS
+
+        return ( shift * HISTOGRAM_SUB_HALF ) + ( value >> shift )
+
+
+    @staticmethod
+    def __bucket_range( bucket: int ) -> tuple:
+        """
+        Get the values a bucket holds.
+
+        Receive:
+        - bucket (int): Bucket index
+
+        Returns:
+        - tuple: Lowest value and amount of values, in units
+        """
+
+        if bucket < HISTOGRAM_SUB_COUNT:
+            return bucket, 1
+
+        shift: int = bucket // HISTOGRAM_SUB_HALF - 1
+        return ( bucket - shift * HISTOGRAM_SUB_HALF ) << shift, 1 << shift
+
+
+class c_histogram_timer:
+
+    _histogram: c_histogram
+    _start:     float
+
+    def __init__( self, histogram: c_histogram ):
+        self._histogram = histogram
+
+    def __enter__( self ):
+        self._start = time.perf_counter( )
+        return self
+
+    def __exit__( self, *args ):
+        self._histogram.record( time.perf_counter( ) - self._start )
+
+
+# Registry of every metric in the process
+_metrics:       dict            = { }
+_metrics_lock:  threading.Lock  = threading.Lock( )
+
+
+class c_metrics:
+
+    @staticmethod
+    def counter( name: str ) -> c_counter:
+        """
+        Get or create a counter.
+
+        Receive :
+        - name (str): Metric name
+
+        Returns :
+        - c_counter: Counter object
+        """
+
+        return c_metrics.__get( name, c_counter )
+
+
+    @staticmethod
+    def gauge( name: str, source: any = None ) -> c_gauge:
+        """
+        Get or create a gauge.
+
+        Receive :
+        - name (str): Metric name
+        - source (callable, optional): Function that returns the current value
+
+        Returns :
+        - c_gauge: Gauge object
+        """
+
+        gauge: c_gauge = c_metrics.__get( name, c_gauge )
+
+        if source is not None:
+            gauge.source( source )
+
+        return gauge
+
+
+    @staticmethod
+    def histogram( name: str ) -> c_histogram:
+        """
+        Get or create a histogram.
+
+        Receive :
+        - name (str): Metric name
+
+        Returns :
+        - c_histogram: Histogram object
+        """
+
+        return c_metrics.__get( name, c_histogram )
+
+
+    @staticmethod
+    def snapshot( ) -> dict:
+        """
+        Read all the metrics.
+
+        Receive : None
+
+        Returns :
+        - dict: Metric name -> value, sorted by name
+        """
+
+        with _metrics_lock:
+            items: list = sorted( _metrics.items( ) )
+
+        return { name: metric.snapshot( ) for name, metric in items }
+
+
+    @staticmethod
+    def reset( ):
+        """
+        Set all the metrics back to zero. Gauges with a source are not affected.
+
+        Receive : None
+
+        Returns : None
+        """
+
+        with _metrics_lock:
+            items: list = list( _metrics.values( ) )
+
+        for metric in items:
+            metric.reset( )
+
+
+    @staticmethod
+    def write_snapshot( path: str ):
+        """
+        Write all the metrics into a JSON file.
+
+        Receive :
+        - path (str): File path. Replaced at once, so readers never see half a file
+
+        Returns : None
+        """
+
+        temporary_path: str = f"{ path }.tmp"
+
+        with open( temporary_path, "w" ) as file:
+            json.dump( { "time": time.time( ), "metrics": c_metrics.snapshot( ) }, file, indent=4 )
+
+        os.replace( temporary_path, path )
+
+
+    @staticmethod
+    def __get( name: str, metric_type: type ) -> any:
+        """
+        Get or create a metric.
+
+        Receive :
+        - name (str): Metric name
+        - metric_type (type): Class of the metric
+
+        Returns :
+        - any: Metric object
+        """
+
+        metric = _metrics.get( name )
+
+        if metric is None:
+            with _metrics_lock:
+                metric = _metrics.setdefault( name, metric_type( ) )
+
+        if not isinstance( metric, metric_type ):
+            raise Exception( f"Metric { name } is not a { metric_type.__name__ }" )
+
+        return metric
+
+
+class c_metrics_request_handler( BaseHTTPRequestHandler ):
+
+    def do_GET( self ):
+
+        if not self.client_address[ 0 ] in ( "127.0.0.1", "::1" ):
+            return self.send_error( 403 )
+
+        if self.path not in METRICS_PATHS:
+            return self.send_error( 404 )
+
+        body: bytes = json.dumps( c_metrics.snapshot( ), indent=4 ).encode( )
+
+        self.send_response( 200 )
+        self.send_header( "Content-Type",   "application/json" )
+        self.send_header( "Content-Length", str( len( body ) ) )
+        self.end_headers( )
+
+        self.wfile.write( body )
+
+
+    def log_message( self, format: str, *args ):
+        # Requests are not logged
+        pass
+
+
+class c_metrics_server:
+
+    _server:            ThreadingHTTPServer
+    _server_thread:     threading.Thread
+
+    _snapshot_thread:   threading.Thread
+    _stop:              threading.Event
+
+    def __init__( self ):
+        """
+        Default constructor for metrics server object.
+
+        Receive: None
+
+        Returns:
+        - c_metrics_server: Metrics server object
+        """
+
+        self._server            = None
+        self._server_thread     = None
+
+        self._snapshot_thread   = None
+        self._stop              = threading.Event( )
+
+
+    def start_endpoint( self, port: int ) -> int:
+        """
+        Serve the metrics as JSON on the loop back address.
+
+        Receive:
+        - port (int): Port to listen on. 0 picks a free one
+
+        Returns:
+        - int: Used port
+        """
+
+        self._server = ThreadingHTTPServer( ( "127.0.0.1", port ), c_metrics_request_handler )
+        self._server.daemon_threads = True
+
+        self._server_thread = threading.Thread( target=self._server.serve_forever, daemon=True )
+        self._server_thread.start( )
+
+        return self._server.server_address[ 1 ]
+
+
+    def start_snapshots( self, path: str, interval: float ):
+        """
+        Write the metrics into a file periodically.
+
+        Receive:
+        - path (str): Snapshot file path
+        - interval (float): Seconds between writes
+
+        Returns: None
+        """
+
+        self._stop.clear( )
+
+        self._snapshot_thread = threading.Thread( target=self.__process_snapshots, args=( path, interval ), daemon=True )
+        self._snapshot_thread.start( )
+
+
+    def stop( self ):
+        """
+        Stop the endpoint and the snapshots.
+
+        Receive: None
+
+        Returns: None
+        """
+
+        self._stop.set( )
+
+        if self._server is not None:
+            self._server.shutdown( )
+            self._server.server_close( )
+
+            self._server = None
+
+        if self._snapshot_thread is not None:
+            self._snapshot_thread.join( )
+            self._snapshot_thread = None
+
+
+    @safe_call( c_debug.log_error )
+    def __process_snapshots( self, path: str, interval: float ):
+        """
+        Process for writing the snapshots until stopped.
+
+        Receive:
+        - path (str): Snapshot file path
+        - interval (float): Seconds between writes
+
+        Returns: None
+        """
+
+        while not self._stop.wait( interval ):
+            safe_call( c_debug.log_error )( c_metrics.write_snapshot )( path )
+
+        # Last values, after the work stopped
+        c_metrics.write_snapshot( path )
@@ -0,0 +1,409 @@
+"""
+    project     : Digital Editor
+
+    type        : Utility
+    file        : Watcher
+
+    description : Watches folders for files changes made outside the program.
+                  Uses inotify on Linux and falls back to polling the files
+                  modification times anywhere else. Changes are collected
+                  and reported together once they calm down.
+"""
+
+from utilities.wrappers import safe_call
+from utilities.debug    import c_debug
+
+import ctypes.util
+import threading
+import ctypes
+import select
+import struct
+import time
+import sys
+import os
+
+WATCH_DEBOUNCE:     float   = 0.5   # Seconds without new changes before reporting
+WATCH_POLL_TIME:    float   = 2.0   # Seconds between scans in polling mode
+
+# inotify flags ( sys/inotify.h )
+IN_MODIFY:          int     = 0x00000002
+IN_ATTRIB:          int     = 0x00000004
+IN_CLOSE_WRITE:     int     = 0x00000008
+IN_MOVED_FROM:      int     = 0x00000040
+IN_MOVED_TO:        int     = 0x00000080
+IN_CREATE:          int     = 0x00000100
+IN_DELETE:          int     = 0x00000200
+IN_Q_OVERFLOW:      int     = 0x00004000
+IN_IGNORED:         int     = 0x00008000
+IN_ISDIR:           int     = 0x40000000
+
+IN_WATCH_MASK:      int     = IN_MODIFY | IN_ATTRIB | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE
+IN_EVENT_HEADER:    str     = "iIII"
+
+
+class c_path_watcher:
+
+    _paths:         list                # Root folders to watch
+    _callback:      any                 # Called with a list of changed files paths
+
+    _pending:       set                 # Changed paths that were not reported yet
+    _last_change:   float               # Time of the last collected change
+
+    _thread:        threading.Thread
+    _stop:          threading.Event
+
+    # Linux only
+    _libc:          any
+    _descriptor:    int                 # inotify file descriptor
+    _watches:       dict                # Watch descriptor -> folder
+
+    # Polling only
+    _snapshot:      dict                # Path -> ( size, mtime )
+
+    # region : Initialize
+
+    def __init__( self, paths: list, callback: any ):
+        """
+        Default constructor for path watcher object.
+
+        Receive:
+        - paths (list): Folders to watch, with all their sub folders
+        - callback (callable): Function that receives a list of changed files paths
+
+        Returns:
+        - c_path_watcher: Path watcher object
+        """
+
+        self._paths         = self.__remove_nested( paths )
+        self._callback      = callback
+
+        self._pending       = set( )
+        self._last_change   = 0
+
+        self._thread        = None
+        self._stop          = threading.Event( )
+
+        self._libc          = None
+        self._descriptor    = -1
+        self._watches       = { }
+
+        self._snapshot      = { }
+
+    # endregion
+
+    # region : Control
+
+    def start( self ) -> str:
+        """
+        Start watching in the background.
+
+        Receive: None
+
+        Returns:
+        - str: Used mode. "inotify" or "polling"
+        """
+
+        self._stop.clear( )
+
+        mode:   str = "polling"
+        target: any = self.__process_polling
+
+        if self.__setup_inotify( ):
+            mode    = "inotify"
+            target  = self.__process_inotify
+        else:
+            self._snapshot = self.__scan( )
+
+        self._thread = threading.Thread( target=target, daemon=True )
+        self._thread.start( )
+
+        return mode
+
+
+    def stop( self ):
+        """
+        Stop watching. Changes that were not reported yet are dropped.
+
+        Receive: None
+
+        Returns: None
+        """
+
+        self._stop.set( )
+
+        if self._thread is not None and self._thread is not threading.current_thread( ):
+            self._thread.join( )
+
+        self._thread = None
+
+        if self._descriptor != -1:
+            os.close( self._descriptor )
+            self._descriptor = -1
+
+        self._watches.clear( )
+        self._pending.clear( )
+
+    # endregion
+
+    # region : inotify
+
+    def __setup_inotify( self ) -> bool:
+        """
+        Try to create inotify watches for all the folders.
+
+        Receive: None
+
+        Returns:
+        - bool: True if inotify can be used
+        """
+
+        if not sys.platform.startswith( "linux" ):
+            return False
+
+        try:
+            self._libc = ctypes.CDLL( ctypes.util.find_library( "c" ), use_errno=True )
+
+            self._descriptor = self._libc.inotify_init1( os.O_NONBLOCK | os.O_CLOEXEC )
+            if self._descriptor < 0:
+                raise OSError( ctypes.get_errno( ), "inotify_init1 failed" )
+
+            for path in self._paths:
+                self.__add_watch_tree( path )
+
+            return True
+
+        except Exception as e:
+            c_debug.log_error( f"Failed to use inotify, using polling instead. { e }" )
+
+            if self._descriptor >= 0:
+                os.close( self._descriptor )
+
+            self._descriptor = -1
+            self._watches.clear( )
+
+            return False
+
+
+    def __add_watch_tree( self, path: str, strict: bool = True ):
+        """
+        Watch a folder and all its sub folders.
+
+        Receive:
+        - path (str): Folder path
+        - strict (bool, optional): Raise on the first folder that cannot be watched, instead of logging it
+
+        Returns: None
+        """
+
+        for folder, _, _ in os.walk( path ):
+            watch = self._libc.inotify_add_watch( self._descriptor, os.fsencode( folder ), IN_WATCH_MASK )
+
+            if watch >= 0:
+                self._watches[ watch ] = folder
+                continue
+
+            error = OSError( ctypes.get_errno( ), f"Failed to watch { folder }" )
+            if strict:
+                raise error
+
+            # Removed already, no permissions or no watches left. Changes in it are missed
+            c_debug.log_error( str( error ) )
+
+
+    @safe_call( c_debug.log_error )
+    def __process_inotify( self ):
+        """
+        Read inotify events until stopped.
+
+        Receive: None
+
+        Returns: None
+        """
+
+        header_size: int = struct.calcsize( IN_EVENT_HEADER )
+
+        while not self._stop.is_set( ):
+            ready, _, _ = select.select( [ self._descriptor ], [ ], [ ], WATCH_DEBOUNCE )
+
+            if ready:
+                data:       bytes   = os.read( self._descriptor, 65536 )
+                position:   int     = 0
+
+                while position < len( data ):
+                    watch, mask, cookie, length = struct.unpack_from( IN_EVENT_HEADER, data, position )
+                    position += header_size
+
+                    name: str = os.fsdecode( data[ position:position + length ].rstrip( b"\0" ) )
+                    position += length
+
+                    self.__handle_inotify_event( watch, mask, name )
+
+            self.__report( )
+
+
+    def __handle_inotify_event( self, watch: int, mask: int, name: str ):
+        """
+        Handle a single inotify event.
+
+        Receive:
+        - watch (int): Watch descriptor
+        - mask (int): Event flags
+        - name (str): Name of the changed entry
+
+        Returns: None
+        """
+
+        if mask & IN_Q_OVERFLOW:
+            # Events were lost. Nothing to do but report everything
+            for path in self._paths:
+                for folder, _, files in os.walk( path ):
+                    self.__collect( [ os.path.join( folder, file ) for file in files ] )
+
+            return
+
+        folder: str = self._watches.get( watch )
+        if folder is None:
+            return
+
+        if mask & IN_IGNORED:
+            # The folder was removed
+            del self._watches[ watch ]
+            return
+
+        path: str = os.path.join( folder, name )
+
+        if mask & IN_ISDIR:
+            if mask & ( IN_CREATE | IN_MOVED_TO ) and os.path.isdir( path ):
+                self.__add_watch_tree( path, False )
+
+                # Files can be created before the watch was added
+                for sub_folder, _, files in os.walk( path ):
+                    self.__collect( [ os.path.join( sub_folder, file ) for file in files ] )
+
+            return
+
+        self.__collect( [ path ] )
+
+    # endregion
+
+    # region : Polling
+
+    @safe_call( c_debug.log_error )
+    def __process_polling( self ):
+        """
+        Compare files modification times until stopped.
+
+        Receive: None
+
+        Returns: None
+        """
+
+        next_scan: float = time.monotonic( ) + WATCH_POLL_TIME
+
+        while not self._stop.wait( min( WATCH_DEBOUNCE, WATCH_POLL_TIME ) ):
+
+            if time.monotonic( ) >= next_scan:
+                snapshot: dict = self.__scan( )
+
+                changed: list = [ path for path, information in snapshot.items( ) if self._snapshot.get( path ) != information ]
+                removed: list = [ path for path in self._snapshot if path not in snapshot ]
+
+                self._snapshot = snapshot
+                self.__collect( changed + removed )
+
+                next_scan = time.monotonic( ) + WATCH_POLL_TIME
+
+            self.__report( )
+
+
+    def __scan( self ) -> dict:
+        """
+        Read size and modification time of every file.
+
+        Receive: None
+
+        Returns:
+        - dict: Path -> ( size, mtime )
+        """
+
+        result: dict = { }
+
+        for path in self._paths:
+            for folder, _, files in os.walk( path ):
+                for file in files:
+                    full_path: str = os.path.join( folder, file )
+
+                    try:
+                        stat = os.stat( full_path )
+                    except OSError:
+                        continue
+
+                    result[ full_path ] = ( stat.st_size, stat.st_mtime_ns )
+
+        return result
+
+    # endregion
+
+    # region : Utilities
+
+    def __collect( self, paths: list ):
+        """
+        Add changed paths to the pending changes.
+
+        Receive:
+        - paths (list): Changed files paths
+
+        Returns: None
+        """
+
+        if len( paths ) == 0:
+            return
+
+        self._pending.update( paths )
+        self._last_change = time.monotonic( )
+
+
+    def __report( self ):
+        """
+        Report the pending changes, if nothing changed for a while.
+
+        Receive: None
+
+        Returns: None
+        """
+
+        if len( self._pending ) == 0:
+            return
+
+        if time.monotonic( ) - self._last_change < WATCH_DEBOUNCE:
+            return
+
+        paths: list = sorted( self._pending )
+        self._pending.clear( )
+
+        safe_call( c_debug.log_error )( self._callback )( paths )
+
+
+    def __remove_nested( self, paths: list ) -> list:
+        """
+        Remove folders that are already inside another watched folder.
+
+        Receive:
+        - paths (list): Folders paths
+
+        Returns:
+        - list: Folders without duplicates
+        """
+
+        result:     list = [ ]
+        absolutes:  list = [ os.path.abspath( path ) for path in paths if os.path.isdir( path ) ]
+
+        for path in absolutes:
+            is_nested: bool = any( other != path and path.startswith( other + os.sep ) for other in absolutes )
+
+            if not is_nested and path not in result:
+                result.append( path )
+
+        return result
+
+    # endregion